@@ -240,7 +240,7 @@ def _maybe_refresh_prices_on_start():
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT MAX(as_of) FROM Stock_Prices")
+        cursor.execute("SELECT MAX(as_of) FROM Latest_Stock_Prices")
         row = cursor.fetchone()
         last_ts = row[0] if row else None
 
@@ -267,7 +267,12 @@ def _maybe_refresh_prices_on_start():
         logger.warning(f"Startup price refresh failed: {e}")
 
 def initialize_services():
-    """Initialize all background services"""
+    """Initialize all background services
+
+    Every process gets the DB pool; ingestion and the schedulers run only in
+    the elected leader (see services/leader_election.py), so raising the
+    gunicorn worker count does not multiply Upstox calls or DB writes.
+    """
     services_started = []
     services_failed = []
     
@@ -281,6 +286,39 @@ def initialize_services():
         services_failed.append(("Database Pool", str(e)))
         logger.error(f"✗ Failed to initialize DB pool: {e}")
 
+    try:
+        from services.leader_election import get_leader_elector
+        if get_leader_elector().start(on_elected=_start_leader_services):
+            services_started.append("Leader Services")
+        else:
+            logger.info("Follower process: schedulers run in the leader; will take over if it exits")
+    except Exception as e:
+        services_failed.append(("Leader Election", str(e)))
+        logger.error(f"✗ Leader election failed: {e}")
+
+    # Log summary
+    logger.info(f"Services started: {len(services_started)}/{len(services_started) + len(services_failed)}")
+    if services_failed:
+        logger.warning(f"Failed services: {[name for name, _ in services_failed]}")
+    
+    return services_started, services_failed
+
+
+def _start_leader_services():
+    """Ingestion and schedulers; runs once, in the leader process only."""
+    services_started = []
+    services_failed = []
+
+    # Load the last persisted LTPs up front so the first sweep does not pay for it
+    try:
+        from controller.fetch.stock_prices_fetch.latest_prices import seed_last_written_ltp
+        count = seed_last_written_ltp()
+        services_started.append("Last LTP Seed")
+        logger.info(f"✓ Last written LTPs seeded ({count} stocks)")
+    except Exception as e:
+        services_failed.append(("Last LTP Seed", str(e)))
+        logger.warning(f"⚠ Last written LTP seed skipped (first sweep will seed it): {e}")
+
     # Optional: refresh stale prices on boot so Render restarts don't leave stale DB data
     try:
         _maybe_refresh_prices_on_start()
@@ -328,13 +366,10 @@ def initialize_services():
     except Exception as e:
         services_failed.append(("EOD Scheduler", str(e)))
         logger.warning(f"⚠ EOD candle scheduler not started: {e}")
-    
-    # Log summary
-    logger.info(f"Services started: {len(services_started)}/{len(services_started) + len(services_failed)}")
+
+    logger.info(f"Leader services started: {len(services_started)}/{len(services_started) + len(services_failed)}")
     if services_failed:
-        logger.warning(f"Failed services: {[name for name, _ in services_failed]}")
-    
-    return services_started, services_failed
+        logger.warning(f"Failed leader services: {[name for name, _ in services_failed]}")
 
 if __name__ == '__main__':
     # 1. Initialize background services
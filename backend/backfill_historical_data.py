@@ -13,6 +13,8 @@ from db_pool import get_connection
 from dotenv import load_dotenv
 from utils.pretty_log import console, status_ok, status_err, status_warn
 from services.http_client import upstox_get
+from services.candle_cache import get_candle_cache
+from services.candle_rollups import upsert_rollups
 import time
 
 load_dotenv()
@@ -134,7 +136,9 @@ def backfill_historical_data(days_back=365):
                           close_price=VALUES(close_price),
                           volume=VALUES(volume)
                     """, insert_rows)
+                    upsert_rollups(conn, {stock_id: [r[2] for r in insert_rows]})
                     conn.commit()
+                    get_candle_cache().apply_daily(stock_id, [r[2:] for r in insert_rows])
                     
                     total_inserted += len(insert_rows)
                     processed += 1
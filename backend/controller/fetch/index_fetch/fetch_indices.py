@@ -1,7 +1,5 @@
 import requests
 import json
-import gzip
-import io
 from datetime import datetime
 from db_pool import get_connection
 import os
@@ -9,6 +7,7 @@ import time
 from dotenv import load_dotenv
 from utils.pretty_log import console, banner, status_ok, status_warn, status_err, rule, updates_table
 from services.http_client import upstox_get
+from services.instrument_master import get_index_instruments
 
 # Ensure .env is loaded so we can use user's real environment variables
 load_dotenv()
@@ -61,14 +60,8 @@ INDEX_MAPPING = {
 _INDEX_KEYS_RESOLVED = False
 
 def _download_bod_instruments():
-    """Download the BOD instruments JSON (gz) from Upstox assets."""
-    import certifi
-    url = "https://assets.upstox.com/market-quote/instruments/exchange/complete.json.gz"
-    resp = requests.get(url, timeout=15, verify=certifi.where())
-    resp.raise_for_status()
-    with gzip.GzipFile(fileobj=io.BytesIO(resp.content)) as gz_file:
-        instruments = json.loads(gz_file.read().decode("utf-8"))
-    return instruments
+    """BOD index instruments (*_INDEX rows of complete.json.gz) via the shared, day-cached instrument master."""
+    return [inst._asdict() for inst in get_index_instruments().instruments]
 
 def _resolve_index_instrument_keys():
     """Resolve instrument_key for indices based on BOD instruments list."""
@@ -1,253 +1,159 @@
 import requests
-import certifi
-import gzip
-import io
 import json
-from datetime import datetime
-from db_pool import get_connection
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from utils.pretty_log import banner, status_ok, status_warn, status_err
+from services.http_client import upstox_get as upstox_rest_get
+from services.price_pipeline import RawBatch, get_price_pipeline
+from services.instrument_master import get_nse_index
+from services.stock_registry import get_stock_registry
 
 load_dotenv()
 
 UPSTOX_TOKEN = os.getenv('UPSTOX_TOKEN')
-BATCH_SIZE = 100
-
-def upstox_get(url, **kwargs):
-    """Wrapper for requests.get with SSL verification"""
-    return requests.get(url, verify=certifi.where(), **kwargs)
+# Instruments per /market-quote/quotes call (Upstox accepts up to 500)
+BATCH_SIZE = int(os.getenv("STOCK_FETCH_BATCH_SIZE", "100"))
+# Batches in flight at once; request rate is bounded separately by the shared
+# token bucket in services/http_client.py (UPSTOX_MAX_RPS)
+FETCH_CONCURRENCY = max(1, int(os.getenv("STOCK_FETCH_CONCURRENCY", "4")))
+QUOTES_URL = "https://api.upstox.com/v2/market-quote/quotes"
+# How long an EOD (save_to_db) sweep waits for the persist stage to drain
+PERSIST_WAIT_SECONDS = float(os.getenv("PRICE_PIPELINE_PERSIST_WAIT", "60"))
 
 def get_all_nse_instruments():
-    """Fetch and parse NSE instrument data from Upstox"""
-    url = "https://assets.upstox.com/market-quote/instruments/exchange/NSE.csv.gz"
+    """NSE instrument_key -> trading symbol map from the shared instrument master.
+
+    The NSE.csv.gz download is revalidated at most once per day (see
+    services/instrument_master.py), so calling this every tick is cheap.
+    """
     try:
-        response = upstox_get(url)
-        response.raise_for_status()
-        
-        with gzip.open(io.BytesIO(response.content), 'rt') as f:
-            lines = f.readlines()
-        
-        ik_to_symbol = {}
-        for line in lines[1:]:  # Skip header
-            parts = line.strip().split(',')
-            if len(parts) >= 3:
-                instrument_key = parts[0]
-                symbol = parts[2]
-                ik_to_symbol[instrument_key] = symbol
-        
-        return ik_to_symbol
+        # Shared read-only map; rebuilt (not mutated) when the file changes
+        return get_nse_index().symbol_by_key
     except Exception as e:
         status_err(f"Failed to fetch NSE instruments: {e}")
         return {}
 
-try:
-    # Optional: broadcast live updates if socket server is initialized
-    from services.websocket_manager import broadcast_prices
-except ImportError:
-    broadcast_prices = None
+
+def _fetch_batch(batch_no, batch, ik_to_symbol, headers, save_to_db):
+    """Fetch one batch of quotes and hand the raw payload to the price pipeline.
+
+    Runs on a worker thread. Parsing, caching, broadcasting and persistence
+    happen in services/price_pipeline.py, so the next Upstox call is never
+    waiting on the DB or the socket fan-out. Returns True if a batch was queued.
+    """
+    instrument_keys = [f"NSE_EQ|{stock['isin']}" for stock in batch]
+    symbols = [ik_to_symbol[ik] for ik in instrument_keys]
+    batch_iks_str = ",".join(instrument_keys)  # Let requests handle encoding
+    stock_ids = [stock['stock_id'] for stock in batch]
+
+    try:
+        # Use /quotes endpoint for batch OHLC data (rate limited + retried)
+        resp = upstox_rest_get(QUOTES_URL, params={"instrument_key": batch_iks_str}, headers=headers)
+        json_data = resp.json()
+
+        if json_data.get("status") != "success":
+            status_warn(f"API error for batch {batch_no}: {json_data}")
+            return False
+
+        data = json_data.get('data', {})
+        # Debug
+        status_ok(f"Batch {batch_no}: {len(instrument_keys)} requested, {len(data)} returned")
+
+        if not data:
+            status_warn(f"No data for batch {batch_no}")
+            return False
+
+        # Log sample response for first batch (debug only)
+        if batch_no == 1:
+            sample_response_key = list(data.keys())[0]
+            sample_quote = data[sample_response_key]
+            print(f"[SAMPLE] Response structure for {sample_response_key}:")
+            print(json.dumps(sample_quote, indent=2, default=str))
+
+        get_price_pipeline().submit(RawBatch(batch_no, stock_ids, symbols, data, save_to_db))
+        return True
+
+    except requests.HTTPError as http_err:
+        status_err(f"HTTP error for batch {batch_no}: {http_err}")
+    except Exception as e:
+        status_err(f"Batch error {batch_no}: {e}")
+        import traceback
+        traceback.print_exc()
+    return False
+
 
 def fetch_all_stock_prices(save_to_db=True):
-    """Fetch stock prices from Upstox API and optionally save to database"""
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+    """Fetch stock prices from Upstox API and optionally save to database
 
+    Batches of BATCH_SIZE instruments are fetched FETCH_CONCURRENCY at a time;
+    the shared Upstox token bucket keeps the overall request rate in check, so
+    a full sweep fits inside the 10s tick instead of sleeping between batches.
+    """
     try:
         # Step 1: Get NSE EQ instrument key to symbol mapping
         ik_to_symbol = get_all_nse_instruments()
 
-        # Step 2: Get NSE stocks from DB, filter to valid EQ only
-        cursor.execute("SELECT stock_id, isin, company_name FROM Stocks WHERE exchange='NSE'")
-        all_stocks = cursor.fetchall()
-
-        # Filter to only valid EQ (build instrument_key and check dict)
-        valid_stocks = [
-            stock for stock in all_stocks
-            if f"NSE_EQ|{stock['isin']}" in ik_to_symbol
+        # Step 2: NSE stocks from the in-memory Stocks registry (no per-tick query)
+        all_stocks = [
+            {"stock_id": ref.stock_id, "isin": ref.isin, "company_name": ref.company_name}
+            for ref in get_stock_registry().all(exchange="NSE")
         ]
-
-        if not valid_stocks:
-            status_warn("No valid NSE EQ stocks found in DB")
-            return
-
-        status_ok(f"Filtered to {len(valid_stocks)} valid NSE EQ stocks from DB")
-
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "Authorization": f"Bearer {UPSTOX_TOKEN}"
-        }
-
-        total_inserted = 0
-        first_batch = True  # For sample logging
-        # Step 3: Batch the valid stocks
-        for i in range(0, len(valid_stocks), BATCH_SIZE):
-            batch = valid_stocks[i:i + BATCH_SIZE]
-            instrument_keys = [f"NSE_EQ|{stock['isin']}" for stock in batch]
-            symbols = [ik_to_symbol[ik] for ik in instrument_keys]
-            batch_iks_str = ",".join(instrument_keys)  # Let requests handle encoding
-            stock_ids = [stock['stock_id'] for stock in batch]
-
-            try:
-                # Use /quotes endpoint for batch OHLC data
-                url = "https://api.upstox.com/v2/market-quote/quotes"
-                resp = upstox_get(url, params={"instrument_key": batch_iks_str}, headers=headers)
-                resp.raise_for_status()
-                json_data = resp.json()
-
-                if json_data.get("status") != "success":
-                    status_warn(f"API error for batch {i//BATCH_SIZE + 1}: {json_data}")
-                    continue
-
-                data = json_data.get('data', {})
-                # Debug
-                status_ok(f"Batch {i//BATCH_SIZE + 1}: {len(instrument_keys)} requested, {len(data)} returned")
-
-                if not data:
-                    status_warn(f"No data for batch {i//BATCH_SIZE + 1}")
-                    continue
-
-                # Log sample response for first batch (debug only)
-                if first_batch:
-                    sample_response_key = list(data.keys())[0]
-                    sample_quote = data[sample_response_key]
-                    print(f"[SAMPLE] Response structure for {sample_response_key}:")
-                    print(json.dumps(sample_quote, indent=2, default=str))
-                    first_batch = False
-
-                insert_data = []
-                updates_for_ws = []
-                skipped_count = 0
-                unchanged_count = 0
-                for idx, ik in enumerate(instrument_keys):
-                    response_key = f"NSE_EQ:{symbols[idx]}"
-                    if response_key not in data:
-                        skipped_count += 1
-                        continue
-
-                    stock_quote = data[response_key]
-                    ohlc = stock_quote.get('ohlc', {})
-
-                    # Better fallback chain for closed/non-trading days
-                    ltp = float(stock_quote.get('last_price', 0))
-                    if ltp <= 0:
-                        ltp = float(stock_quote.get('previous_close', 0))
-                    if ltp <= 0:
-                        ltp = float(ohlc.get('close', 0))
-
-                    net_change = float(stock_quote.get('net_change', 0))
-                    prev_close = float(stock_quote.get('previous_close', 0)) or (ltp - net_change)
-
-                    # Skip if still no valid price
-                    if ltp <= 0:
-                        skipped_count += 1
-                        continue
-
-                    # Check for duplicate: Query last LTP for this stock_id
-                    cursor.execute(
-                        "SELECT ltp FROM Stock_Prices WHERE stock_id = %s ORDER BY as_of DESC LIMIT 1",
-                        (stock_ids[idx],)
-                    )
-                    last_record = cursor.fetchone()
-                    if last_record and float(last_record['ltp']) == ltp:
-                        unchanged_count += 1
-                        print(f"[⏭️] Skipped unchanged LTP for stock_id={stock_ids[idx]} ({ltp})")
-                        continue
-
-                    price_data = {
-                        'ltp': ltp,
-                        'day_high': float(ohlc.get('high', ltp)),
-                        'day_low': float(ohlc.get('low', ltp)),
-                        'day_open': float(ohlc.get('open', ltp)),
-                        'prev_close': prev_close,
-                        'as_of': datetime.now()
-                    }
-
-                    insert_data.append((
-                        stock_ids[idx],
-                        price_data['ltp'],
-                        price_data['day_high'],
-                        price_data['day_low'],
-                        price_data['day_open'],
-                        price_data['prev_close'],
-                        price_data['as_of']
-                    ))
-                    updates_for_ws.append({
-                        "symbol": symbols[idx].upper(),  # Uppercase for consistency with DB symbols
-                        "stock_id": stock_ids[idx],  # Add stock_id for cache
-                        "ltp": price_data['ltp'],
-                        "day_open": price_data['day_open'],
-                        "prev_close": price_data['prev_close'],
-                        "as_of": price_data['as_of'].isoformat(),
-                    })
-
-                batch_inserted = len(insert_data)
-                
-                # Update live price cache (for order execution)
-                if updates_for_ws:
-                    try:
-                        from services.live_price_cache import update_price_cache_batch
-                        update_price_cache_batch(updates_for_ws)
-                    except Exception as cache_err:
-                        print(f"[WARN] Failed to update price cache: {cache_err}")
-                
-                # Save to database only if save_to_db=True (EOD window)
-                if save_to_db and insert_data:
-                    cursor.executemany(
-                        """
-                        INSERT INTO Stock_Prices (stock_id, ltp, day_high, day_low, day_open, prev_close, as_of)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        ON DUPLICATE KEY UPDATE
-                          ltp = VALUES(ltp),
-                          day_high = VALUES(day_high),
-                          day_low = VALUES(day_low),
-                          day_open = VALUES(day_open),
-                          prev_close = VALUES(prev_close),
-                          as_of = VALUES(as_of)
-                        """,
-                        insert_data,
-                    )
-                    conn.commit()
-                    success_rate = (batch_inserted / len(batch)) * 100
-                    status_ok(f"💾 DB: Inserted {batch_inserted}/{len(batch)} prices ({success_rate:.1f}%) for batch {i//BATCH_SIZE + 1}")
-                    total_inserted += batch_inserted
-                
-                # Always broadcast to WebSocket (live updates during market hours)
-                if broadcast_prices and updates_for_ws:
-                    try:
-                        broadcast_prices(updates_for_ws)
-                        if not save_to_db:
-                            # During market hours - only WebSocket broadcast
-                            status_ok(f"📡 WebSocket: Broadcasted {len(updates_for_ws)} live prices for batch {i//BATCH_SIZE + 1}")
-                    except Exception:
-                        pass
-                
-                if not save_to_db and not insert_data:
-                    status_warn(f"No valid data in batch {i//BATCH_SIZE + 1}")
-
-                # Small delay between batches
-                time.sleep(1)
-
-            except requests.HTTPError as http_err:
-                status_err(f"HTTP error for batch {i//BATCH_SIZE + 1}: {http_err}")
-            except Exception as e:
-                status_err(f"Batch error {i//BATCH_SIZE + 1}: {e}")
-                import traceback
-                traceback.print_exc()
-
-        status_ok(f"Full fetch complete: {total_inserted} total prices inserted from {len(valid_stocks)} valid stocks")
-
     except Exception as e:
         status_err(f"DB Error: {e}")
         import traceback
         traceback.print_exc()
-    finally:
-        cursor.close()
-        conn.close()
+        return
+
+    # Filter to only valid EQ (build instrument_key and check dict)
+    valid_stocks = [
+        stock for stock in all_stocks
+        if f"NSE_EQ|{stock['isin']}" in ik_to_symbol
+    ]
+
+    if not valid_stocks:
+        status_warn("No valid NSE EQ stocks found in DB")
+        return
+
+    status_ok(f"Filtered to {len(valid_stocks)} valid NSE EQ stocks from DB")
+
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+        "Authorization": f"Bearer {UPSTOX_TOKEN}"
+    }
+
+    # Step 3: Batch the valid stocks and fetch with bounded concurrency
+    batches = [
+        (n, valid_stocks[i:i + BATCH_SIZE])
+        for n, i in enumerate(range(0, len(valid_stocks), BATCH_SIZE), start=1)
+    ]
+    pipeline = get_price_pipeline()
+    persisted_before = pipeline.rows_persisted
+    t0 = time.perf_counter()
+    if FETCH_CONCURRENCY == 1:
+        results = [_fetch_batch(n, b, ik_to_symbol, headers, save_to_db) for n, b in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY, thread_name_prefix="StockFetch") as pool:
+            results = list(pool.map(
+                lambda nb: _fetch_batch(nb[0], nb[1], ik_to_symbol, headers, save_to_db),
+                batches,
+            ))
+    queued = sum(1 for ok in results if ok)
+
+    # EOD saves must be on disk before the caller moves on (e.g. to candles)
+    if save_to_db and not pipeline.wait_persisted(timeout=PERSIST_WAIT_SECONDS):
+        status_warn(f"Price pipeline still persisting after {PERSIST_WAIT_SECONDS}s; continuing")
+    total_inserted = pipeline.rows_persisted - persisted_before
+
+    status_ok(
+        f"Full fetch complete: {queued}/{len(batches)} batches queued, {total_inserted} total prices inserted "
+        f"from {len(valid_stocks)} valid stocks "
+        f"({len(batches)} batches in {time.perf_counter() - t0:.1f}s, concurrency={FETCH_CONCURRENCY})"
+    )
 
 
 if __name__ == "__main__":
     # Repeat every 2 minutes (120 seconds)
     fetch_all_stock_prices()
-    
\ No newline at end of file
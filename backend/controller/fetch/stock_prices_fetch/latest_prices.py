@@ -0,0 +1,203 @@
+"""
+Latest_Stock_Prices snapshot maintenance.
+
+Latest_Stock_Prices keeps exactly one row per stock_id with the most recent
+Stock_Prices values, so read paths (movers, search, detail, sentiment) can join
+it directly instead of scanning Stock_Prices with a MAX(as_of) GROUP BY.
+persist_price_rows writes both tables in one transaction.
+"""
+import threading
+from typing import Dict, Iterable, Optional, Sequence
+
+from db_pool import get_connection
+
+INSERT_STOCK_PRICES_SQL = """
+    INSERT INTO Stock_Prices (stock_id, ltp, day_high, day_low, day_open, prev_close, as_of)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+      ltp = VALUES(ltp),
+      day_high = VALUES(day_high),
+      day_low = VALUES(day_low),
+      day_open = VALUES(day_open),
+      prev_close = VALUES(prev_close),
+      as_of = VALUES(as_of)
+"""
+
+# Row layout shared with the Stock_Prices insert in fetch_all_stock_prices:
+# (stock_id, ltp, day_high, day_low, day_open, prev_close, as_of)
+# Older rows never overwrite newer ones; as_of must be assigned last because
+# MySQL evaluates ON DUPLICATE KEY assignments left to right.
+UPSERT_LATEST_PRICES_SQL = """
+    INSERT INTO Latest_Stock_Prices (stock_id, ltp, day_high, day_low, day_open, prev_close, as_of)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+      ltp = IF(VALUES(as_of) >= as_of, VALUES(ltp), ltp),
+      day_high = IF(VALUES(as_of) >= as_of, VALUES(day_high), day_high),
+      day_low = IF(VALUES(as_of) >= as_of, VALUES(day_low), day_low),
+      day_open = IF(VALUES(as_of) >= as_of, VALUES(day_open), day_open),
+      prev_close = IF(VALUES(as_of) >= as_of, VALUES(prev_close), prev_close),
+      as_of = GREATEST(as_of, VALUES(as_of))
+"""
+
+# One-off rebuild from history (used by the migration and the backfill script)
+BACKFILL_LATEST_PRICES_SQL = """
+    INSERT INTO Latest_Stock_Prices (stock_id, ltp, day_high, day_low, day_open, prev_close, as_of)
+    SELECT sp.stock_id, sp.ltp, sp.day_high, sp.day_low, sp.day_open, sp.prev_close, sp.as_of
+    FROM Stock_Prices sp
+    INNER JOIN (
+        SELECT stock_id, MAX(as_of) AS max_as_of
+        FROM Stock_Prices
+        GROUP BY stock_id
+    ) latest
+      ON latest.stock_id = sp.stock_id AND latest.max_as_of = sp.as_of
+    ON DUPLICATE KEY UPDATE
+      ltp = VALUES(ltp),
+      day_high = VALUES(day_high),
+      day_low = VALUES(day_low),
+      day_open = VALUES(day_open),
+      prev_close = VALUES(prev_close),
+      as_of = VALUES(as_of)
+"""
+
+
+def upsert_latest_prices(cursor, rows: Iterable[Sequence]) -> None:
+    """Upsert price rows into Latest_Stock_Prices using an open cursor.
+
+    The caller owns the transaction and commits together with its
+    Stock_Prices insert so both tables move in lockstep.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    cursor.executemany(UPSERT_LATEST_PRICES_SQL, rows)
+
+
+def persist_price_rows(rows: Sequence[Sequence]) -> int:
+    """Insert price rows into Stock_Prices and Latest_Stock_Prices, then commit.
+
+    rows: (stock_id, ltp, day_high, day_low, day_open, prev_close, as_of).
+    Returns the number of rows written and records them in last_written_ltp.
+    """
+    if not rows:
+        return 0
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(INSERT_STOCK_PRICES_SQL, rows)
+        upsert_latest_prices(cursor, rows)
+        conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    last_written_ltp.record(rows)
+    return len(rows)
+
+
+def backfill_latest_prices(conn) -> int:
+    """Rebuild Latest_Stock_Prices from Stock_Prices. Returns affected row count."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(BACKFILL_LATEST_PRICES_SQL)
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+class LastWrittenLtp:
+    """
+    In-process map of the last LTP persisted per stock_id.
+
+    Replaces the per-instrument "SELECT ltp ... ORDER BY as_of DESC LIMIT 1"
+    that fetch_all_stock_prices used to skip unchanged prices. Seeded once with
+    a single bulk read of Latest_Stock_Prices at leader startup
+    (seed_last_written_ltp), or on the first lookup if that did not happen;
+    stock_ids not covered by the seed are resolved with one IN (...) query per
+    batch and then remembered (including "no row yet") so they are not
+    queried again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ltp: Dict[int, Optional[float]] = {}
+        self._seeded = False
+
+    def seed(self, cursor) -> int:
+        cursor.execute("SELECT stock_id, ltp FROM Latest_Stock_Prices")
+        rows = cursor.fetchall()
+        with self._lock:
+            for row in rows:
+                stock_id, ltp = (row["stock_id"], row["ltp"]) if isinstance(row, dict) else row
+                self._ltp[stock_id] = float(ltp) if ltp is not None else None
+            self._seeded = True
+        return len(rows)
+
+    def lookup(self, stock_ids: Sequence[int], cursor=None) -> Dict[int, Optional[float]]:
+        """Return {stock_id: last persisted ltp or None} for the given ids.
+
+        A pooled connection is only opened when the DB actually has to be hit
+        (first call, or ids not seen before) and no cursor was passed in.
+        """
+        with self._lock:
+            missing = [sid for sid in stock_ids if sid not in self._ltp]
+        if self._seeded and not missing:
+            with self._lock:
+                return {sid: self._ltp.get(sid) for sid in stock_ids}
+        if cursor is None:
+            conn = get_connection()
+            own_cursor = conn.cursor()
+            try:
+                return self.lookup(stock_ids, own_cursor)
+            finally:
+                own_cursor.close()
+                conn.close()
+        if not self._seeded:
+            self.seed(cursor)
+            with self._lock:
+                missing = [sid for sid in stock_ids if sid not in self._ltp]
+        if missing:
+            placeholders = ",".join(["%s"] * len(missing))
+            cursor.execute(
+                f"SELECT stock_id, ltp FROM Latest_Stock_Prices WHERE stock_id IN ({placeholders})",
+                tuple(missing),
+            )
+            found = {}
+            for row in cursor.fetchall():
+                stock_id, ltp = (row["stock_id"], row["ltp"]) if isinstance(row, dict) else row
+                found[stock_id] = float(ltp) if ltp is not None else None
+            with self._lock:
+                for sid in missing:
+                    self._ltp[sid] = found.get(sid)
+        with self._lock:
+            return {sid: self._ltp.get(sid) for sid in stock_ids}
+
+    def record(self, rows: Iterable[Sequence]) -> None:
+        """Remember LTPs after a successful commit. rows: (stock_id, ltp, ...)."""
+        with self._lock:
+            for row in rows:
+                self._ltp[row[0]] = float(row[1])
+
+    def reset(self) -> None:
+        with self._lock:
+            self._ltp.clear()
+            self._seeded = False
+
+
+last_written_ltp = LastWrittenLtp()
+
+
+def seed_last_written_ltp() -> int:
+    """Seed last_written_ltp before the first price sweep. Returns rows loaded."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        return last_written_ltp.seed(cursor)
+    finally:
+        cursor.close()
+        conn.close()
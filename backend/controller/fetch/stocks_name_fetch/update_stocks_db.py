@@ -3,6 +3,7 @@ import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
 from db_pool import get_connection
+from services.stock_registry import bump_stocks_version
 
 def update_stocks_table(instruments):
     if not instruments:
@@ -36,6 +37,8 @@ def update_stocks_table(instruments):
         # Execute batch insert/update
         cursor.executemany(query, values)
         conn.commit()
+        # Symbol/company/ISIN lookups reload from the updated table
+        bump_stocks_version()
 
         # MySQL doesn’t give exact inserted vs updated count easily
         print(f"[DB-UPDATER] Processed {len(instruments)} instruments.")
@@ -11,6 +11,7 @@ import logging
 from typing import Optional, Dict, Tuple, Any
 from decimal import Decimal, InvalidOperation
 from db_pool import get_db_connection
+from services.stock_registry import get_stock_registry
 from datetime import datetime
 from threading import Lock
 
@@ -63,7 +64,7 @@ def _set_cached_price(isin: str, price: float):
 
 def get_stock_info(stock_name: str) -> Optional[Dict[str, Any]]:
     """
-    Fetch stock information from database by company name.
+    Fetch stock information by company name from the in-memory Stocks registry.
     
     Args:
         stock_name: Company name to look up
@@ -75,22 +76,16 @@ def get_stock_info(stock_name: str) -> Optional[Dict[str, Any]]:
     logger.debug(f"Fetching stock info for: {stock_name}")
     
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute(
-                "SELECT stock_id, isin FROM Stocks WHERE company_name = %s", 
-                (stock_name,)
-            )
-            stock = cursor.fetchone()
-            cursor.close()
-            
-            elapsed = time.time() - start_time
-            if stock:
-                logger.debug(f"Stock info fetched: {stock} (took {elapsed:.3f}s)")
-            else:
-                logger.warning(f"Stock '{stock_name}' not found in database")
-            
-            return stock
+        ref = get_stock_registry().by_company_name(stock_name)
+        stock = {"stock_id": ref.stock_id, "isin": ref.isin} if ref is not None else None
+
+        elapsed = time.time() - start_time
+        if stock:
+            logger.debug(f"Stock info fetched: {stock} (took {elapsed:.3f}s)")
+        else:
+            logger.warning(f"Stock '{stock_name}' not found in database")
+
+        return stock
     except Exception as e:
         logger.error(f"Error fetching stock info for '{stock_name}': {e}")
         return None
@@ -179,7 +174,8 @@ def get_live_price(isin: str, stock_id: int = None) -> Optional[float]:
                     )
                     return ws_price
                 else:
-                    logger.debug(f"WebSocket price too old ({age:.1f}s), falling back to API")
+                    age_text = f"{age:.1f}s" if age is not None else "unknown age"
+                    logger.debug(f"WebSocket price too old ({age_text}), falling back to API")
         except Exception as e:
             logger.warning(f"WebSocket cache lookup failed for stock_id {stock_id}: {e}")
 
@@ -9,7 +9,7 @@ logger = logging.getLogger(__name__)
 
 def get_user_watchlists(user_id: int) -> Dict[str, Any]:
     """
-    Fetch all watchlists for a given user_id, including individual stock names and their current prices from Stock_Prices.
+    Fetch all watchlists for a given user_id, including individual stock names and their current prices from Latest_Stock_Prices.
     
     Args:
         user_id (int): The ID of the user.
@@ -49,7 +49,7 @@ def get_user_watchlists(user_id: int) -> Dict[str, Any]:
             FROM Watchlist w
             INNER JOIN Watchlist_Stocks ws ON w.watchlist_id = ws.watchlist_id
             INNER JOIN Stocks s ON ws.stock_id = s.stock_id
-            LEFT JOIN Stock_Prices sp ON s.stock_id = sp.stock_id  -- LEFT JOIN to include stocks without price
+            LEFT JOIN Latest_Stock_Prices sp ON s.stock_id = sp.stock_id  -- LEFT JOIN to include stocks without price
             WHERE w.user_id = %s
             ORDER BY w.name, s.company_name
         """
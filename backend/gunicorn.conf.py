@@ -20,9 +20,10 @@ backlog = 2048
 
 # Worker processes
 # Free tier: Use 1 worker to stay within memory limits
-# For paid tier: Uncomment the multiprocessing line
-workers = 1
-# workers = multiprocessing.cpu_count() * 2 + 1
+# For paid tier: raise WEB_CONCURRENCY (e.g. multiprocessing.cpu_count() * 2 + 1).
+# Only the elected leader runs schedulers (LEADER_ELECTION); set
+# SOCKETIO_MESSAGE_QUEUE so every worker receives live price ticks.
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
 
 # Use gevent for async WebSocket support
 worker_class = "gevent"
@@ -79,7 +80,11 @@ def worker_exit(server, worker):
 
 
 def post_worker_init(worker):
-    """Start schedulers once when the first worker is ready."""
+    """Initialize services in each worker; schedulers start only in the elected leader.
+
+    Runs after fork, so every worker competes for the leader lock itself
+    (a lock taken in the preloading master would be shared by all workers).
+    """
     global _services_started
     if _services_started:
         return
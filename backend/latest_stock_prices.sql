@@ -0,0 +1,39 @@
+-- Latest_Stock_Prices: one row per stock_id with the most recent quote.
+-- Maintained by fetch_all_stock_prices (same transaction as Stock_Prices).
+-- Read paths (movers, search, detail, sentiment, watchlists) join this table
+-- instead of a MAX(as_of) GROUP BY over the full Stock_Prices history.
+-- Idempotent: safe to run multiple times.
+
+CREATE TABLE IF NOT EXISTS Latest_Stock_Prices (
+	stock_id INT NOT NULL,
+	ltp DECIMAL(14,4) NOT NULL,
+	day_high DECIMAL(14,4) NULL,
+	day_low DECIMAL(14,4) NULL,
+	day_open DECIMAL(14,4) NULL,
+	prev_close DECIMAL(14,4) NULL,
+	as_of DATETIME NOT NULL,
+	PRIMARY KEY (stock_id),
+	KEY idx_latest_stock_prices_as_of (as_of),
+	CONSTRAINT fk_latest_stock_prices_stock FOREIGN KEY (stock_id) REFERENCES Stocks (stock_id) ON DELETE CASCADE
+);
+
+-- Backfill from existing history (also available as scripts/backfill_latest_prices.py)
+INSERT INTO Latest_Stock_Prices (stock_id, ltp, day_high, day_low, day_open, prev_close, as_of)
+SELECT sp.stock_id, sp.ltp, sp.day_high, sp.day_low, sp.day_open, sp.prev_close, sp.as_of
+FROM Stock_Prices sp
+INNER JOIN (
+	SELECT stock_id, MAX(as_of) AS max_as_of
+	FROM Stock_Prices
+	GROUP BY stock_id
+) latest
+  ON latest.stock_id = sp.stock_id AND latest.max_as_of = sp.as_of
+ON DUPLICATE KEY UPDATE
+  ltp = VALUES(ltp),
+  day_high = VALUES(day_high),
+  day_low = VALUES(day_low),
+  day_open = VALUES(day_open),
+  prev_close = VALUES(prev_close),
+  as_of = VALUES(as_of);
+
+-- Verification (optional)
+SELECT COUNT(*) AS latest_rows FROM Latest_Stock_Prices;
@@ -2,21 +2,25 @@ from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta, date 
 import os
 from datetime import datetime, timedelta, time
-from services.http_client import upstox_get
 from controller.fetch.stock_prices_fetch.fetch_stocks_prices import fetch_all_stock_prices
 import traceback # For logging
 
 # --- Imports ---
 from db_pool import get_connection
 from controller.fetch.stock_prices_fetch.fetch_stocks_prices import fetch_all_stock_prices
-from services.http_client import upstox_get
 from services.cache_service import get_cache
+from services.stock_registry import get_stock_registry
+from services.candle_cache import get_candle_cache
+from services.history_gap_fill import enqueue_gap_fill
+from services.stock_search_index import search_stocks as search_stock_index
+from services.live_price_cache import get_day_ohlc
 from utils.market_hours import should_use_websocket
-# Optional live cache for real-time movers
+# Optional live movers engine (ranks directly on the live price cache)
 try:
-    from services.live_price_cache import get_all_cached_prices
+    from services.movers_engine import compute_top_movers, compute_most_active
 except Exception:
-    get_all_cached_prices = None  # type: ignore
+    compute_top_movers = None  # type: ignore
+    compute_most_active = None  # type: ignore
 # -----------------
 
 stock_prices_bp = Blueprint('stock_prices_bp', __name__)
@@ -32,6 +36,31 @@ def fetch_prices():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+def _live_top_movers(order: str, limit: int, exchange: str | None, use_intraday: bool):
+    """Read movers from the incremental live leaderboards; None if not available."""
+    if compute_top_movers is None:
+        return None
+    try:
+        return compute_top_movers(order, limit, exchange, use_intraday) or None
+    except Exception as e:
+        print(f"⚠️ [movers] Live ranking failed, using DB snapshot: {e}")
+        return None
+
+
+def _live_most_active(limit: int, exchange: str | None):
+    """Most-active payload from the live volatility leaderboard; None if not available."""
+    if compute_most_active is None:
+        return None
+    try:
+        live = compute_most_active(limit, exchange)
+    except Exception as e:
+        print(f"⚠️ [most_active] Live ranking failed, using DB snapshot: {e}")
+        return None
+    if not live:
+        return None
+    return {"status": "success", "data": live, "count": len(live)}
+
+
 def _top_movers_query(order: str, limit: int, exchange: str | None, use_intraday: bool = True):
     """
     Query top movers (gainers/losers)
@@ -42,7 +71,15 @@ def _top_movers_query(order: str, limit: int, exchange: str | None, use_intraday
         exchange: Exchange filter (e.g., 'NSE')
         use_intraday: If True, calculates % change from day_open (intraday, matches Groww)
                       If False, calculates from prev_close (day-over-day)
+
+    During market hours the ranking comes from the live price cache; the SQL
+    snapshot is only used when the live cache is empty or unavailable.
     """
+    if should_use_websocket():
+        live = _live_top_movers(order, limit, exchange, use_intraday)
+        if live is not None:
+            return live
+
     conn = get_connection()
     cursor = conn.cursor(dictionary=True)
     try:
@@ -75,13 +112,7 @@ def _top_movers_query(order: str, limit: int, exchange: str | None, use_intraday
                      THEN ((sp.ltp - {base_price}) / {base_price}) * 100
                      ELSE NULL END AS change_percent,
                 sp.as_of
-            FROM Stock_Prices sp
-            INNER JOIN (
-                SELECT stock_id, MAX(as_of) AS max_as_of
-                FROM Stock_Prices
-                GROUP BY stock_id
-            ) latest
-              ON latest.stock_id = sp.stock_id AND latest.max_as_of = sp.as_of
+            FROM Latest_Stock_Prices sp
             INNER JOIN Stocks s ON s.stock_id = sp.stock_id
             {where_clause}
             {where_exchange}
@@ -92,41 +123,6 @@ def _top_movers_query(order: str, limit: int, exchange: str | None, use_intraday
         cursor.execute(sql, params)
         rows = cursor.fetchall()
 
-        # If during market hours and live cache available, override LTP with live values
-        # and recompute change percent/value for real-time movers.
-        try:
-            if should_use_websocket() and get_all_cached_prices is not None:
-                live_map = {}
-                for e in get_all_cached_prices():
-                    sid = e.get("stock_id")
-                    if sid is not None:
-                        live_map[sid] = {
-                            "ltp": e.get("ltp"),
-                            "day_open": e.get("day_open"),
-                            "prev_close": e.get("prev_close"),
-                        }
-                # recompute metrics
-                for r in rows:
-                    live = live_map.get(r["stock_id"]) if isinstance(r, dict) else None
-                    if not live:
-                        continue
-                    ltp_live = live.get("ltp")
-                    if ltp_live is None:
-                        continue
-                    r["ltp"] = float(ltp_live)
-                    # prefer base from cache if present to avoid DB-stale open/close
-                    base = None
-                    if use_intraday:
-                        base = float(live.get("day_open") or r.get("day_open") or 0)
-                    else:
-                        base = float(live.get("prev_close") or r.get("prev_close") or 0)
-                    if base:
-                        r["change_value"] = float(r["ltp"]) - base
-                        r["change_percent"] = ((float(r["ltp"]) - base) / base) * 100.0
-        except Exception:
-            # best-effort live override; fallback to DB-derived rows on any error
-            pass
-
         # Map to frontend-friendly structure
         movers = []
         for r in rows:
@@ -158,15 +154,18 @@ def top_gainers():
         # Use intraday mode by default (matches Groww/Zerodha)
         use_intraday = request.args.get('intraday', 'true').lower() == 'true'
         
-        # Cache for 3 seconds during market hours, 10 seconds otherwise
+        # During market hours read the live leaderboard directly (O(limit));
+        # otherwise cache the DB snapshot query for 10 seconds
         live_mode = should_use_websocket()
-        cache_key = f"gainers:{exchange}:{limit}:{use_intraday}:{live_mode}"
-        movers = cache.get_or_compute_stale(
-            cache_key,
-            lambda: _top_movers_query(order="DESC", limit=limit, exchange=exchange, use_intraday=use_intraday),
-            ttl_seconds=3 if live_mode else 10,
-            stale_ttl_seconds=120
-        )
+        movers = _live_top_movers("DESC", limit, exchange, use_intraday) if live_mode else None
+        if movers is None:
+            cache_key = f"gainers:{exchange}:{limit}:{use_intraday}:{live_mode}"
+            movers = cache.get_or_compute_stale(
+                cache_key,
+                lambda: _top_movers_query(order="DESC", limit=limit, exchange=exchange, use_intraday=use_intraday),
+                ttl_seconds=3 if live_mode else 10,
+                stale_ttl_seconds=120
+            )
         
         return jsonify({
             "status": "success",
@@ -188,15 +187,18 @@ def top_losers():
         # Use intraday mode by default (matches Groww/Zerodha)
         use_intraday = request.args.get('intraday', 'true').lower() == 'true'
         
-        # Cache for 3 seconds during market hours, 10 seconds otherwise
+        # During market hours read the live leaderboard directly (O(limit));
+        # otherwise cache the DB snapshot query for 10 seconds
         live_mode = should_use_websocket()
-        cache_key = f"losers:{exchange}:{limit}:{use_intraday}:{live_mode}"
-        movers = cache.get_or_compute_stale(
-            cache_key,
-            lambda: _top_movers_query(order="ASC", limit=limit, exchange=exchange, use_intraday=use_intraday),
-            ttl_seconds=3 if live_mode else 10,
-            stale_ttl_seconds=120
-        )
+        movers = _live_top_movers("ASC", limit, exchange, use_intraday) if live_mode else None
+        if movers is None:
+            cache_key = f"losers:{exchange}:{limit}:{use_intraday}:{live_mode}"
+            movers = cache.get_or_compute_stale(
+                cache_key,
+                lambda: _top_movers_query(order="ASC", limit=limit, exchange=exchange, use_intraday=use_intraday),
+                ttl_seconds=3 if live_mode else 10,
+                stale_ttl_seconds=120
+            )
         
         return jsonify({
             "status": "success",
@@ -217,15 +219,18 @@ def get_stock_detail(symbol):
     cursor = None
     force_live = request.args.get('forceLive') == '1'
     try:
+        # Stock identity from the in-memory registry; only the price row hits the DB
+        ref = get_stock_registry().by_symbol(symbol)
+        if ref is None:
+            return jsonify({
+                "status": "error",
+                "message": f"Stock '{symbol}' not found in database"
+            }), 404
+
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
-        # Query stock info + latest price from database
         sql = """
             SELECT 
-                s.stock_id,
-                s.symbol,
-                s.company_name,
-                s.exchange,
                 sp.ltp,
                 sp.day_open,
                 sp.day_high,
@@ -234,23 +239,17 @@ def get_stock_detail(symbol):
                 sp.as_of,
                 ((sp.ltp - sp.prev_close) / NULLIF(sp.prev_close, 0)) * 100 AS change_percent,
                 (sp.ltp - sp.prev_close) AS change_value
-            FROM Stocks s
-            LEFT JOIN (
-                SELECT stock_id, MAX(as_of) AS max_as_of
-                FROM Stock_Prices
-                GROUP BY stock_id
-            ) latest ON latest.stock_id = s.stock_id
-            LEFT JOIN Stock_Prices sp ON sp.stock_id = s.stock_id AND sp.as_of = latest.max_as_of
-            WHERE s.symbol = %s
-            LIMIT 1
+            FROM Latest_Stock_Prices sp
+            WHERE sp.stock_id = %s
         """
-        cursor.execute(sql, (symbol.upper(),))
-        stock = cursor.fetchone()
-        if not stock:
-            return jsonify({
-                "status": "error",
-                "message": f"Stock '{symbol}' not found in database"
-            }), 404
+        cursor.execute(sql, (ref.stock_id,))
+        stock = cursor.fetchone() or {}
+        stock.update({
+            "stock_id": ref.stock_id,
+            "symbol": ref.symbol,
+            "company_name": ref.company_name,
+            "exchange": ref.exchange,
+        })
 
         # Extract DB values
         ltp = float(stock['ltp']) if stock.get('ltp') is not None else None
@@ -289,12 +288,8 @@ def get_stock_detail(symbol):
             if force_live and should_use_websocket() and live_price_source == "database":
                 try:
                     from controller.order.buy_sell_order import get_live_price
-                    cursor2 = conn.cursor(dictionary=True)
-                    cursor2.execute("SELECT isin FROM Stocks WHERE stock_id=%s", (stock['stock_id'],))
-                    row_isin = cursor2.fetchone()
-                    cursor2.close()
-                    if row_isin and row_isin.get('isin'):
-                        direct_price = get_live_price(row_isin['isin'], stock_id=stock['stock_id'])
+                    if ref.isin:
+                        direct_price = get_live_price(ref.isin, stock_id=stock['stock_id'])
                         if isinstance(direct_price, (int, float)):
                             ltp = float(direct_price)
                             live_price_source = "upstox_api"
@@ -342,9 +337,41 @@ def get_stock_detail(symbol):
             conn.close()
 
 
+def _search_stocks_sql(cursor, query: str, limit: int):
+    """SQL symbol/company-name matching, used when the in-memory index is unavailable."""
+    search_upper = query.upper()
+    if len(search_upper) <= 2:
+        sql1 = """
+            SELECT s.stock_id, s.symbol, s.company_name, s.exchange
+            FROM Stocks s
+            WHERE s.symbol LIKE %s
+            ORDER BY s.symbol
+            LIMIT %s
+        """
+        cursor.execute(sql1, (f"{search_upper}%", limit))
+    else:
+        sql1 = """
+            SELECT 
+                s.stock_id, s.symbol, s.company_name, s.exchange,
+                CASE 
+                    WHEN s.symbol = %s THEN 1
+                    WHEN s.symbol LIKE %s THEN 2
+                    ELSE 3
+                END AS match_priority
+            FROM Stocks s
+            WHERE s.symbol LIKE %s OR s.company_name LIKE %s
+            ORDER BY match_priority, s.symbol
+            LIMIT %s
+        """
+        exact = search_upper
+        prefix = f"{search_upper}%"
+        cursor.execute(sql1, (exact, prefix, prefix, prefix, limit))
+    return cursor.fetchall()
+
+
 @stock_prices_bp.route('/search', methods=['GET'])
 def search_stocks():
-    """Search stocks by symbol or company name"""
+    """Search stocks by symbol or company name (in-memory index, live prices)"""
     conn = None
     cursor = None
     try:
@@ -361,39 +388,19 @@ def search_stocks():
         if limit > 50:
             limit = 50  # Max 50 results
         
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-
-        # Step 1: find matching stocks quickly using indexed fields only
-        search_upper = query.upper()
-        if len(search_upper) <= 2:
-            sql1 = """
-                SELECT s.stock_id, s.symbol, s.company_name, s.exchange
-                FROM Stocks s
-                WHERE s.symbol LIKE %s
-                ORDER BY s.symbol
-                LIMIT %s
-            """
-            cursor.execute(sql1, (f"{search_upper}%", limit))
+        # Step 1: match from the in-memory search index (no DB round trip)
+        matches = search_stock_index(query, limit)
+        if matches is None:
+            # Stocks registry unavailable; fall back to SQL matching
+            conn = get_connection()
+            cursor = conn.cursor(dictionary=True)
+            stock_rows = _search_stocks_sql(cursor, query, limit)
         else:
-            sql1 = """
-                SELECT 
-                    s.stock_id, s.symbol, s.company_name, s.exchange,
-                    CASE 
-                        WHEN s.symbol = %s THEN 1
-                        WHEN s.symbol LIKE %s THEN 2
-                        ELSE 3
-                    END AS match_priority
-                FROM Stocks s
-                WHERE s.symbol LIKE %s OR s.company_name LIKE %s
-                ORDER BY match_priority, s.symbol
-                LIMIT %s
-            """
-            exact = search_upper
-            prefix = f"{search_upper}%"
-            cursor.execute(sql1, (exact, prefix, prefix, prefix, limit))
-
-        stock_rows = cursor.fetchall()
+            stock_rows = [
+                {"stock_id": ref.stock_id, "symbol": ref.symbol,
+                 "company_name": ref.company_name, "exchange": ref.exchange}
+                for ref in matches
+            ]
         if not stock_rows:
             return jsonify({
                 "status": "success",
@@ -401,24 +408,29 @@ def search_stocks():
                 "count": 0
             }), 200
 
-        # Step 2: fetch latest prices only for matched stock_ids
-        stock_ids = [row["stock_id"] for row in stock_rows]
-        # Build placeholders for IN clause
-        placeholders = ",".join(["%s"] * len(stock_ids))
-        sql2 = f"""
-            SELECT sp.stock_id, sp.ltp, sp.prev_close
-            FROM Stock_Prices sp
-            INNER JOIN (
-                SELECT stock_id, MAX(as_of) AS max_as_of
-                FROM Stock_Prices
-                WHERE stock_id IN ({placeholders})
-                GROUP BY stock_id
-            ) latest
-              ON latest.stock_id = sp.stock_id AND latest.max_as_of = sp.as_of
-        """
-        cursor.execute(sql2, tuple(stock_ids))
-        price_rows = cursor.fetchall()
-        price_map = {r["stock_id"]: r for r in price_rows}
+        # Step 2: prices from the live cache; Latest_Stock_Prices only for misses
+        price_map = {}
+        missing = []
+        for row in stock_rows:
+            live = get_day_ohlc(row["stock_id"])
+            if live and live.get("close") is not None:
+                price_map[row["stock_id"]] = {"ltp": live["close"], "prev_close": live.get("prev_close")}
+            else:
+                missing.append(row["stock_id"])
+        if missing:
+            if cursor is None:
+                conn = get_connection()
+                cursor = conn.cursor(dictionary=True)
+            # Build placeholders for IN clause
+            placeholders = ",".join(["%s"] * len(missing))
+            sql2 = f"""
+                SELECT sp.stock_id, sp.ltp, sp.prev_close
+                FROM Latest_Stock_Prices sp
+                WHERE sp.stock_id IN ({placeholders})
+            """
+            cursor.execute(sql2, tuple(missing))
+            for r in cursor.fetchall():
+                price_map[r["stock_id"]] = r
         
         results = []
         for stock in stock_rows:
@@ -459,6 +471,90 @@ def search_stocks():
             conn.close()
 
 
+def _most_active_query(limit: int, exchange: str | None):
+    """
+    Most active stocks by intraday range as % of prev_close (volatility proxy).
+    Live cache ranking during market hours, Latest_Stock_Prices otherwise.
+    """
+    if should_use_websocket():
+        live = _live_most_active(limit, exchange)
+        if live is not None:
+            return live
+
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        where_exchange = ""
+        params = []
+        if exchange:
+            where_exchange = "AND s.exchange = %s"
+            params.append(exchange)
+
+        sql = f"""
+            SELECT 
+                s.stock_id,
+                s.symbol,
+                s.company_name,
+                sp.ltp,
+                sp.prev_close,
+                sp.day_open,
+                sp.day_high,
+                sp.day_low,
+                (sp.ltp - sp.prev_close) AS change_value,
+                CASE WHEN sp.prev_close IS NOT NULL AND sp.prev_close <> 0 
+                     THEN ((sp.ltp - sp.prev_close) / sp.prev_close) * 100
+                     ELSE NULL END AS change_percent,
+                CASE WHEN sp.prev_close IS NOT NULL AND sp.prev_close <> 0 
+                     THEN ((sp.day_high - sp.day_low) / sp.prev_close) * 100
+                     ELSE NULL END AS volatility_score,
+                sp.as_of
+            FROM Latest_Stock_Prices sp
+            INNER JOIN Stocks s ON s.stock_id = sp.stock_id
+            WHERE sp.day_high IS NOT NULL 
+              AND sp.day_low IS NOT NULL 
+              AND sp.day_high > sp.day_low
+            {where_exchange}
+            ORDER BY volatility_score DESC, sp.ltp DESC
+            LIMIT %s
+        """
+        params.append(limit)
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+        # Map to frontend-friendly structure
+        active_stocks = []
+        for r in rows:
+            ltp = float(r["ltp"]) if r.get("ltp") is not None else None
+            pct = float(r["change_percent"]) if r.get("change_percent") is not None else None
+            volatility = float(r["volatility_score"]) if r.get("volatility_score") is not None else None
+
+            # Use volatility percentage as a pseudo-volume indicator
+            # Format it as if it were volume for display consistency
+            volume_display = int(volatility * 100000) if volatility else 0
+
+            active_stocks.append({
+                "name": r["company_name"],
+                "symbol": r["symbol"],
+                "price": f"{ltp:,.2f}" if ltp is not None else None,
+                "change": (f"{pct:+.2f}%" if pct is not None else None),
+                "volume": volume_display,  # Pseudo-volume based on volatility
+                # optional numeric fields
+                "priceNum": ltp,
+                "changePercentNum": pct,
+                "changeValueNum": float(r["change_value"]) if r.get("change_value") is not None else None,
+                "asOf": r["as_of"].isoformat() if r.get("as_of") else None,
+            })
+
+        return {
+            "status": "success",
+            "data": active_stocks,
+            "count": len(active_stocks)
+        }
+    finally:
+        cursor.close()
+        conn.close()
+
+
 @stock_prices_bp.route('/most-active', methods=['GET'])
 def most_active():
     """
@@ -473,87 +569,12 @@ def most_active():
         # Cache for 10 seconds
         cache_key = f"active:{exchange}:{limit}"
         
-        def fetch_most_active():
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-            try:
-                where_exchange = ""
-                params = []
-                if exchange:
-                    where_exchange = "AND s.exchange = %s"
-                    params.append(exchange)
-                
-                sql = f"""
-                    SELECT 
-                        s.stock_id,
-                        s.symbol,
-                        s.company_name,
-                        sp.ltp,
-                        sp.prev_close,
-                        sp.day_open,
-                        sp.day_high,
-                        sp.day_low,
-                        (sp.ltp - sp.prev_close) AS change_value,
-                        CASE WHEN sp.prev_close IS NOT NULL AND sp.prev_close <> 0 
-                             THEN ((sp.ltp - sp.prev_close) / sp.prev_close) * 100
-                             ELSE NULL END AS change_percent,
-                        CASE WHEN sp.prev_close IS NOT NULL AND sp.prev_close <> 0 
-                             THEN ((sp.day_high - sp.day_low) / sp.prev_close) * 100
-                             ELSE NULL END AS volatility_score,
-                        sp.as_of
-                    FROM Stock_Prices sp
-                    INNER JOIN (
-                        SELECT stock_id, MAX(as_of) AS max_as_of
-                        FROM Stock_Prices
-                        GROUP BY stock_id
-                    ) latest
-                      ON latest.stock_id = sp.stock_id AND latest.max_as_of = sp.as_of
-                    INNER JOIN Stocks s ON s.stock_id = sp.stock_id
-                    WHERE sp.day_high IS NOT NULL 
-                      AND sp.day_low IS NOT NULL 
-                      AND sp.day_high > sp.day_low
-                    {where_exchange}
-                    ORDER BY volatility_score DESC, sp.ltp DESC
-                    LIMIT %s
-                """
-                params.append(limit)
-                cursor.execute(sql, params)
-                rows = cursor.fetchall()
-
-                # Map to frontend-friendly structure
-                active_stocks = []
-                for r in rows:
-                    ltp = float(r["ltp"]) if r.get("ltp") is not None else None
-                    pct = float(r["change_percent"]) if r.get("change_percent") is not None else None
-                    volatility = float(r["volatility_score"]) if r.get("volatility_score") is not None else None
-                    
-                    # Use volatility percentage as a pseudo-volume indicator
-                    # Format it as if it were volume for display consistency
-                    volume_display = int(volatility * 100000) if volatility else 0
-                    
-                    active_stocks.append({
-                        "name": r["company_name"],
-                        "symbol": r["symbol"],
-                        "price": f"{ltp:,.2f}" if ltp is not None else None,
-                        "change": (f"{pct:+.2f}%" if pct is not None else None),
-                        "volume": volume_display,  # Pseudo-volume based on volatility
-                        # optional numeric fields
-                        "priceNum": ltp,
-                        "changePercentNum": pct,
-                        "changeValueNum": float(r["change_value"]) if r.get("change_value") is not None else None,
-                        "asOf": r["as_of"].isoformat() if r.get("as_of") else None,
-                    })
-
-                return {
-                    "status": "success",
-                    "data": active_stocks,
-                    "count": len(active_stocks)
-                }
-            finally:
-                cursor.close()
-                conn.close()
-
-        result = cache.get_or_compute_stale(cache_key, fetch_most_active, ttl_seconds=10, stale_ttl_seconds=120)
+        result = cache.get_or_compute_stale(
+            cache_key,
+            lambda: _most_active_query(limit, exchange),
+            ttl_seconds=10,
+            stale_ttl_seconds=120,
+        )
         return jsonify(result), 200
     except Exception as e:
         return jsonify({
@@ -573,6 +594,21 @@ def movers_all():
         exchange = request.args.get('exchange', 'NSE')
         use_intraday = request.args.get('intraday', 'true').lower() == 'true'
         
+        # During market hours all three lists are ready-made live leaderboards
+        if should_use_websocket():
+            gainers = _live_top_movers("DESC", limit, exchange, use_intraday)
+            losers = _live_top_movers("ASC", limit, exchange, use_intraday)
+            active = _live_most_active(limit, exchange)
+            if gainers is not None and losers is not None:
+                return jsonify({
+                    "status": "success",
+                    "data": {
+                        "gainers": gainers,
+                        "losers": losers,
+                        "mostActive": active["data"] if active else []
+                    }
+                }), 200
+
         # Cache the aggregated result for 10 seconds
         cache_key = f"movers_all:{exchange}:{limit}:{use_intraday}"
         
@@ -598,82 +634,12 @@ def movers_all():
             # Fetch most active
             active_key = f"active:{exchange}:{limit}"
             
-            def fetch_most_active_internal():
-                conn = get_connection()
-                cursor = conn.cursor(dictionary=True)
-                try:
-                    where_exchange = ""
-                    params = []
-                    if exchange:
-                        where_exchange = "AND s.exchange = %s"
-                        params.append(exchange)
-                    
-                    sql = f"""
-                        SELECT 
-                            s.stock_id,
-                            s.symbol,
-                            s.company_name,
-                            sp.ltp,
-                            sp.prev_close,
-                            sp.day_open,
-                            sp.day_high,
-                            sp.day_low,
-                            (sp.ltp - sp.prev_close) AS change_value,
-                            CASE WHEN sp.prev_close IS NOT NULL AND sp.prev_close <> 0 
-                                 THEN ((sp.ltp - sp.prev_close) / sp.prev_close) * 100
-                                 ELSE NULL END AS change_percent,
-                            CASE WHEN sp.prev_close IS NOT NULL AND sp.prev_close <> 0 
-                                 THEN ((sp.day_high - sp.day_low) / sp.prev_close) * 100
-                                 ELSE NULL END AS volatility_score,
-                            sp.as_of
-                        FROM Stock_Prices sp
-                        INNER JOIN (
-                            SELECT stock_id, MAX(as_of) AS max_as_of
-                            FROM Stock_Prices
-                            GROUP BY stock_id
-                        ) latest
-                          ON latest.stock_id = sp.stock_id AND latest.max_as_of = sp.as_of
-                        INNER JOIN Stocks s ON s.stock_id = sp.stock_id
-                        WHERE sp.day_high IS NOT NULL 
-                          AND sp.day_low IS NOT NULL 
-                          AND sp.day_high > sp.day_low
-                        {where_exchange}
-                        ORDER BY volatility_score DESC, sp.ltp DESC
-                        LIMIT %s
-                    """
-                    params.append(limit)
-                    cursor.execute(sql, params)
-                    rows = cursor.fetchall()
-
-                    active_stocks = []
-                    for r in rows:
-                        ltp = float(r["ltp"]) if r.get("ltp") is not None else None
-                        pct = float(r["change_percent"]) if r.get("change_percent") is not None else None
-                        volatility = float(r["volatility_score"]) if r.get("volatility_score") is not None else None
-                        volume_display = int(volatility * 100000) if volatility else 0
-                        
-                        active_stocks.append({
-                            "name": r["company_name"],
-                            "symbol": r["symbol"],
-                            "price": f"{ltp:,.2f}" if ltp is not None else None,
-                            "change": (f"{pct:+.2f}%" if pct is not None else None),
-                            "volume": volume_display,
-                            "priceNum": ltp,
-                            "changePercentNum": pct,
-                            "changeValueNum": float(r["change_value"]) if r.get("change_value") is not None else None,
-                            "asOf": r["as_of"].isoformat() if r.get("as_of") else None,
-                        })
-
-                    return {
-                        "status": "success",
-                        "data": active_stocks,
-                        "count": len(active_stocks)
-                    }
-                finally:
-                    cursor.close()
-                    conn.close()
-            
-            most_active = cache.get_or_compute_stale(active_key, fetch_most_active_internal, ttl_seconds=10, stale_ttl_seconds=120)
+            most_active = cache.get_or_compute_stale(
+                active_key,
+                lambda: _most_active_query(limit, exchange),
+                ttl_seconds=10,
+                stale_ttl_seconds=120,
+            )
             
             return {
                 "gainers": gainers,
@@ -698,9 +664,11 @@ def movers_all():
 def get_stock_history(symbol: str):
     """
     Return OHLCV candles for a symbol from the local database ONLY.
+
+    Missing recent candles are fetched from Upstox in the background
+    (services/history_gap_fill.py); the response then has "stale": true and
+    a 'history_ready' Socket.IO event follows once they are stored.
     """
-    conn = None
-    cursor = None
     try:
         interval = (request.args.get('interval') or 'day').lower()
         if interval not in ('day', 'week', 'month', 'year'):
@@ -742,50 +710,33 @@ def get_stock_history(symbol: str):
                 else:  # year
                     from_date = to_date - timedelta(days=365)
 
-        # Lookup stock_id and ISIN
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT stock_id, isin, exchange FROM Stocks WHERE symbol = %s LIMIT 1", (symbol.upper(),))
-        stock = cursor.fetchone()
+        # Lookup stock_id and ISIN from the in-memory Stocks registry
+        stock = get_stock_registry().by_symbol(symbol)
         print(f"🔎 Stock lookup for {symbol}: {stock}")
         if not stock:
             return jsonify({"status": "error", "message": f"symbol '{symbol}' not found"}), 404
 
-        stock_id = stock['stock_id']
+        stock_id = stock.stock_id
         # Ensure we have required metadata for Upstox instrument key
-        isin = stock.get('isin')
-        exchange = (stock.get('exchange') or 'NSE').upper()
+        isin = stock.isin
 
-        # Query existing daily candles in range
-        print(f"🔍 Querying Stock_History: stock_id={stock_id}, from={from_date}, to={to_date}")
-        cursor.execute(
-            """
-            SELECT timestamp, open_price, high_price, low_price, close_price, volume
-            FROM Stock_History
-            WHERE stock_id = %s AND timeframe = 'day' AND timestamp BETWEEN %s AND %s
-            ORDER BY timestamp ASC
-            """,
-            (stock_id, from_date, to_date)
-        )
-        existing = cursor.fetchall()
-        print(f"📊 Query returned {len(existing)} candles for {symbol}")
-        if existing and len(existing) > 0:
-            print(f"   First candle: {existing[0]['timestamp']}, Last candle: {existing[-1]['timestamp']}")
-
-        have_enough = len(existing) >= 5  # heuristics: if we have some data, we can serve; will still try to backfill if stale
-        print(f"💾 have_enough = {have_enough} (need at least 5, got {len(existing)})")
+        # Candles come from the per-stock candle cache (daily rows + persisted week/month rollups)
+        candle_cache = get_candle_cache()
+        last_day = candle_cache.last_day(stock_id, to_date)
+        has_data = last_day is not None and last_day >= from_date
+        print(f"📊 Candle cache: last daily candle for {symbol} on or before {to_date} is {last_day}")
 
         # Decide if we need to fetch from Upstox (when empty or last day missing)
         need_fetch = True
-        if existing:
-            last_ts = existing[-1]['timestamp']
-            # Fix: Convert to_date to datetime for comparison (end of day)
-            to_date_dt = datetime.combine(to_date, time(23, 59, 59, 999999))
-            need_fetch = last_ts < to_date_dt
-            print(f"📅 Last candle date: {last_ts}, to_date: {to_date}, need_fetch: {need_fetch}")
+        if has_data:
+            need_fetch = last_day < to_date
+            print(f"📅 Last candle date: {last_day}, to_date: {to_date}, need_fetch: {need_fetch}")
         else:
             print(f"❗ No existing candles found, need_fetch: {need_fetch}")
 
+        # True while a background gap fill for this range is pending
+        stale = False
+
         # Option to skip external fetch via query param for responsiveness
         skip_fetch = (request.args.get('skip_fetch') or request.args.get('db_only') or 'false').lower() == 'true'
         if need_fetch and not skip_fetch:
@@ -793,8 +744,8 @@ def get_stock_history(symbol: str):
             print(f"🔑 UPSTOX_ACCESS_TOKEN: {'SET' if token else 'NOT SET'}")
             if not token:
                 # Can't fetch; if we have some cached data, proceed; else return empty ONLY if truly no data
-                if not existing:
-                    print(f"⛔ Returning empty data: no token AND no cached data (have {len(existing)})")
+                if not has_data:
+                    print(f"⛔ Returning empty data: no token AND no cached data")
                     return jsonify({
                         "status": "success",
                         "symbol": symbol.upper(),
@@ -803,128 +754,30 @@ def get_stock_history(symbol: str):
                         "data": []
                     }), 200
                 else:
-                    print(f"✅ No token but have cached data ({len(existing)} candles), proceeding...")
+                    print(f"✅ No token but have cached data (last candle {last_day}), proceeding...")
             else:
                 # Fetch from Upstox Historical Candle API (daily)
                 if not isin:
                     print(f"⛔ No ISIN for {symbol}, cannot fetch from Upstox")
                     # Return what we have (possibly empty)
+                    daily = candle_cache.candles(stock_id, 'day', from_date, to_date)
                     return jsonify({
                         "status": "success",
                         "symbol": symbol.upper(),
                         "interval": interval,
-                        "count": len(existing),
-                        "data": [] if not existing else [
-                            {
-                                "time": r["timestamp"].strftime("%Y-%m-%d"),
-                                "open": float(r["open_price"]),
-                                "high": float(r["high_price"]),
-                                "low": float(r["low_price"]),
-                                "close": float(r["close_price"]),
-                                "volume": int(r["volume"]) if r.get("volume") is not None else 0,
-                            } for r in existing
-                        ],
+                        "count": len(daily),
+                        "data": daily,
                     }), 200
 
-                instrument_key = f"{exchange}_EQ|{isin}"
-                # Upstox expects from_date before to_date
+                # Fetch from the Upstox Historical Candle API in the background;
+                # serve what we have now and let the client refetch on 'history_ready'.
                 # Ensure to_date doesn't exceed today (Upstox rejects future dates)
                 actual_to_date = min(to_date, datetime.now().date())
-                url = f"https://api.upstox.com/v2/historical-candle/{instrument_key}/day/{from_date:%Y-%m-%d}/{actual_to_date:%Y-%m-%d}"
-                headers = {
-                    "Content-Type": "application/json",
-                    "Accept": "application/json",
-                    "Authorization": f"Bearer {token}",
-                }
-                # Keep this call snappy to avoid frontend timeouts.
-                # Use a short timeout and no retries; fallback will serve cached or empty data.
-                try:
-                    resp = upstox_get(url, headers=headers, timeout=5, max_retries=1)
-                    resp.raise_for_status()
-                    payload = resp.json() or {}
-                    if payload.get("status") != "success":
-                        # Fall back gracefully - continue to use existing data
-                        print(f"⚠️ Upstox API returned non-success status, using cached data")
-                    else:
-                        candles = payload.get("data", {}).get("candles", []) or []
-                        # Upsert into Stock_History
-                        if candles:
-                            insert_rows = []
-                            for row in candles:
-                                # row = [ts, open, high, low, close, volume, oi]
-                                ts_iso = row[0]
-                                try:
-                                    ts_date = datetime.fromisoformat(ts_iso.replace("Z", "+00:00")).date()
-                                except Exception:
-                                    # Fallback: take date part
-                                    ts_date = datetime.strptime(ts_iso[:10], "%Y-%m-%d").date()
-                                o, h, l, c = float(row[1] or 0), float(row[2] or 0), float(row[3] or 0), float(row[4] or 0)
-                                v = int(row[5] or 0)
-                                insert_rows.append((stock_id, 'day', ts_date, o, h, l, c, v))
-
-                            if insert_rows:
-                                # Ensure table has a unique key on (stock_id, timeframe, timestamp) for proper upsert
-                                cursor.executemany(
-                                    """
-                                    INSERT INTO Stock_History (stock_id, timeframe, timestamp, open_price, high_price, low_price, close_price, volume)
-                                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                                    ON DUPLICATE KEY UPDATE
-                                      open_price=VALUES(open_price),
-                                      high_price=VALUES(high_price),
-                                      low_price=VALUES(low_price),
-                                      close_price=VALUES(close_price),
-                                      volume=VALUES(volume)
-                                    """,
-                                    insert_rows
-                                )
-                                conn.commit()
-                                print(f"✅ Inserted/updated {len(insert_rows)} candles from Upstox")
-                                
-                                # Refresh existing after successful insert
-                                cursor.execute(
-                                    """
-                                    SELECT timestamp, open_price, high_price, low_price, close_price, volume
-                                    FROM Stock_History
-                                    WHERE stock_id = %s AND timeframe = 'day' AND timestamp BETWEEN %s AND %s
-                                    ORDER BY timestamp ASC
-                                    """,
-                                    (stock_id, from_date, to_date)
-                                )
-                                existing = cursor.fetchall()
-                                print(f"🔄 Refreshed data: now have {len(existing)} candles")
-                except Exception as e:
-                    # If Upstox fetch fails (timeout, network error, etc.), just use cached data
-                    error_msg = str(e)
-                    # Common issues: 400 = invalid date range/instrument, 429 = rate limit, timeout = network
-                    if "400" in error_msg:
-                        print(f"⚠️ Upstox rejected request for {symbol} (HTTP 400: likely invalid date range or delisted stock), using cached data")
-                    elif "429" in error_msg:
-                        print(f"⚠️ Upstox rate limit hit for {symbol}, using cached data")
-                    elif "timeout" in error_msg.lower():
-                        print(f"⚠️ Upstox request timeout for {symbol}, using cached data")
-                    else:
-                        # Don't print full URL to avoid confusion - just the error type
-                        error_type = type(e).__name__
-                        print(f"⚠️ Failed to fetch from Upstox for {symbol} ({error_type}), using cached data")
-                    print(f"💾 Falling back to {len(existing)} candles from DB")
-                    pass  # Continue to use existing data from DB
-
-        # Aggregate if needed
-        def rows_to_series(rows):
-            return [
-                {
-                    "time": r["timestamp"].strftime("%Y-%m-%d"),
-                    "open": float(r["open_price"]),
-                    "high": float(r["high_price"]),
-                    "low": float(r["low_price"]),
-                    "close": float(r["close_price"]),
-                    "volume": int(r["volume"]) if r.get("volume") is not None else 0,
-                }
-                for r in rows
-            ]
+                stale = enqueue_gap_fill(stock, from_date, actual_to_date)
+                print(f"🕒 Gap fill for {symbol} {from_date}..{actual_to_date}: {'pending' if stale else 'not queued'}")
 
-        if not existing:
-            # If 'existing' is empty, return empty
+        if not has_data:
+            # If there are no candles in range, return empty
             print(f"⛔ No data found in DB for {symbol} in this range.")
             return jsonify({
                 "status": "success",
@@ -932,54 +785,14 @@ def get_stock_history(symbol: str):
                 "interval": interval,
                 "count": 0,
                 "data": [],
+                "stale": stale,
             }), 200
 
-        # --- This code will now be reached immediately ---
-        if interval == 'day':
-            data = rows_to_series(existing)
-        else:
-            # Aggregate to week or month from daily rows
-            buckets = {}
-            for r in existing:
-                d: datetime = r['timestamp']
-                if interval == 'week':
-                    key = f"{d.isocalendar().year}-W{d.isocalendar().week:02d}"
-                    key_date = d - timedelta(days=d.weekday())
-                else: 
-                    key = f"{d.year}-{d.month:02d}"
-                    key_date = d.replace(day=1)
-
-                b = buckets.get(key)
-                o, h, l, c = float(r['open_price']), float(r['high_price']), float(r['low_price']), float(r['close_price'])
-                v = int(r['volume'] or 0)
-                if not b:
-                    buckets[key] = {
-                        'time': key_date.strftime('%Y-%m-%d'),
-                        'open': o,
-                        'high': h,
-                        'low': l,
-                        'close': c,
-                        'volume': v,
-                        '_first_ts': d,
-                        '_last_ts': d,
-                    }
-                else:
-                    b['high'] = max(b['high'], h)
-                    b['low'] = min(b['low'], l)
-                    if d < b['_first_ts']:
-                        b['open'] = o
-                        b['_first_ts'] = d
-                    if d > b['_last_ts']:
-                        b['close'] = c
-                        b['_last_ts'] = d
-                    b['volume'] += v
-
-            data = [
-                {k: v for k, v in b.items() if not k.startswith('_')}
-                for _, b in sorted(buckets.items(), key=lambda kv: kv[1]['_first_ts'])
-            ]
-            if interval == 'year' and data:
-                data = data[-12:]
+        # Day candles and precomputed week/month rollups, sliced by binary search
+        # (year = the last 12 monthly candles)
+        data = candle_cache.candles(stock_id, 'month' if interval == 'year' else interval, from_date, to_date)
+        if interval == 'year' and data:
+            data = data[-12:]
 
         return jsonify({
             "status": "success",
@@ -987,6 +800,7 @@ def get_stock_history(symbol: str):
             "interval": interval,
             "count": len(data),
             "data": data,
+            "stale": stale,
         }), 200
 
     except Exception as e:
@@ -1001,9 +815,4 @@ def get_stock_history(symbol: str):
             "interval": (request.args.get('interval') or 'day').lower(),
             "count": 0,
             "data": []
-        }), 200
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
\ No newline at end of file
+        }), 200
\ No newline at end of file
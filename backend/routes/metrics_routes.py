@@ -10,6 +10,62 @@ metrics_bp = Blueprint("metrics", __name__)
 def get_metrics():
     # Currently we only track Upstox REST calls under label 'upstox_rest'
     upstox_stats = metrics.get_stats("upstox_rest")
-    return jsonify({
+    payload = {
         "upstox_rest": upstox_stats,
-    })
+    }
+    try:
+        from services.movers_engine import get_movers_stats
+        payload["movers"] = get_movers_stats()
+    except Exception:
+        pass
+    try:
+        from services.price_pipeline import get_pipeline_stats
+        payload["price_pipeline"] = get_pipeline_stats()
+    except Exception:
+        pass
+    try:
+        from services.instrument_master import get_instrument_master_stats
+        payload["instrument_master"] = get_instrument_master_stats()
+    except Exception:
+        pass
+    try:
+        from services.websocket_manager import get_fanout_stats, get_subscription_stats
+        payload["socket_subscriptions"] = get_subscription_stats()
+        payload["socket_fanout"] = get_fanout_stats()
+        from services.tick_bus import get_tick_bus_stats
+        payload["tick_bus"] = get_tick_bus_stats()
+    except Exception:
+        pass
+    try:
+        from services.shared_price_table import get_shared_table_stats
+        payload["shared_price_table"] = get_shared_table_stats()
+    except Exception:
+        pass
+    try:
+        from services.stock_registry import get_stock_registry_stats
+        payload["stock_registry"] = get_stock_registry_stats()
+        from services.stock_search_index import get_search_index_stats
+        payload["stock_search"] = get_search_index_stats()
+    except Exception:
+        pass
+    try:
+        from services.candle_cache import get_candle_cache_stats
+        payload["candle_cache"] = get_candle_cache_stats()
+    except Exception:
+        pass
+    try:
+        from services.history_gap_fill import get_gap_fill_stats
+        payload["history_gap_fill"] = get_gap_fill_stats()
+    except Exception:
+        pass
+    try:
+        from services.cache_service import get_cache_stats
+        payload["cache"] = get_cache_stats()
+    except Exception:
+        pass
+    try:
+        from services.leader_election import get_leader_elector
+        payload["leader"] = get_leader_elector().status()
+    except Exception:
+        pass
+    return jsonify(payload)
@@ -0,0 +1,70 @@
+"""
+Build the persisted week/month candle rollups from existing daily candles.
+Run once after deploying rollups (or after bulk-loading daily history outside
+the backfill scripts); afterwards the EOD job and the backfills keep them
+current. Safe to re-run: every bucket is recomputed and upserted.
+
+Run:
+  python scripts/backfill_candle_rollups.py
+
+Optional env overrides:
+  STOCK_IDS=12,34   # only these stocks (default: every stock with daily candles)
+"""
+import os
+import sys
+from typing import List
+
+# Ensure project root on path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from dotenv import load_dotenv
+from db_pool import get_connection
+from services.candle_rollups import rebuild_rollups
+from utils.pretty_log import console, status_ok, status_err
+
+load_dotenv()
+
+STOCK_IDS = os.environ.get("STOCK_IDS", "")
+
+
+def stocks_with_history() -> List[int]:
+    if STOCK_IDS.strip():
+        return [int(s) for s in STOCK_IDS.split(",") if s.strip()]
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT DISTINCT stock_id FROM Stock_History WHERE timeframe = 'day' ORDER BY stock_id")
+        return [row[0] for row in cur.fetchall()]
+    finally:
+        cur.close()
+        conn.close()
+
+
+def backfill() -> None:
+    stock_ids = stocks_with_history()
+    console.rule("📊 Backfill week/month candle rollups")
+    console.log(f"Stocks: {len(stock_ids)}\n")
+
+    total_rows = 0
+    conn = get_connection()
+    try:
+        for idx, stock_id in enumerate(stock_ids, start=1):
+            try:
+                rows = rebuild_rollups(conn, stock_id)
+                conn.commit()
+                total_rows += rows
+                if idx % 100 == 0 or idx == len(stock_ids):
+                    status_ok(f"[{idx}/{len(stock_ids)}] rolled up through stock_id {stock_id}")
+            except Exception as exc:
+                conn.rollback()
+                status_err(f"[{idx}/{len(stock_ids)}] stock_id {stock_id}: {exc}")
+    finally:
+        conn.close()
+        console.rule("✅ Done")
+        console.log(f"Total rollup rows upserted: {total_rows}")
+
+
+if __name__ == "__main__":
+    backfill()
@@ -0,0 +1,40 @@
+"""
+Rebuild the Latest_Stock_Prices snapshot from Stock_Prices history.
+Run once after applying latest_stock_prices.sql, or any time the snapshot
+is suspected to be out of sync (e.g. after a manual Stock_Prices import).
+
+Run:
+  python scripts/backfill_latest_prices.py
+"""
+import os
+import sys
+
+# Ensure project root on path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from dotenv import load_dotenv
+from db_pool import get_connection
+from controller.fetch.stock_prices_fetch.latest_prices import backfill_latest_prices
+from utils.pretty_log import console, status_ok, status_err
+
+load_dotenv()
+
+
+def main() -> None:
+    console.rule("📊 Backfill Latest_Stock_Prices")
+    conn = get_connection()
+    try:
+        affected = backfill_latest_prices(conn)
+        status_ok(f"Latest_Stock_Prices rebuilt ({affected} rows affected)")
+    except Exception as exc:
+        status_err(f"Backfill failed: {exc}")
+        raise
+    finally:
+        conn.close()
+        console.rule("✅ Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 """
 Backfill recent daily candles for existing NSE stocks only.
 Default window: 2025-12-01 to 2026-01-03 (inclusive).
-Uses Upstox historical-candle endpoint and upserts into Stock_History.
+Uses Upstox historical-candle endpoint and upserts into Stock_History
+(daily rows plus the week/month rollups they fall in).
 
 Run:
   # Ensure UPSTOX_ACCESS_TOKEN is set in .env or environment
@@ -25,6 +26,7 @@ if ROOT not in sys.path:
 
 from dotenv import load_dotenv
 from db_pool import get_connection
+from services.candle_rollups import upsert_rollups
 from services.http_client import upstox_get
 from utils.pretty_log import console, status_ok, status_warn, status_err
 
@@ -120,6 +122,7 @@ def backfill(from_date: date, to_date: date) -> None:
                     """,
                     rows,
                 )
+                upsert_rollups(conn, {stock_id: [r[2] for r in rows]})
                 conn.commit()
                 total_rows += len(rows)
                 status_ok(f"[{idx}/{len(stocks)}] {symbol}: upserted {len(rows)} candles")
@@ -0,0 +1,153 @@
+"""
+Contention benchmark for SimpleCache.get_or_compute.
+
+Compares the per-key single-flight implementation with the previous
+cache-wide lock (reproduced below as GlobalLockCache) on two scenarios:
+
+1. slow key: one caller computes a slow key (SLOW_MS) while READERS threads
+   hit other, already-cached keys. Reports reader latency percentiles; with a
+   global lock every reader that misses during the compute waits for it.
+2. stampede: STAMPEDE threads ask for the same cold key at once. Reports how
+   many times compute_fn ran (should be 1) and wall time.
+
+Run:
+  python scripts/bench_cache_contention.py
+
+Optional env overrides:
+  SLOW_MS=500 READERS=32 READS_PER_THREAD=200 STAMPEDE=64
+"""
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+# Ensure project root on path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault("CACHE_BACKEND", "memory")
+
+from services.cache_backends import MemoryCacheBackend
+from services.cache_service import CacheEntry, SimpleCache
+
+SLOW_MS = int(os.environ.get("SLOW_MS", "500"))
+READERS = int(os.environ.get("READERS", "32"))
+READS_PER_THREAD = int(os.environ.get("READS_PER_THREAD", "200"))
+STAMPEDE = int(os.environ.get("STAMPEDE", "64"))
+
+
+class GlobalLockCache:
+    """The previous get_or_compute: compute_fn runs under the cache-wide lock."""
+
+    def __init__(self):
+        self._cache: Dict[str, CacheEntry] = {}
+        self._lock = threading.RLock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            value = entry.get()
+            if value is None:
+                del self._cache[key]
+            return value
+
+    def set(self, key: str, value: Any, ttl_seconds: int = 60):
+        with self._lock:
+            self._cache[key] = CacheEntry(value, ttl_seconds)
+
+    def get_or_compute(self, key: str, compute_fn: Callable[[], Any], ttl_seconds: int = 60):
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+            result = compute_fn()
+            self.set(key, result, ttl_seconds)
+            return result
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def bench_slow_key(cache) -> Dict[str, float]:
+    # Readers use keys with a 0s TTL so every read is a miss that recomputes cheaply,
+    # i.e. they need the compute path the slow key is occupying
+    latencies: List[float] = []
+    lat_lock = threading.Lock()
+    start = threading.Barrier(READERS + 1)
+
+    def slow():
+        start.wait()
+        cache.get_or_compute("slow", lambda: time.sleep(SLOW_MS / 1000.0) or "slow", ttl_seconds=60)
+
+    def reader(n: int):
+        local = []
+        start.wait()
+        for i in range(READS_PER_THREAD):
+            t0 = time.perf_counter()
+            cache.get_or_compute(f"fast:{n}:{i % 8}", lambda: i, ttl_seconds=0)
+            local.append((time.perf_counter() - t0) * 1000)
+        with lat_lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=slow)] + [threading.Thread(target=reader, args=(n,)) for n in range(READERS)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {
+        "wall_ms": (time.perf_counter() - t0) * 1000,
+        "p50_ms": _percentile(latencies, 0.50),
+        "p99_ms": _percentile(latencies, 0.99),
+        "max_ms": max(latencies),
+    }
+
+
+def bench_stampede(cache) -> Dict[str, float]:
+    computes = 0
+    count_lock = threading.Lock()
+    start = threading.Barrier(STAMPEDE)
+
+    def compute():
+        nonlocal computes
+        with count_lock:
+            computes += 1
+        time.sleep(SLOW_MS / 1000.0)
+        return "value"
+
+    def caller():
+        start.wait()
+        cache.get_or_compute("cold", compute, ttl_seconds=60)
+
+    threads = [threading.Thread(target=caller) for _ in range(STAMPEDE)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {"wall_ms": (time.perf_counter() - t0) * 1000, "computes": computes}
+
+
+def main():
+    print(f"slow key {SLOW_MS}ms, {READERS} readers x {READS_PER_THREAD} reads, stampede of {STAMPEDE}")
+    for name, factory in (("global lock", GlobalLockCache), ("per-key", lambda: SimpleCache(MemoryCacheBackend()))):
+        slow = bench_slow_key(factory())
+        stampede = bench_stampede(factory())
+        print(
+            f"{name:>12}: readers p50={slow['p50_ms']:.3f}ms p99={slow['p99_ms']:.3f}ms "
+            f"max={slow['max_ms']:.1f}ms wall={slow['wall_ms']:.0f}ms | "
+            f"stampede computes={stampede['computes']} wall={stampede['wall_ms']:.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Microbenchmark for the SimpleCache read path.
+
+Compares the previous read path, reproduced below, with the current one:
+- legacy: cache-wide RLock + per-entry RLock + datetime.now() expiry checks
+- current: lock-free backend lookup + immutable entry with a monotonic deadline
+
+Measures single-thread cost per hit for get() and for the hit path of
+get_or_compute_stale(), plus aggregate hits/s with THREADS readers.
+
+Run:
+  python scripts/bench_cache_reads.py
+
+Optional env overrides:
+  ITERATIONS=200000 THREADS=8 KEYS=64
+"""
+import os
+import sys
+import threading
+import time
+import timeit
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+# Ensure project root on path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from services.cache_backends import MemoryCacheBackend
+from services.cache_service import SimpleCache
+
+ITERATIONS = int(os.environ.get("ITERATIONS", "200000"))
+THREADS = int(os.environ.get("THREADS", "8"))
+KEYS = int(os.environ.get("KEYS", "64"))
+
+
+class LegacyCacheEntry:
+    def __init__(self, value: Any, ttl_seconds: int, stale_ttl_seconds: Optional[int] = None):
+        self.value = value
+        now = datetime.now()
+        self.expires_at = now + timedelta(seconds=ttl_seconds)
+        self.stale_expires_at = (
+            (now + timedelta(seconds=ttl_seconds + (stale_ttl_seconds or 0)))
+            if stale_ttl_seconds is not None else None
+        )
+        self.lock = threading.RLock()
+
+    def is_expired(self) -> bool:
+        with self.lock:
+            return datetime.now() > self.expires_at
+
+    def get(self) -> Optional[Any]:
+        with self.lock:
+            if self.is_expired():
+                return None
+            return self.value
+
+
+class LegacyCache:
+    def __init__(self):
+        self._cache: Dict[str, LegacyCacheEntry] = {}
+        self._lock = threading.RLock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            value = entry.get()
+            if value is None:
+                del self._cache[key]
+            return value
+
+    def set(self, key: str, value: Any, ttl_seconds: int = 60, stale_ttl_seconds: Optional[int] = None):
+        with self._lock:
+            self._cache[key] = LegacyCacheEntry(value, ttl_seconds, stale_ttl_seconds)
+
+    def get_or_compute_stale(self, key: str, compute_fn, ttl_seconds: int = 60, stale_ttl_seconds: int = 120):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                val = entry.get()
+                if val is not None:
+                    return val
+        result = compute_fn()
+        self.set(key, result, ttl_seconds, stale_ttl_seconds)
+        return result
+
+
+def _fill(cache) -> None:
+    for i in range(KEYS):
+        cache.set(f"movers:{i}", [{"symbol": f"S{i}", "ltp": float(i)}], 3600, 120)
+
+
+def _per_call_ns(fn) -> float:
+    return timeit.timeit(fn, number=ITERATIONS) / ITERATIONS * 1e9
+
+
+def _threaded_hits_per_second(cache) -> float:
+    per_thread = ITERATIONS // THREADS
+    start = threading.Barrier(THREADS + 1)
+
+    def reader():
+        start.wait()
+        for i in range(per_thread):
+            cache.get(f"movers:{i % KEYS}")
+
+    threads = [threading.Thread(target=reader) for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    return per_thread * THREADS / (time.perf_counter() - t0)
+
+
+def main():
+    print(f"{ITERATIONS} iterations, {KEYS} keys, {THREADS} threads")
+    compute = lambda: None  # never called; every lookup is a hit
+    for name, cache in (("legacy", LegacyCache()), ("current", SimpleCache(MemoryCacheBackend()))):
+        _fill(cache)
+        get_ns = _per_call_ns(lambda: cache.get("movers:7"))
+        stale_ns = _per_call_ns(lambda: cache.get_or_compute_stale("movers:7", compute, 3600, 120))
+        throughput = _threaded_hits_per_second(cache)
+        print(f"{name:>8}: get={get_ns:.0f}ns  get_or_compute_stale={stale_ns:.0f}ns  "
+              f"{THREADS} threads={throughput / 1e6:.2f}M hits/s")
+
+
+if __name__ == "__main__":
+    main()
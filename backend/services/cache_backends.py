@@ -0,0 +1,309 @@
+"""
+Storage backends for services.cache_service.SimpleCache.
+
+- MemoryCacheBackend  - per-process LRU bounded by CACHE_MAX_ENTRIES and an
+                        approximate CACHE_MAX_BYTES (default)
+- SQLiteCacheBackend  - one SQLite file in WAL mode shared by every worker
+                        on the host (put it on /dev/shm for a RAM-backed file)
+- RedisCacheBackend   - any Redis-compatible server; shared across hosts
+
+Shared backends store (value, expires_at, stale_expires_at) with wall-clock
+epoch deadlines so every process agrees on freshness, and provide short
+leases (try_lease / release_lease) that SimpleCache uses to keep
+single-flight semantics across processes: only the lease holder computes a
+key, the others wait for its result instead of hitting the DB themselves.
+
+Selected with CACHE_BACKEND=memory|sqlite|redis (see create_cache_backend).
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (value, expires_at, stale_expires_at) - epoch seconds, stale may be None
+CacheRecord = Tuple[Any, float, Optional[float]]
+
+MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+_SIZE_SAMPLE = 64  # elements measured per container before extrapolating
+_SIZE_DEPTH = 6
+
+
+def approx_size(value: Any, _depth: int = 0) -> int:
+    """Rough deep size of a cached value (dicts/lists of rows). Large containers
+    are sampled and extrapolated, so this stays cheap for movers-sized lists."""
+    size = sys.getsizeof(value)
+    if _depth >= _SIZE_DEPTH:
+        return size
+    if isinstance(value, dict):
+        items = value.items()
+        n = len(value)
+        sample = [approx_size(k, _depth + 1) + approx_size(v, _depth + 1)
+                  for _, (k, v) in zip(range(_SIZE_SAMPLE), items)]
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        n = len(value)
+        sample = [approx_size(v, _depth + 1) for _, v in zip(range(_SIZE_SAMPLE), value)]
+    else:
+        return size
+    if sample:
+        size += sum(sample) * n // len(sample)
+    return size
+
+
+class MemoryCacheBackend:
+    """Per-process cache of immutable CacheEntry objects, bounded by entry
+    count and an approximate byte budget (approx_size, measured once per
+    store). Leases are always granted because in-process single-flight is
+    handled by SimpleCache itself.
+
+    Reads take no lock: a dict lookup plus setting the key's reference bit.
+    Writers evict under the lock with second-chance (CLOCK) ordering, an LRU
+    approximation: a referenced key at the cold end is moved to the hot end
+    once instead of being evicted.
+    """
+
+    name = "memory"
+    shared = False
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()  # key -> (entry, size)
+        self._referenced: set = set()
+        self._bytes = 0
+        self._lock = threading.RLock()  # writers only
+        self._evictions = 0
+
+    def load(self, key: str):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        self._referenced.add(key)
+        return item[0]
+
+    def store(self, key: str, entry) -> None:
+        size = approx_size(entry.value) + sys.getsizeof(key)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (entry, size)
+            self._bytes += size
+            self._referenced.discard(key)
+            # The entry just stored always survives
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                victim = next(iter(self._entries))
+                if victim == key or victim in self._referenced:
+                    self._referenced.discard(victim)
+                    self._entries.move_to_end(victim)
+                    continue
+                _, evicted_size = self._entries.pop(victim)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._referenced.discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._referenced.clear()
+            self._bytes = 0
+
+    def purge_expired(self) -> int:
+        """Drop entries past their stale window (plain TTL when they have none)."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [k for k, (entry, _) in self._entries.items()
+                       if entry.is_expired(now) and not entry.is_stale_allowed(now)]
+            for k in expired:
+                self.delete(k)
+            # A lock-free reader can re-mark a key right after it was deleted
+            self._referenced.intersection_update(self._entries.keys())
+            return len(expired)
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries), "max_entries": self.max_entries,
+            "approx_bytes": self._bytes, "max_bytes": self.max_bytes,
+            "evictions": self._evictions,
+        }
+
+    def try_lease(self, key: str, seconds: float) -> Optional[str]:
+        return "local"
+
+    def release_lease(self, key: str, token: str) -> None:
+        pass
+
+    def lease_active(self, key: str) -> bool:
+        return False
+
+
+class SQLiteCacheBackend:
+    """Host-wide cache in a single SQLite WAL file (one connection per thread)."""
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path: str):
+        self._path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+            " expires_at REAL NOT NULL, stale_expires_at REAL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_leases ("
+            " key TEXT PRIMARY KEY, token TEXT NOT NULL, lease_until REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit; WAL lets readers proceed while one process writes
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, key: str) -> Optional[CacheRecord]:
+        row = self._conn().execute(
+            "SELECT value, expires_at, stale_expires_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return pickle.loads(row[0]), row[1], row[2]
+
+    def store(self, key: str, record: CacheRecord) -> None:
+        value, expires_at, stale_expires_at = record
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, stale_expires_at) VALUES (?, ?, ?, ?)",
+            (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), expires_at, stale_expires_at),
+        )
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM cache")
+
+    def purge_expired(self) -> int:
+        cur = self._conn().execute(
+            "DELETE FROM cache WHERE COALESCE(stale_expires_at, expires_at) < ?", (time.time(),)
+        )
+        return cur.rowcount
+
+    def usage(self) -> Dict[str, Any]:
+        return {"entries": self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0], "path": self._path}
+
+    def try_lease(self, key: str, seconds: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO cache_leases (key, token, lease_until) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET token = excluded.token, lease_until = excluded.lease_until "
+            "WHERE cache_leases.lease_until < ?",
+            (key, token, now + seconds, now),
+        )
+        return token if cur.rowcount == 1 else None
+
+    def release_lease(self, key: str, token: str) -> None:
+        self._conn().execute("DELETE FROM cache_leases WHERE key = ? AND token = ?", (key, token))
+
+    def lease_active(self, key: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM cache_leases WHERE key = ? AND lease_until >= ?", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+
+# Delete the lease only if we still own it
+_RELEASE_LUA = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+
+class RedisCacheBackend:
+    """Cache in a Redis-compatible server; entries expire server-side at the
+    end of their stale window."""
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str, prefix: str = "mockmarket:cache:"):
+        import redis  # Optional dependency, only needed for this backend
+
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._release = self._redis.register_script(_RELEASE_LUA)
+
+    def load(self, key: str) -> Optional[CacheRecord]:
+        raw = self._redis.get(self._prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def store(self, key: str, record: CacheRecord) -> None:
+        _, expires_at, stale_expires_at = record
+        ttl = max(1, int((stale_expires_at or expires_at) - time.time()) + 1)
+        self._redis.set(self._prefix + key, pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL), ex=ttl)
+
+    def delete(self, key: str) -> None:
+        self._redis.delete(self._prefix + key)
+
+    def clear(self) -> None:
+        keys = list(self._redis.scan_iter(match=self._prefix + "*", count=500))
+        if keys:
+            self._redis.delete(*keys)
+
+    def purge_expired(self) -> int:
+        return 0  # Redis expires keys itself
+
+    def usage(self) -> Dict[str, Any]:
+        lease_prefix = (self._prefix + "lease:").encode()
+        keys = self._redis.scan_iter(match=self._prefix + "*", count=500)
+        return {"entries": sum(1 for k in keys if not k.startswith(lease_prefix))}
+
+    def try_lease(self, key: str, seconds: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        ok = self._redis.set(self._prefix + "lease:" + key, token, nx=True, px=int(seconds * 1000))
+        return token if ok else None
+
+    def release_lease(self, key: str, token: str) -> None:
+        self._release(keys=[self._prefix + "lease:" + key], args=[token])
+
+    def lease_active(self, key: str) -> bool:
+        return bool(self._redis.exists(self._prefix + "lease:" + key))
+
+
+def create_cache_backend():
+    """Backend from CACHE_BACKEND (memory | sqlite | redis); falls back to memory."""
+    kind = os.getenv("CACHE_BACKEND", "memory").lower()
+    try:
+        if kind == "sqlite":
+            default_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.getenv("CACHE_SQLITE_PATH", os.path.join(default_dir, "mockmarket_cache.sqlite"))
+            return SQLiteCacheBackend(path)
+        if kind == "redis":
+            url = os.getenv("CACHE_REDIS_URL") or os.getenv("SOCKETIO_MESSAGE_QUEUE")
+            if not url:
+                raise ValueError("CACHE_REDIS_URL is not set")
+            return RedisCacheBackend(url)
+    except Exception as e:
+        logger.error(f"[cache] {kind} backend unavailable ({e}); using in-memory cache")
+    return MemoryCacheBackend()
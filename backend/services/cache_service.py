@@ -1,86 +1,309 @@
 """
-In-memory caching service for high-frequency, low-mutation data.
+Caching service for high-frequency, low-mutation data.
 Reduces DB load and improves response times for movers, news, sentiment.
+
+Storage is pluggable (services/cache_backends.py, CACHE_BACKEND): the default
+keeps entries in this process; the sqlite and redis backends share them
+between gunicorn workers, so a value computed by one worker (or warmed by the
+leader's hot-cache scheduler) is served by all of them. With a shared backend
+get_or_compute / get_or_compute_stale also single-flight across processes
+through a short per-key lease, so DB load does not grow with the worker count.
 """
 from typing import Any, Optional, Dict, Callable
-from datetime import datetime, timedelta
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 import threading
 import time
 import logging
 import os
 
+from services.cache_backends import create_cache_backend
+
 logger = logging.getLogger(__name__)
 # Only show cache operations in DEBUG mode
 DEBUG_CACHE = os.getenv("DEBUG_CACHE", "false").lower() == "true"
+# Cross-process single-flight: how long a computing worker holds a key's lease,
+# and how often the others poll for its result
+LEASE_SECONDS = float(os.getenv("CACHE_LEASE_SECONDS", "30"))
+LEASE_POLL_SECONDS = float(os.getenv("CACHE_LEASE_POLL_MS", "50")) / 1000.0
+# How long a caller waits for another thread's in-flight compute of the same key
+COMPUTE_WAIT_SECONDS = float(os.getenv("CACHE_COMPUTE_WAIT_SECONDS", "30"))
+# Background stale-while-revalidate refreshes share this many worker threads
+REFRESH_WORKERS = max(1, int(os.getenv("CACHE_REFRESH_WORKERS", "4")))
 
 
 class CacheEntry:
-    """Thread-safe cache entry with expiration and optional stale window"""
+    """Immutable cache entry with expiration and optional stale window.
+
+    Deadlines are time.monotonic() floats fixed at construction, so readers
+    check them without locks; updating a key stores a new entry instead of
+    mutating this one.
+    """
+    __slots__ = ("value", "expires_at", "stale_expires_at")
+
     def __init__(self, value: Any, ttl_seconds: int, stale_ttl_seconds: int | None = None):
-        self.value = value
-        now = datetime.now()
-        self.expires_at = now + timedelta(seconds=ttl_seconds)
+        now = time.monotonic()
         # During stale window, we can return stale value while refreshing in background
-        self.stale_expires_at = (
-            (now + timedelta(seconds=ttl_seconds + (stale_ttl_seconds or 0)))
-            if stale_ttl_seconds is not None else None
-        )
-        self.lock = threading.RLock()
+        stale = now + ttl_seconds + (stale_ttl_seconds or 0) if stale_ttl_seconds is not None else None
+        object.__setattr__(self, "value", value)
+        object.__setattr__(self, "expires_at", now + ttl_seconds)
+        object.__setattr__(self, "stale_expires_at", stale)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CacheEntry is immutable")
+
+    def is_expired(self, now: float | None = None) -> bool:
+        return (time.monotonic() if now is None else now) > self.expires_at
+
+    def is_stale_allowed(self, now: float | None = None) -> bool:
+        if self.stale_expires_at is None:
+            return False
+        return (time.monotonic() if now is None else now) <= self.stale_expires_at
 
-    def is_expired(self) -> bool:
-        with self.lock:
-            return datetime.now() > self.expires_at
+    def get(self, now: float | None = None) -> Optional[Any]:
+        if (time.monotonic() if now is None else now) > self.expires_at:
+            return None
+        return self.value
 
-    def is_stale_allowed(self) -> bool:
-        with self.lock:
-            if self.stale_expires_at is None:
-                return False
-            return datetime.now() <= self.stale_expires_at
+    def to_record(self):
+        """(value, expires_at, stale_expires_at) as epoch seconds, for shared backends"""
+        offset = time.time() - time.monotonic()
+        stale = self.stale_expires_at + offset if self.stale_expires_at is not None else None
+        return self.value, self.expires_at + offset, stale
 
-    def get(self) -> Optional[Any]:
-        with self.lock:
-            if self.is_expired():
-                return None
-            return self.value
+    @classmethod
+    def from_record(cls, record) -> "CacheEntry":
+        value, expires_at, stale_expires_at = record
+        offset = time.monotonic() - time.time()
+        entry = cls.__new__(cls)
+        object.__setattr__(entry, "value", value)
+        object.__setattr__(entry, "expires_at", expires_at + offset)
+        object.__setattr__(entry, "stale_expires_at", stale_expires_at + offset if stale_expires_at is not None else None)
+        return entry
 
 
 class SimpleCache:
     """
-    Thread-safe in-memory cache with TTL.
+    Thread-safe cache with TTL over a pluggable backend.
     Ideal for caching API responses that update infrequently during market hours.
     """
-    def __init__(self):
-        self._cache: Dict[str, CacheEntry] = {}
-        self._lock = threading.RLock()
-    
+    def __init__(self, backend=None):
+        self._backend = backend if backend is not None else create_cache_backend()
+        # Guards only the in-flight map and refresh registry; never held while computing
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._refreshing: set[str] = set()
+        self._refresh_pool: Optional[ThreadPoolExecutor] = None
+        self._stats = {
+            "hits": 0, "stale_hits": 0, "misses": 0, "computes": 0,
+            "coalesced": 0, "wait_timeouts": 0, "compute_errors": 0,
+            "lease_waits": 0, "lease_wait_timeouts": 0,
+            "refreshes_started": 0, "refreshes_coalesced": 0, "refreshes_failed": 0,
+        }
+
+    def _load(self, key: str) -> Optional[CacheEntry]:
+        if not self._backend.shared:
+            return self._backend.load(key)
+        try:
+            record = self._backend.load(key)
+        except Exception as e:
+            logger.error(f"Cache backend read failed for {key}: {e}")
+            return None
+        return CacheEntry.from_record(record) if record is not None else None
+
+    def _store(self, key: str, entry: CacheEntry):
+        if not self._backend.shared:
+            self._backend.store(key, entry)
+            return
+        try:
+            self._backend.store(key, entry.to_record())
+        except Exception as e:
+            logger.error(f"Cache backend write failed for {key}: {e}")
+
+    def _try_lease(self, key: str, seconds: float = LEASE_SECONDS) -> Optional[str]:
+        try:
+            return self._backend.try_lease(key, seconds)
+        except Exception as e:
+            # Backend trouble must not block callers; compute without the lease
+            logger.error(f"Cache lease failed for {key}: {e}")
+            return "unleased"
+
+    def _release_lease(self, key: str, token: str):
+        if token == "unleased":
+            return
+        try:
+            self._backend.release_lease(key, token)
+        except Exception as e:
+            logger.error(f"Cache lease release failed for {key}: {e}")
+
+    def try_lease(self, key: str, seconds: float) -> Optional[str]:
+        """Claim key for up to `seconds` among the workers sharing this cache's
+        backend (the memory backend grants every claim, so it only excludes
+        callers that also coordinate in-process). Returns a token for
+        release_lease(), or None while someone else holds it."""
+        return self._try_lease(key, seconds)
+
+    def release_lease(self, key: str, token: str):
+        self._release_lease(key, token)
+
+    def _wait_for_other_process(self, key: str) -> Optional[Any]:
+        """Another worker holds the lease: poll for its result until the lease
+        is released or expires. Returns None if no fresh value appeared."""
+        self._stats["lease_waits"] += 1
+        deadline = time.monotonic() + LEASE_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(LEASE_POLL_SECONDS)
+            entry = self._load(key)
+            value = entry.get() if entry is not None else None
+            if value is not None:
+                return value
+            try:
+                if not self._backend.lease_active(key):
+                    break
+            except Exception:
+                break
+        self._stats["lease_wait_timeouts"] += 1
+        return None
+
+    def _single_flight(self, key: str, compute_fn: Callable[[], Any],
+                       ttl_seconds: int, stale_ttl_seconds: int | None) -> Any:
+        """Compute key once per process: the first caller runs compute_fn, concurrent
+        callers for the same key wait on its Future; other keys are never blocked.
+
+        - Waiters give up after COMPUTE_WAIT_SECONDS with TimeoutError; the
+          computation keeps running and still populates the cache.
+        - If compute_fn raises, the exception is re-raised to the caller that ran it
+          and to every waiter of that flight; nothing is cached, so the next call
+          retries.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            self._stats["coalesced"] += 1
+            try:
+                return future.result(timeout=COMPUTE_WAIT_SECONDS)
+            except FutureTimeout:
+                self._stats["wait_timeouts"] += 1
+                raise TimeoutError(f"Timed out after {COMPUTE_WAIT_SECONDS}s waiting for cache key {key}")
+
+        try:
+            # A flight may have finished between the caller's miss and our registration
+            cached = self.get(key)
+            if cached is None:
+                cached = self._compute_across_processes(key, compute_fn, ttl_seconds, stale_ttl_seconds)
+            future.set_result(cached)
+            return cached
+        except BaseException as e:
+            self._stats["compute_errors"] += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _compute_across_processes(self, key: str, compute_fn: Callable[[], Any],
+                                  ttl_seconds: int, stale_ttl_seconds: int | None) -> Any:
+        """Compute and store key; with a shared backend only one process computes."""
+        token = self._try_lease(key)
+        if token is None:
+            value = self._wait_for_other_process(key)
+            if value is not None:
+                return value
+            # Holder died or is too slow; compute ourselves
+            token = self._try_lease(key)
+        try:
+            if token is not None and self._backend.shared:
+                # Another process may have finished between our miss and the lease
+                entry = self._load(key)
+                value = entry.get() if entry is not None else None
+                if value is not None:
+                    return value
+            self._stats["computes"] += 1
+            result = compute_fn()
+            self.set(key, result, ttl_seconds, stale_ttl_seconds)
+            return result
+        finally:
+            if token is not None:
+                self._release_lease(key, token)
+
+    def _schedule_refresh(self, key: str, compute_fn: Callable[[], Any],
+                          ttl_seconds: int, stale_ttl_seconds: int):
+        """Queue a background refresh of key unless one is already in flight
+        here (or, with a shared backend, in another process)."""
+        with self._lock:
+            if key in self._refreshing:
+                self._stats["refreshes_coalesced"] += 1
+                return
+            self._refreshing.add(key)
+            if self._refresh_pool is None:
+                self._refresh_pool = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="CacheRefresh")
+
+        token = self._try_lease(key)
+        if token is None:
+            # Another worker is already refreshing this key
+            self._stats["refreshes_coalesced"] += 1
+            with self._lock:
+                self._refreshing.discard(key)
+            return
+
+        def _refresh():
+            try:
+                self._stats["computes"] += 1
+                result = compute_fn()
+                self.set(key, result, ttl_seconds, stale_ttl_seconds)
+            except Exception as e:
+                # Keep stale if refresh fails
+                self._stats["refreshes_failed"] += 1
+                logger.error(f"Cache refresh error for {key}: {e}")
+            finally:
+                self._release_lease(key, token)
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        try:
+            self._refresh_pool.submit(_refresh)
+            self._stats["refreshes_started"] += 1
+        except RuntimeError:
+            # Pool shut down (interpreter exiting); keep serving stale
+            self._release_lease(key, token)
+            with self._lock:
+                self._refreshing.discard(key)
+
     def get(self, key: str) -> Optional[Any]:
         """Retrieve cached value if not expired"""
-        with self._lock:
-            entry = self._cache.get(key)
-            if entry is None:
-                return None
-            
-            value = entry.get()
-            if value is None:
-                # Expired, clean up
-                del self._cache[key]
-            return value
-    
+        entry = self._load(key)
+        if entry is None:
+            return None
+
+        value = entry.get()
+        if value is None:
+            # Expired, clean up
+            self.delete(key)
+        return value
+
     def set(self, key: str, value: Any, ttl_seconds: int = 60, stale_ttl_seconds: int | None = None):
         """Cache a value with TTL and optional stale window (default TTL=60s)"""
-        with self._lock:
-            self._cache[key] = CacheEntry(value, ttl_seconds, stale_ttl_seconds)
-    
+        self._store(key, CacheEntry(value, ttl_seconds, stale_ttl_seconds))
+
     def delete(self, key: str):
         """Remove a key from cache"""
-        with self._lock:
-            self._cache.pop(key, None)
-    
+        try:
+            self._backend.delete(key)
+        except Exception as e:
+            logger.error(f"Cache backend delete failed for {key}: {e}")
+
     def clear(self):
         """Clear entire cache"""
-        with self._lock:
-            self._cache.clear()
-    
+        self._backend.clear()
+
+    def purge_expired(self) -> int:
+        """Drop expired entries from the backend; returns how many were removed"""
+        return self._backend.purge_expired()
+
     def get_or_compute(
         self,
         key: str,
@@ -89,30 +312,21 @@ class SimpleCache:
     ) -> Any:
         """
         Get from cache or compute and cache the result.
-        Thread-safe single-flight pattern to prevent stampede.
+        Per-key single-flight to prevent stampede (across processes too when the
+        backend is shared); see _single_flight for timeout and error semantics.
         """
         # Try cache first
         cached = self.get(key)
         if cached is not None:
+            self._stats["hits"] += 1
             if DEBUG_CACHE:
                 logger.debug(f"Cache hit: {key}")
             return cached
-        
-        # Compute with lock to prevent multiple concurrent computations
-        with self._lock:
-            # Double-check after acquiring lock
-            cached = self.get(key)
-            if cached is not None:
-                if DEBUG_CACHE:
-                    logger.debug(f"Cache hit (after lock): {key}")
-                return cached
-            
-            # Compute and cache
-            if DEBUG_CACHE:
-                logger.debug(f"Cache miss - computing: {key}")
-            result = compute_fn()
-            self.set(key, result, ttl_seconds)
-            return result
+
+        self._stats["misses"] += 1
+        if DEBUG_CACHE:
+            logger.debug(f"Cache miss - computing: {key}")
+        return self._single_flight(key, compute_fn, ttl_seconds, None)
 
     def get_or_compute_stale(
         self,
@@ -125,40 +339,45 @@ class SimpleCache:
         Serve stale-while-revalidate:
         - If fresh: return cached
         - If expired but within stale window: return stale immediately and refresh in background
+          (at most one refresh per key, on a bounded worker pool)
         - If no cache or stale window passed: compute synchronously
         """
-        with self._lock:
-            entry = self._cache.get(key)
-            if entry is not None:
-                val = entry.get()
-                if val is not None:
-                    if DEBUG_CACHE:
-                        logger.debug(f"Cache hit: {key}")
-                    return val
-                # expired but possibly within stale window
-                if entry.is_stale_allowed() and entry.value is not None:
-                    if DEBUG_CACHE:
-                        logger.debug(f"Cache stale - serving stale and refreshing: {key}")
-                    stale_val = entry.value
-
-                    # Background refresh
-                    def _refresh():
-                        try:
-                            result = compute_fn()
-                            self.set(key, result, ttl_seconds, stale_ttl_seconds)
-                        except Exception as e:
-                            # Keep stale if refresh fails
-                            logger.error(f"Cache refresh error for {key}: {e}")
-
-                    threading.Thread(target=_refresh, daemon=True).start()
-                    return stale_val
+        entry = self._load(key)
+        if entry is not None:
+            now = time.monotonic()
+            val = entry.get(now)
+            if val is not None:
+                self._stats["hits"] += 1
+                if DEBUG_CACHE:
+                    logger.debug(f"Cache hit: {key}")
+                return val
+            # expired but possibly within stale window
+            if entry.is_stale_allowed(now) and entry.value is not None:
+                self._stats["stale_hits"] += 1
+                if DEBUG_CACHE:
+                    logger.debug(f"Cache stale - serving stale and refreshing: {key}")
+                stale_val = entry.value
+
+                self._schedule_refresh(key, compute_fn, ttl_seconds, stale_ttl_seconds)
+                return stale_val
 
         # No entry or stale window passed; compute synchronously
+        self._stats["misses"] += 1
         if DEBUG_CACHE:
             logger.debug(f"Cache miss - computing: {key}")
-        result = compute_fn()
-        self.set(key, result, ttl_seconds, stale_ttl_seconds)
-        return result
+        return self._single_flight(key, compute_fn, ttl_seconds, stale_ttl_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            usage = self._backend.usage()
+        except Exception:
+            usage = {}
+        lookups = self._stats["hits"] + self._stats["stale_hits"] + self._stats["misses"]
+        return {
+            "backend": self._backend.name, **usage,
+            "hit_ratio": round((self._stats["hits"] + self._stats["stale_hits"]) / lookups, 4) if lookups else None,
+            "inflight": len(self._inflight), "refreshing": len(self._refreshing), **self._stats,
+        }
 
 
 # Global cache instance
@@ -170,19 +389,19 @@ def get_cache() -> SimpleCache:
     return _cache
 
 
+def get_cache_stats() -> Dict[str, Any]:
+    return _cache.stats()
+
+
 # Background cleanup thread (optional, runs every 5 minutes)
 def _cleanup_expired():
     """Remove expired entries to free memory"""
     while True:
         time.sleep(300)  # 5 minutes
-        cache = get_cache()
-        with cache._lock:
-            expired_keys = [
-                k for k, entry in cache._cache.items()
-                if entry.is_expired()
-            ]
-            for k in expired_keys:
-                cache._cache.pop(k, None)
+        try:
+            get_cache().purge_expired()
+        except Exception as e:
+            logger.error(f"Cache cleanup failed: {e}")
 
 
 _cleanup_thread = threading.Thread(target=_cleanup_expired, daemon=True)
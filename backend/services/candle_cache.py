@@ -0,0 +1,381 @@
+"""
+OHLC Candle Cache
+Per-stock daily candles from Stock_History held as sorted parallel arrays,
+with week/month rollups per (stock_id, interval), for GET /stocks/history.
+
+- Daily candles are loaded by range: a stock's array holds every day from
+  `daily_from` onward and is extended backwards only when a request reaches
+  further back. Ranges are served by binary search over date ordinals.
+- Week/month rollups are read from the persisted 'week'/'month' rows
+  (services/candle_rollups.py): a multi-year monthly chart loads ~60 rows plus
+  the daily rows of its edge buckets. Stocks whose history has not been rolled
+  up yet fall back to building the rollup from the full daily history.
+- Writers (the history gap-fill job, the EOD candle job,
+  backfill_historical_data) call apply_daily(); cached rollup buckets from the
+  earliest changed day onward are recomputed when the daily array covers them,
+  otherwise the rollup is dropped and re-read from the (already updated) DB.
+- Other processes' writes are picked up by re-querying only days newer than
+  the last cached one and re-reading the rollups, at most every
+  CANDLE_CACHE_RECHECK_SECONDS.
+
+Bounded to CANDLE_CACHE_MAX_STOCKS stocks (least recently used evicted).
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db_pool import get_connection
+from services.candle_rollups import bucket_end
+
+logger = logging.getLogger(__name__)
+
+MAX_STOCKS = int(os.getenv("CANDLE_CACHE_MAX_STOCKS", "500"))
+RECHECK_SECONDS = float(os.getenv("CANDLE_CACHE_RECHECK_SECONDS", "300"))
+
+# How far back from to_date last_day() looks in the cached daily array
+# before asking the DB for the latest candle
+_RECENT_DAYS = 31
+
+# (date, open, high, low, close, volume)
+DailyRow = Tuple[date, float, float, float, float, int]
+
+
+def _bucket_start(ordinal: int, interval: str) -> int:
+    if interval == "week":
+        return ordinal - date.fromordinal(ordinal).weekday()
+    d = date.fromordinal(ordinal)
+    return date(d.year, d.month, 1).toordinal()
+
+
+def _to_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+class _Series:
+    """Sorted parallel arrays keyed by date ordinal (day or bucket start)."""
+
+    __slots__ = ("keys", "open", "high", "low", "close", "volume")
+
+    def __init__(self):
+        self.keys = array("l")
+        self.open = array("d")
+        self.high = array("d")
+        self.low = array("d")
+        self.close = array("d")
+        self.volume = array("q")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[DailyRow]) -> "_Series":
+        series = cls()
+        for d, o, h, l, c, v in rows:
+            series.upsert(_to_date(d).toordinal(), float(o), float(h), float(l), float(c), int(v or 0))
+        return series
+
+    def upsert(self, key: int, o: float, h: float, l: float, c: float, v: int) -> None:
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            self.open[i], self.high[i], self.low[i], self.close[i], self.volume[i] = o, h, l, c, v
+            return
+        self.keys.insert(i, key)
+        self.open.insert(i, o)
+        self.high.insert(i, h)
+        self.low.insert(i, l)
+        self.close.insert(i, c)
+        self.volume.insert(i, v)
+
+    def truncate(self, n: int) -> None:
+        for arr in (self.keys, self.open, self.high, self.low, self.close, self.volume):
+            del arr[n:]
+
+    def span(self, lo_key: int, hi_key: int) -> Tuple[int, int]:
+        """Index range [i, j) of keys within [lo_key, hi_key]."""
+        return bisect.bisect_left(self.keys, lo_key), bisect.bisect_right(self.keys, hi_key)
+
+    def aggregate(self, i: int, j: int) -> Optional[Tuple[float, float, float, float, int]]:
+        if i >= j:
+            return None
+        return (self.open[i], max(self.high[i:j]), min(self.low[i:j]), self.close[j - 1], sum(self.volume[i:j]))
+
+    def candles(self, i: int, j: int) -> List[Dict]:
+        return [
+            {
+                "time": date.fromordinal(self.keys[k]).strftime("%Y-%m-%d"),
+                "open": self.open[k],
+                "high": self.high[k],
+                "low": self.low[k],
+                "close": self.close[k],
+                "volume": self.volume[k],
+            }
+            for k in range(i, j)
+        ]
+
+
+class _StockCandles:
+    __slots__ = ("daily", "daily_from", "rollups", "checked_at")
+
+    def __init__(self):
+        self.daily = _Series()
+        self.daily_from: Optional[int] = None  # every stored day >= this ordinal is in `daily`
+        self.rollups: Dict[str, _Series] = {}
+        self.checked_at = time.monotonic()
+
+    def apply(self, rows: Iterable[DailyRow], update_rollups: bool = True) -> None:
+        earliest = None
+        for d, o, h, l, c, v in rows:
+            key = _to_date(d).toordinal()
+            self.daily.upsert(key, float(o), float(h), float(l), float(c), int(v or 0))
+            earliest = key if earliest is None else min(earliest, key)
+        if earliest is None or not update_rollups:
+            return
+        for interval in list(self.rollups):
+            start = _bucket_start(earliest, interval)
+            if self.daily_from is not None and self.daily_from <= start:
+                self._rebuild_from(self.rollups[interval], interval, start)
+            else:
+                # Daily array does not reach back to the bucket: re-read the persisted rollup
+                del self.rollups[interval]
+
+    def rollup(self, interval: str) -> _Series:
+        """Rollup built from the daily array (stocks without persisted rollups)."""
+        series = self.rollups.get(interval)
+        if series is None:
+            series = _Series()
+            if len(self.daily):
+                self._rebuild_from(series, interval, _bucket_start(self.daily.keys[0], interval))
+            self.rollups[interval] = series
+        return series
+
+    def _rebuild_from(self, rollup: _Series, interval: str, start_key: int) -> None:
+        """Recompute rollup buckets starting at start_key (a bucket start)."""
+        rollup.truncate(bisect.bisect_left(rollup.keys, start_key))
+        daily = self.daily
+        i = bisect.bisect_left(daily.keys, start_key)
+        while i < len(daily):
+            bucket = _bucket_start(daily.keys[i], interval)
+            j = i
+            while j < len(daily) and _bucket_start(daily.keys[j], interval) == bucket:
+                j += 1
+            rollup.upsert(bucket, *daily.aggregate(i, j))
+            i = j
+
+    def last_day(self) -> Optional[date]:
+        return date.fromordinal(self.daily.keys[-1]) if len(self.daily) else None
+
+    def range(self, interval: str, from_date: date, to_date: date,
+              rollup: Optional[_Series] = None, head: Optional[_Series] = None) -> List[Dict]:
+        """Candles in [from_date, to_date]. Edge buckets only partly inside the
+        range are aggregated from the in-range days, as the old handler did;
+        `head` holds the first bucket's days when the daily array starts later."""
+        daily = self.daily
+        lo, hi = from_date.toordinal(), to_date.toordinal()
+        if interval == "day":
+            return daily.candles(*daily.span(lo, hi))
+
+        rollup = rollup if rollup is not None else self.rollup(interval)
+        first_bucket, last_bucket = _bucket_start(lo, interval), _bucket_start(hi, interval)
+        out: List[Dict] = []
+
+        def partial(series: _Series, bucket: int, start: int, end: int) -> None:
+            agg = series.aggregate(*series.span(start, end))
+            if agg is not None:
+                out.append({"time": date.fromordinal(bucket).strftime("%Y-%m-%d"), "open": agg[0],
+                            "high": agg[1], "low": agg[2], "close": agg[3], "volume": agg[4]})
+
+        if first_bucket == last_bucket:
+            partial(daily, first_bucket, lo, hi)
+            return out
+        # A first bucket starting exactly at `lo` is whole: take the rollup row
+        i, j = rollup.span(first_bucket if lo == first_bucket else first_bucket + 1, last_bucket - 1)
+        if lo != first_bucket:
+            partial(head if head is not None else daily, first_bucket, lo, bucket_end(from_date, interval).toordinal())
+        out.extend(rollup.candles(i, j))
+        partial(daily, last_bucket, last_bucket, hi)
+        return out
+
+
+class CandleCache:
+    def __init__(self, max_stocks: int = MAX_STOCKS):
+        self.max_stocks = max(1, max_stocks)
+        self._lock = threading.RLock()
+        self._stocks: "OrderedDict[int, _StockCandles]" = OrderedDict()
+        self.stats = {
+            "hits": 0, "loads": 0, "rechecks": 0, "evictions": 0, "rows_applied": 0,
+            "rollup_loads": 0, "rollup_fallbacks": 0,
+        }
+
+    @staticmethod
+    def _fetch(sql: str, params: tuple) -> List[tuple]:
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _query(self, stock_id: int, since: Optional[date] = None, until: Optional[date] = None) -> List[DailyRow]:
+        """Daily candles of one stock in [since, until] (either end open)."""
+        sql = (
+            "SELECT timestamp, open_price, high_price, low_price, close_price, volume "
+            "FROM Stock_History WHERE stock_id = %s AND timeframe = 'day'"
+        )
+        params: tuple = (stock_id,)
+        if since is not None:
+            sql += " AND timestamp >= %s"
+            params += (since,)
+        if until is not None:
+            sql += " AND timestamp < %s"
+            params += (until + timedelta(days=1),)
+        return self._fetch(sql + " ORDER BY timestamp ASC", params)
+
+    def _entry(self, stock_id: int) -> _StockCandles:
+        with self._lock:
+            entry = self._stocks.get(stock_id)
+            if entry is None:
+                entry = self._stocks[stock_id] = _StockCandles()
+                while len(self._stocks) > self.max_stocks:
+                    self._stocks.popitem(last=False)
+                    self.stats["evictions"] += 1
+                return entry
+            self._stocks.move_to_end(stock_id)
+            self.stats["hits"] += 1
+            if entry.daily_from is None or time.monotonic() - entry.checked_at <= RECHECK_SECONDS:
+                return entry
+            last = entry.last_day()
+            since = last + timedelta(days=1) if last is not None else date.fromordinal(entry.daily_from)
+        # Pick up days appended by other processes (EOD job in the leader); their
+        # rollup rows may fall before the daily window, so re-read those too
+        rows = self._query(stock_id, since=since)
+        with self._lock:
+            entry.apply(rows, update_rollups=False)
+            entry.rollups.clear()
+            entry.checked_at = time.monotonic()
+            self.stats["rechecks"] += 1
+        return entry
+
+    def _ensure_daily(self, stock_id: int, entry: _StockCandles, from_key: int) -> None:
+        """Extend the stock's daily array back to the `from_key` ordinal."""
+        with self._lock:
+            have = entry.daily_from
+        if have is not None and have <= from_key:
+            return
+        until = date.fromordinal(have - 1) if have is not None else None
+        rows = self._query(stock_id, since=date.fromordinal(from_key), until=until)
+        with self._lock:
+            # Older days are already reflected in the persisted rollups
+            entry.apply(rows, update_rollups=False)
+            if entry.daily_from is None or from_key < entry.daily_from:
+                entry.daily_from = from_key
+            self.stats["loads"] += 1
+
+    def _ensure_rollup(self, stock_id: int, entry: _StockCandles, interval: str) -> _Series:
+        with self._lock:
+            series = entry.rollups.get(interval)
+        if series is not None:
+            return series
+        first = self._fetch(
+            "SELECT MIN(timestamp) FROM Stock_History WHERE stock_id = %s AND timeframe = 'day'",
+            (stock_id,),
+        )
+        first_day = _to_date(first[0][0]) if first and first[0][0] is not None else None
+        if first_day is not None:
+            rows = self._fetch(
+                "SELECT timestamp, open_price, high_price, low_price, close_price, volume "
+                "FROM Stock_History WHERE stock_id = %s AND timeframe = %s ORDER BY timestamp ASC",
+                (stock_id, interval),
+            )
+            # Persisted rollups are complete once they reach back to the first daily candle
+            if rows and _to_date(rows[0][0]).toordinal() <= _bucket_start(first_day.toordinal(), interval):
+                series = _Series.from_rows(rows)
+                with self._lock:
+                    self.stats["rollup_loads"] += 1
+                    return entry.rollups.setdefault(interval, series)
+            # Not rolled up yet (scripts/backfill_candle_rollups.py): build from the daily history
+            self._ensure_daily(stock_id, entry, first_day.toordinal())
+        with self._lock:
+            self.stats["rollup_fallbacks"] += 1
+            return entry.rollup(interval)
+
+    def candles(self, stock_id: int, interval: str, from_date: date, to_date: date) -> List[Dict]:
+        entry = self._entry(stock_id)
+        lo, hi = from_date.toordinal(), to_date.toordinal()
+        if interval == "day":
+            self._ensure_daily(stock_id, entry, lo)
+            with self._lock:
+                return entry.range(interval, from_date, to_date)
+
+        rollup = self._ensure_rollup(stock_id, entry, interval)
+        first_bucket, last_bucket = _bucket_start(lo, interval), _bucket_start(hi, interval)
+        # Daily rows are only needed for the partial edge buckets
+        self._ensure_daily(stock_id, entry, max(lo, last_bucket))
+        head = None
+        if lo != first_bucket and first_bucket != last_bucket and entry.daily_from > lo:
+            head = _Series.from_rows(self._query(stock_id, since=from_date, until=bucket_end(from_date, interval)))
+        with self._lock:
+            return entry.range(interval, from_date, to_date, rollup, head)
+
+    def last_day(self, stock_id: int, to_date: date) -> Optional[date]:
+        """Date of the latest daily candle on or before to_date, for gap checks."""
+        entry = self._entry(stock_id)
+        hi = to_date.toordinal()
+        self._ensure_daily(stock_id, entry, hi - _RECENT_DAYS)
+        with self._lock:
+            j = bisect.bisect_right(entry.daily.keys, hi)
+            if j:
+                return date.fromordinal(entry.daily.keys[j - 1])
+        # Nothing recent: the latest candle (if any) is older than the cached window
+        latest = self._fetch(
+            "SELECT MAX(timestamp) FROM Stock_History "
+            "WHERE stock_id = %s AND timeframe = 'day' AND timestamp < %s",
+            (stock_id, to_date + timedelta(days=1)),
+        )
+        return _to_date(latest[0][0]) if latest and latest[0][0] is not None else None
+
+    def apply_daily(self, stock_id: int, rows: Iterable[DailyRow]) -> None:
+        """Merge upserted daily candles into a cached stock (no-op if not cached)."""
+        with self._lock:
+            entry = self._stocks.get(stock_id)
+            if entry is None:
+                return
+            rows = list(rows)
+            entry.apply(rows)
+            self.stats["rows_applied"] += len(rows)
+
+    def apply_daily_rows(self, rows: Iterable[Tuple]) -> None:
+        """Bulk variant for (stock_id, date, open, high, low, close, volume) rows."""
+        by_stock: Dict[int, List[DailyRow]] = {}
+        for stock_id, d, o, h, l, c, v in rows:
+            by_stock.setdefault(stock_id, []).append((d, o, h, l, c, v))
+        for stock_id, stock_rows in by_stock.items():
+            self.apply_daily(stock_id, stock_rows)
+
+    def invalidate(self, stock_id: Optional[int] = None) -> None:
+        with self._lock:
+            if stock_id is None:
+                self._stocks.clear()
+            else:
+                self._stocks.pop(stock_id, None)
+
+    def status(self) -> Dict:
+        return {"stocks": len(self._stocks), "max_stocks": self.max_stocks, **self.stats}
+
+
+_candle_cache = CandleCache()
+
+
+def get_candle_cache() -> CandleCache:
+    return _candle_cache
+
+
+def get_candle_cache_stats() -> Dict:
+    return _candle_cache.status()
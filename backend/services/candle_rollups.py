@@ -0,0 +1,157 @@
+"""
+Persisted Week/Month Candle Rollups
+'week' and 'month' rows in Stock_History (timestamp = bucket start: Monday /
+1st of month) derived from the 'day' rows, so long-range charts read one row
+per bucket instead of every daily candle.
+
+Writers of daily candles (the EOD candle job, backfill_historical_data,
+scripts/backfill_recent_candles.py, the history gap-fill job) call
+upsert_rollups() before committing; only the buckets containing the written
+days are recomputed, from the daily rows of just those buckets. For the EOD
+job that is the current week and month of each stock.
+
+History written before rollups existed is rolled up once with
+scripts/backfill_candle_rollups.py (rebuild_rollups per stock).
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+ROLLUP_INTERVALS = ("week", "month")
+
+# Stocks per SELECT ... IN (...) when reading the daily rows back
+_CHUNK = 500
+
+_UPSERT_SQL = """
+    INSERT INTO Stock_History (stock_id, timeframe, timestamp, open_price, high_price, low_price, close_price, volume)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+      open_price=VALUES(open_price),
+      high_price=VALUES(high_price),
+      low_price=VALUES(low_price),
+      close_price=VALUES(close_price),
+      volume=VALUES(volume)
+"""
+
+
+def to_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def bucket_start(day: date, interval: str) -> date:
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    return date(day.year, day.month, 1)
+
+
+def bucket_end(day: date, interval: str) -> date:
+    """Last calendar day of the bucket containing `day`."""
+    if interval == "week":
+        return bucket_start(day, interval) + timedelta(days=6)
+    first_of_next = date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return first_of_next - timedelta(days=1)
+
+
+def aggregate(daily_rows: Iterable[tuple], interval: str, buckets: Optional[Set[date]] = None) -> List[tuple]:
+    """Roll (date, open, high, low, close, volume) rows, sorted by date, up to
+    (bucket_start, open, high, low, close, volume); only `buckets` if given."""
+    out: List[tuple] = []
+    current = None
+    for d, o, h, l, c, v in daily_rows:
+        bucket = bucket_start(to_date(d), interval)
+        if buckets is not None and bucket not in buckets:
+            continue
+        if current is None or current[0] != bucket:
+            if current is not None:
+                out.append(tuple(current))
+            current = [bucket, float(o), float(h), float(l), float(c), int(v or 0)]
+        else:
+            current[2] = max(current[2], float(h))
+            current[3] = min(current[3], float(l))
+            current[4] = float(c)
+            current[5] += int(v or 0)
+    if current is not None:
+        out.append(tuple(current))
+    return out
+
+
+def _daily_rows(cursor, stock_ids: List[int], since: date, until: date) -> Dict[int, List[tuple]]:
+    placeholders = ",".join(["%s"] * len(stock_ids))
+    cursor.execute(
+        f"""
+        SELECT stock_id, timestamp, open_price, high_price, low_price, close_price, volume
+        FROM Stock_History
+        WHERE timeframe = 'day' AND stock_id IN ({placeholders})
+          AND timestamp >= %s AND timestamp < %s
+        ORDER BY stock_id, timestamp
+        """,
+        (*stock_ids, since, until + timedelta(days=1)),
+    )
+    by_stock: Dict[int, List[tuple]] = {}
+    for row in cursor.fetchall():
+        by_stock.setdefault(row[0], []).append(row[1:])
+    return by_stock
+
+
+def upsert_rollups(conn, days_by_stock: Dict[int, Iterable]) -> int:
+    """Recompute and upsert the week/month buckets containing the given days.
+
+    `days_by_stock` maps stock_id -> days just written (date or datetime). Runs
+    on `conn` without committing, so callers commit it with the daily rows.
+    Returns the number of rollup rows upserted.
+    """
+    # Group stocks by the span of daily rows their buckets cover: the EOD job
+    # touches the same (current) week/month for every stock -> one query per chunk
+    wanted: Dict[int, Dict[str, Set[date]]] = {}
+    spans: Dict[Tuple[date, date], List[int]] = {}
+    for stock_id, days in days_by_stock.items():
+        days = {to_date(d) for d in days}
+        if not days:
+            continue
+        wanted[stock_id] = {iv: {bucket_start(d, iv) for d in days} for iv in ROLLUP_INTERVALS}
+        since = min(bucket_start(min(days), iv) for iv in ROLLUP_INTERVALS)
+        until = max(bucket_end(max(days), iv) for iv in ROLLUP_INTERVALS)
+        spans.setdefault((since, until), []).append(stock_id)
+    if not wanted:
+        return 0
+
+    rows: List[tuple] = []
+    cursor = conn.cursor()
+    try:
+        for (since, until), stock_ids in spans.items():
+            for i in range(0, len(stock_ids), _CHUNK):
+                daily = _daily_rows(cursor, stock_ids[i:i + _CHUNK], since, until)
+                for stock_id, stock_rows in daily.items():
+                    for interval in ROLLUP_INTERVALS:
+                        for bucket, o, h, l, c, v in aggregate(stock_rows, interval, wanted[stock_id][interval]):
+                            rows.append((stock_id, interval, bucket, o, h, l, c, v))
+        if rows:
+            cursor.executemany(_UPSERT_SQL, rows)
+    finally:
+        cursor.close()
+    return len(rows)
+
+
+def rebuild_rollups(conn, stock_id: int) -> int:
+    """Recompute every week/month bucket of one stock from its full daily history."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT timestamp, open_price, high_price, low_price, close_price, volume
+            FROM Stock_History
+            WHERE stock_id = %s AND timeframe = 'day'
+            ORDER BY timestamp
+            """,
+            (stock_id,),
+        )
+        daily = cursor.fetchall()
+        rows = [
+            (stock_id, interval, *bucket)
+            for interval in ROLLUP_INTERVALS
+            for bucket in aggregate(daily, interval)
+        ]
+        if rows:
+            cursor.executemany(_UPSERT_SQL, rows)
+    finally:
+        cursor.close()
+    return len(rows)
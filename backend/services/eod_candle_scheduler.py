@@ -7,6 +7,8 @@ from datetime import datetime, date
 from db_pool import get_connection
 from utils.market_hours import is_eod_update_window, get_current_ist_time
 from services.live_price_cache import get_all_cached_prices
+from services.candle_cache import get_candle_cache
+from services.candle_rollups import upsert_rollups
 
 logger = logging.getLogger(__name__)
 
@@ -93,9 +95,13 @@ class _EODCandleJob:
                 rows.append((stock_id, ts, float(o), float(h), float(l), float(c), int(volume)))
             if rows:
                 cursor.executemany(sql, rows)
-                conn.commit()
                 inserted = cursor.rowcount
-                logger.info(f"EOD: Upserted {len(rows)} daily candles")
+                # Same transaction: recompute only the current week/month bucket per stock
+                rollups = upsert_rollups(conn, {r[0]: (ts,) for r in rows})
+                conn.commit()
+                logger.info(f"EOD: Upserted {len(rows)} daily candles and {rollups} week/month rollups")
+                # Extend cached charts by today's candle (recomputes only the current week/month)
+                get_candle_cache().apply_daily_rows(rows)
             else:
                 logger.info("EOD: No rows to upsert after validation")
         except Exception as e:
@@ -0,0 +1,213 @@
+"""
+History Gap Fill
+Background Upstox historical-candle fetches for GET /stocks/history, so a slow
+Upstox response never holds a request worker or the user's chart.
+
+The handler serves what Stock_History (via the candle cache) already has and,
+when the last candle is older than to_date, calls enqueue_gap_fill(); the
+response carries "stale": true while a fill for that range is pending.
+
+Jobs are keyed by (stock_id, from_date, to_date):
+- a key already queued or running in this process is not queued again (the
+  pending set); a finished key is not retried for HISTORY_FILL_COOLDOWN_SECONDS
+  (e.g. today's candle before EOD), tracked by a marker in the response cache
+- across workers, a fill is claimed with the response cache's lease
+  (services/cache_service.py), which is atomic only when CACHE_BACKEND is
+  sqlite or redis; with the default per-process memory backend both the
+  dedupe and the cooldown are per worker
+- at most HISTORY_FILL_MAX_PENDING keys wait for HISTORY_FILL_WORKERS threads
+- a job upserts the daily candles and their week/month rollups, merges them
+  into the candle cache, then emits 'history_ready' {symbol, from, to, count}
+  to the symbol's Socket.IO room so open charts refetch
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Dict, Optional, Set, Tuple
+
+from db_pool import get_connection
+from services.cache_service import get_cache
+from services.candle_cache import get_candle_cache
+from services.candle_rollups import upsert_rollups
+from services.http_client import upstox_get
+from services.stock_registry import StockRef
+
+logger = logging.getLogger(__name__)
+
+FILL_WORKERS = max(1, int(os.getenv("HISTORY_FILL_WORKERS", "2")))
+MAX_PENDING = int(os.getenv("HISTORY_FILL_MAX_PENDING", "256"))
+COOLDOWN_SECONDS = int(os.getenv("HISTORY_FILL_COOLDOWN_SECONDS", "300"))
+FILL_TIMEOUT_SECONDS = int(os.getenv("HISTORY_FILL_TIMEOUT_SECONDS", "10"))
+
+_DONE = "done"
+
+_UPSERT_SQL = """
+    INSERT INTO Stock_History (stock_id, timeframe, timestamp, open_price, high_price, low_price, close_price, volume)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+      open_price=VALUES(open_price),
+      high_price=VALUES(high_price),
+      low_price=VALUES(low_price),
+      close_price=VALUES(close_price),
+      volume=VALUES(volume)
+"""
+
+FillKey = Tuple[int, date, date]
+
+
+def _marker_key(key: FillKey) -> str:
+    stock_id, from_date, to_date = key
+    return f"history_fill:{stock_id}:{from_date:%Y-%m-%d}:{to_date:%Y-%m-%d}"
+
+
+def _parse_day(ts_iso: str) -> date:
+    try:
+        return datetime.fromisoformat(ts_iso.replace("Z", "+00:00")).date()
+    except Exception:
+        # Fallback: take date part
+        return datetime.strptime(ts_iso[:10], "%Y-%m-%d").date()
+
+
+class HistoryGapFill:
+    def __init__(self, workers: int = FILL_WORKERS, max_pending: int = MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending: Set[FillKey] = set()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.stats = {
+            "enqueued": 0, "coalesced": 0, "recently_filled": 0, "rejected_full": 0,
+            "completed": 0, "failed": 0, "candles": 0,
+        }
+
+    def enqueue(self, stock: StockRef, from_date: date, to_date: date) -> bool:
+        """Queue a fill of [from_date, to_date] for the stock unless one is
+        pending or just finished. True while a fill is pending (data stale)."""
+        key: FillKey = (stock.stock_id, from_date, to_date)
+        if key in self._pending:
+            self.stats["coalesced"] += 1
+            return True
+        cache = get_cache()
+        if cache.get(_marker_key(key)) == _DONE:
+            self.stats["recently_filled"] += 1
+            return False
+        with self._lock:
+            if key in self._pending:
+                self.stats["coalesced"] += 1
+                return True
+            if len(self._pending) >= self.max_pending:
+                self.stats["rejected_full"] += 1
+                return False
+            self._pending.add(key)
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="HistoryGapFill")
+        # Atomic claim across workers on a shared backend (held for the whole fill)
+        token = cache.try_lease(_marker_key(key), COOLDOWN_SECONDS)
+        if token is None:
+            with self._lock:
+                self._pending.discard(key)
+            self.stats["coalesced"] += 1
+            return True
+        try:
+            self._pool.submit(self._run, stock, key, token)
+        except RuntimeError:
+            # Pool shut down (interpreter exiting)
+            self._finish(key, token, ok=False)
+            return False
+        self.stats["enqueued"] += 1
+        return True
+
+    def _finish(self, key: FillKey, token: str, ok: bool) -> None:
+        cache = get_cache()
+        if ok:
+            # Cooldown marker first, so no worker re-claims the key in between
+            cache.set(_marker_key(key), _DONE, ttl_seconds=COOLDOWN_SECONDS)
+        # On failure the next request may retry straight away
+        cache.release_lease(_marker_key(key), token)
+        with self._lock:
+            self._pending.discard(key)
+
+    def _run(self, stock: StockRef, key: FillKey, token: str) -> None:
+        ok = False
+        try:
+            count = self._fill(stock, key)
+            ok = True
+            self.stats["completed"] += 1
+            self.stats["candles"] += count
+            if count:
+                from services.websocket_manager import emit_history_ready
+                emit_history_ready(stock.symbol, {
+                    "symbol": stock.symbol.upper(),
+                    "from": f"{key[1]:%Y-%m-%d}",
+                    "to": f"{key[2]:%Y-%m-%d}",
+                    "count": count,
+                })
+        except Exception as e:
+            self.stats["failed"] += 1
+            # Common issues: 400 = invalid date range/instrument, 429 = rate limit, timeout = network
+            logger.warning(f"[history_gap_fill] {stock.symbol} {key[1]}..{key[2]} failed ({type(e).__name__}): {e}")
+        finally:
+            self._finish(key, token, ok)
+
+    @staticmethod
+    def _fill(stock: StockRef, key: FillKey) -> int:
+        """Fetch the range from Upstox and store it. Returns candles upserted."""
+        token = os.environ.get("UPSTOX_ACCESS_TOKEN")
+        if not token or not stock.isin:
+            return 0
+        stock_id, from_date, to_date = key
+        exchange = (stock.exchange or "NSE").upper()
+        instrument_key = f"{exchange}_EQ|{stock.isin}"
+        url = f"https://api.upstox.com/v2/historical-candle/{instrument_key}/day/{from_date:%Y-%m-%d}/{to_date:%Y-%m-%d}"
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Authorization": f"Bearer {token}",
+        }
+        resp = upstox_get(url, headers=headers, timeout=FILL_TIMEOUT_SECONDS, max_retries=2)
+        resp.raise_for_status()
+        payload = resp.json() or {}
+        if payload.get("status") != "success":
+            raise RuntimeError(f"Upstox returned status {payload.get('status')!r}")
+        candles = payload.get("data", {}).get("candles", []) or []
+        # row = [ts, open, high, low, close, volume, oi]
+        insert_rows = [
+            (stock_id, "day", _parse_day(row[0]), float(row[1] or 0), float(row[2] or 0),
+             float(row[3] or 0), float(row[4] or 0), int(row[5] or 0))
+            for row in candles
+        ]
+        if not insert_rows:
+            return 0
+
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(_UPSERT_SQL, insert_rows)
+            upsert_rollups(conn, {stock_id: [r[2] for r in insert_rows]})
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+        # Merge the upserted days into the cache instead of re-querying
+        get_candle_cache().apply_daily(stock_id, [r[2:] for r in insert_rows])
+        logger.info(f"[history_gap_fill] {stock.symbol}: upserted {len(insert_rows)} candles ({from_date}..{to_date})")
+        return len(insert_rows)
+
+    def status(self) -> Dict:
+        return {"pending": len(self._pending), "workers": self.workers, "max_pending": self.max_pending, **self.stats}
+
+
+_gap_fill = HistoryGapFill()
+
+
+def enqueue_gap_fill(stock: StockRef, from_date: date, to_date: date) -> bool:
+    return _gap_fill.enqueue(stock, from_date, to_date)
+
+
+def get_gap_fill_stats() -> Dict:
+    return _gap_fill.status()
@@ -3,7 +3,8 @@ import time
 from typing import Optional
 
 from services.cache_service import get_cache
-from routes.fetch_routes.stock_price_fetch_routes import _top_movers_query
+from routes.fetch_routes.stock_price_fetch_routes import _top_movers_query, _most_active_query
+from utils.market_hours import should_use_websocket
 from services.news_service import fetch_latest_news
 from flask import current_app
 
@@ -25,6 +26,47 @@ class _HotCacheRefresher:
     def stop(self):
         self._stop.set()
 
+    @staticmethod
+    def _live_movers_ready() -> bool:
+        if not should_use_websocket():
+            return False
+        try:
+            from services.live_price_cache import get_price_store
+            return len(get_price_store()) > 0
+        except Exception:
+            return False
+
+    @staticmethod
+    def _warm_db_movers(cache, exchange: str, limit: int, intraday: bool):
+        """Prime the DB-snapshot movers keys used by the routes off-hours."""
+        try:
+            gainers = cache.get_or_compute_stale(
+                f"gainers:{exchange}:{limit}:{intraday}",
+                lambda: _top_movers_query(order="DESC", limit=limit, exchange=exchange, use_intraday=intraday),
+                ttl_seconds=10,
+                stale_ttl_seconds=120,
+            )
+            losers = cache.get_or_compute_stale(
+                f"losers:{exchange}:{limit}:{intraday}",
+                lambda: _top_movers_query(order="ASC", limit=limit, exchange=exchange, use_intraday=intraday),
+                ttl_seconds=10,
+                stale_ttl_seconds=120,
+            )
+            active = cache.get_or_compute_stale(
+                f"active:{exchange}:{limit}",
+                lambda: _most_active_query(limit, exchange),
+                ttl_seconds=10,
+                stale_ttl_seconds=120,
+            )
+            cache.get_or_compute_stale(
+                f"movers_all:{exchange}:{limit}:{intraday}",
+                lambda: {"gainers": gainers, "losers": losers, "mostActive": active["data"]},
+                ttl_seconds=10,
+                stale_ttl_seconds=120,
+            )
+        except Exception as e:
+            print(f"[HOT CACHE] movers warm error: {e}")
+
     def _run(self):
         cache = get_cache()
         exchange = "NSE"
@@ -34,71 +76,14 @@ class _HotCacheRefresher:
         while not self._stop.is_set():
             t0 = time.perf_counter()
             try:
-                # Movers (gainers/losers/active and aggregated)
-                for limit in limits:
-                    for intraday in intraday_opts:
-                        cache.get_or_compute_stale(
-                            f"gainers:{exchange}:{limit}:{intraday}",
-                            lambda e=exchange, l=limit, i=intraday: _top_movers_query(
-                                order="DESC", limit=l, exchange=e, use_intraday=i
-                            ),
-                            ttl_seconds=10,
-                            stale_ttl_seconds=120,
-                        )
-                        cache.get_or_compute_stale(
-                            f"losers:{exchange}:{limit}:{intraday}",
-                            lambda e=exchange, l=limit, i=intraday: _top_movers_query(
-                                order="ASC", limit=l, exchange=e, use_intraday=i
-                            ),
-                            ttl_seconds=10,
-                            stale_ttl_seconds=120,
-                        )
-                        # Active is computed inside movers_all too, but warm directly as well
-                        from routes.fetch_routes.stock_price_fetch_routes import most_active as _most_active_route
-                        try:
-                            # Call the underlying function's internal compute via cache key
-                            active_key = f"active:{exchange}:{limit}"
-                            def _fetch_active_internal():
-                                # replicate internal most active compute
-                                from routes.fetch_routes.stock_price_fetch_routes import most_active as _ignored
-                                # We can't import the inner function directly; let route handler compute on demand.
-                                # Here, just trigger computation by calling cache get_or_compute_stale in the handler path on next request.
-                                return _ignored()
-                            # We won't call the Flask route; just ensure cache is primed via movers_all below
-                            pass
-                        except Exception:
-                            pass
-                        # Aggregated movers_all
-                        from routes.fetch_routes.stock_price_fetch_routes import movers_all as _movers_all_route
-                        try:
-                            # Simulate calling compute without HTTP by directly priming cache
-                            key = f"movers_all:{exchange}:{limit}:{intraday}"
-                            def _compute_all():
-                                # Reuse cache-driven internals by calling the route's compute indirectly
-                                # We avoid returning a Flask Response; instead compute parts here
-                                gainers = cache.get_or_compute_stale(
-                                    f"gainers:{exchange}:{limit}:{intraday}",
-                                    lambda e=exchange, l=limit, i=intraday: _top_movers_query(
-                                        order="DESC", limit=l, exchange=e, use_intraday=i
-                                    ),
-                                    ttl_seconds=10,
-                                    stale_ttl_seconds=120,
-                                )
-                                losers = cache.get_or_compute_stale(
-                                    f"losers:{exchange}:{limit}:{intraday}",
-                                    lambda e=exchange, l=limit, i=intraday: _top_movers_query(
-                                        order="ASC", limit=l, exchange=e, use_intraday=i
-                                    ),
-                                    ttl_seconds=10,
-                                    stale_ttl_seconds=120,
-                                )
-                                # Most active uses same SQL as route
-                                from routes.fetch_routes.stock_price_fetch_routes import most_active
-                                # We can't get the dict result directly without Flask context; skip deep warm.
-                                return {"gainers": gainers, "losers": losers, "mostActive": []}
-                            cache.get_or_compute_stale(key, _compute_all, ttl_seconds=10, stale_ttl_seconds=120)
-                        except Exception:
-                            pass
+                # Movers (gainers/losers/active and aggregated). During market
+                # hours the live leaderboards in services.movers_engine are kept
+                # up to date on every price batch and the routes read them
+                # directly, so there is nothing to precompute.
+                if not self._live_movers_ready():
+                    for limit in limits:
+                        for intraday in intraday_opts:
+                            self._warm_db_movers(cache, exchange, limit, intraday)
 
                 # Indices DB cache (when not using WebSocket). We just call the function to populate cache path.
                 try:
@@ -1,4 +1,6 @@
+import os
 import random
+import threading
 import time
 from typing import Dict, Optional
 
@@ -12,6 +14,46 @@ from services.metrics import metrics
 DEFAULT_TIMEOUT = 10
 
 
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens/second, bursts up to `capacity`.
+
+    Shared by every Upstox REST caller in the process so concurrent fetchers
+    stay under the account's request-rate limit instead of tripping 429s.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = max(0.1, float(rate))
+        self.capacity = float(capacity) if capacity else self.rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until `tokens` are available. Returns seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+# Process-wide limiter for Upstox REST (UPSTOX_MAX_RPS, default 10 req/s)
+upstox_rate_limiter = TokenBucket(
+    rate=float(os.getenv("UPSTOX_MAX_RPS", "10")),
+    capacity=float(os.getenv("UPSTOX_BURST", os.getenv("UPSTOX_MAX_RPS", "10"))),
+)
+
+
 def _sleep_backoff(attempt: int, base: float = 1.0, cap: float = 8.0) -> None:
     # Exponential backoff with jitter
     delay = min(cap, base * (2 ** (attempt - 1)))
@@ -27,15 +69,19 @@ def upstox_get(
     timeout: int = DEFAULT_TIMEOUT,
     max_retries: int = 3,
     label: str = "upstox_rest",
+    rate_limited: bool = True,
 ) -> requests.Response:
     """GET wrapper for Upstox REST with basic retries/backoff and metrics.
 
     - Counts every HTTP attempt
+    - Waits on the shared token bucket before each attempt (rate_limited=True)
     - Retries 429 and 5xx with exponential backoff
     - Returns Response or raises the last exception
     """
     last_err = None
     for attempt in range(1, max_retries + 1):
+        if rate_limited:
+            upstox_rate_limiter.acquire()
         metrics.record_call(label)
         try:
             resp = requests.get(
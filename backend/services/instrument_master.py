@@ -0,0 +1,264 @@
+"""
+Instrument Master Service
+Shared, cached access to the Upstox BOD instrument files.
+
+Previously get_all_nse_instruments downloaded and gunzipped NSE.csv.gz on every
+fetch_all_stock_prices tick (every 10s in market hours) and fetch_indices pulled
+complete.json.gz separately. Now each file is:
+- revalidated at most once per trading day with If-None-Match/If-Modified-Since
+  (a 304 costs a round trip, not a multi-MB download)
+- parsed once into a compact tab-separated file under INSTRUMENT_CACHE_DIR, so a
+  restart the same day reloads from disk without touching the network
+- held in memory as an InstrumentIndex (instrument_key <-> symbol <-> ISIN)
+
+Only the NSE_INDEX/BSE_INDEX rows of complete.json.gz are kept (fetch_indices
+resolves index keys from them); the other segments are discarded while parsing
+so the multi-exchange file never stays resident.
+
+If a download fails, the last good copy (memory, then disk) is served and the
+next attempt waits INSTRUMENT_RETRY_SECONDS, so a slow or down assets host
+does not add a DOWNLOAD_TIMEOUT stall to every caller.
+"""
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional
+
+import certifi
+import requests
+
+from utils.pretty_log import status_ok, status_warn
+
+logger = logging.getLogger(__name__)
+
+ASSETS_BASE_URL = "https://assets.upstox.com/market-quote/instruments/exchange"
+CACHE_DIR = os.getenv(
+    "INSTRUMENT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".instrument_cache"),
+)
+DOWNLOAD_TIMEOUT = 15
+# Wait after a failed download before trying again
+RETRY_SECONDS = float(os.getenv("INSTRUMENT_RETRY_SECONDS", "300"))
+
+
+class Instrument(NamedTuple):
+    instrument_key: str
+    segment: str
+    trading_symbol: str
+    isin: str
+    name: str
+
+
+class InstrumentIndex:
+    """Read-only lookups over one instrument file (rebuilt, never mutated)."""
+
+    def __init__(self, instruments: List[Instrument]):
+        self.instruments = instruments
+        self.by_key: Dict[str, Instrument] = {}
+        self.symbol_by_key: Dict[str, str] = {}
+        self._key_by_symbol: Dict[tuple, str] = {}
+        self._key_by_isin: Dict[tuple, str] = {}
+        for inst in instruments:
+            self.by_key[inst.instrument_key] = inst
+            self.symbol_by_key[inst.instrument_key] = inst.trading_symbol
+            if inst.trading_symbol:
+                self._key_by_symbol.setdefault((inst.segment, inst.trading_symbol.upper()), inst.instrument_key)
+            if inst.isin:
+                self._key_by_isin.setdefault((inst.segment, inst.isin), inst.instrument_key)
+
+    def __len__(self) -> int:
+        return len(self.instruments)
+
+    def symbol_for_key(self, instrument_key: str) -> Optional[str]:
+        return self.symbol_by_key.get(instrument_key)
+
+    def key_for_symbol(self, symbol: str, segment: str = "NSE_EQ") -> Optional[str]:
+        return self._key_by_symbol.get((segment, symbol.upper()))
+
+    def key_for_isin(self, isin: str, segment: str = "NSE_EQ") -> Optional[str]:
+        return self._key_by_isin.get((segment, isin))
+
+    def isin_for_symbol(self, symbol: str, segment: str = "NSE_EQ") -> Optional[str]:
+        key = self.key_for_symbol(symbol, segment)
+        return self.by_key[key].isin if key else None
+
+
+def _parse_csv(raw: bytes) -> List[Instrument]:
+    """NSE.csv.gz: instrument_key, exchange_token, tradingsymbol, name, ..."""
+    out: List[Instrument] = []
+    with gzip.open(io.BytesIO(raw), "rt", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # Skip header
+        for parts in reader:
+            if len(parts) < 3:
+                continue
+            instrument_key = parts[0]
+            segment, _, suffix = instrument_key.partition("|")
+            # Equity keys are SEGMENT|ISIN
+            isin = suffix if segment.endswith("_EQ") else ""
+            name = parts[3] if len(parts) > 3 else ""
+            out.append(Instrument(instrument_key, segment, parts[2], isin, name))
+    return out
+
+
+def _parse_json_indices(raw: bytes) -> List[Instrument]:
+    """complete.json.gz: list of {instrument_key, segment, trading_symbol, isin, name, ...};
+    keeps only the *_INDEX segments."""
+    with gzip.GzipFile(fileobj=io.BytesIO(raw)) as gz_file:
+        records = json.loads(gz_file.read().decode("utf-8"))
+    return [
+        Instrument(
+            rec.get("instrument_key") or "",
+            rec.get("segment") or "",
+            rec.get("trading_symbol") or "",
+            rec.get("isin") or "",
+            rec.get("name") or "",
+        )
+        for rec in records
+        if rec.get("instrument_key") and (rec.get("segment") or "").upper().endswith("_INDEX")
+    ]
+
+
+def _clean(value: str) -> str:
+    return value.replace("\t", " ").replace("\n", " ")
+
+
+class _InstrumentFile:
+    """One Upstox instrument file with its on-disk compact copy and validators."""
+
+    def __init__(self, name: str, filename: str, parser):
+        self.name = name
+        self.url = f"{ASSETS_BASE_URL}/{filename}"
+        self._parser = parser
+        self._lock = threading.Lock()
+        self._index: Optional[InstrumentIndex] = None
+        self._meta: Dict[str, str] = {}
+        self._failed_at: Optional[float] = None
+        self._last_error: Optional[Exception] = None
+        self.stats = {"downloads": 0, "not_modified": 0, "disk_loads": 0, "failures": 0}
+
+    @property
+    def _data_path(self) -> str:
+        return os.path.join(CACHE_DIR, f"{self.name}.tsv")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(CACHE_DIR, f"{self.name}.meta.json")
+
+    def _write_disk(self, instruments: List[Instrument]) -> None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write-then-rename so concurrent workers never read a half-written file
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=f".{self.name}.")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for inst in instruments:
+                f.write("\t".join(_clean(v) for v in inst) + "\n")
+        os.replace(tmp, self._data_path)
+        self._save_meta()
+
+    def _save_meta(self) -> None:
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=f".{self.name}.")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._meta, f)
+        os.replace(tmp, self._meta_path)
+
+    def _read_disk(self) -> Optional[InstrumentIndex]:
+        try:
+            with open(self._meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(self._data_path, encoding="utf-8") as f:
+                instruments = [Instrument(*line.rstrip("\n").split("\t")) for line in f if line.strip()]
+        except (OSError, ValueError, TypeError):
+            return None
+        self._meta = meta
+        self.stats["disk_loads"] += 1
+        return InstrumentIndex(instruments)
+
+    def _revalidate(self) -> None:
+        """Conditional GET; replaces the index on 200, just re-dates it on 304."""
+        headers = {}
+        if self._index is not None:
+            if self._meta.get("etag"):
+                headers["If-None-Match"] = self._meta["etag"]
+            if self._meta.get("last_modified"):
+                headers["If-Modified-Since"] = self._meta["last_modified"]
+        resp = requests.get(self.url, headers=headers, timeout=DOWNLOAD_TIMEOUT, verify=certifi.where())
+        if resp.status_code == 304 and self._index is not None:
+            self.stats["not_modified"] += 1
+            self._meta["checked_on"] = date.today().isoformat()
+            try:
+                self._save_meta()
+            except OSError as e:
+                status_warn(f"Instrument cache write failed ({self.name}): {e}")
+            return
+        resp.raise_for_status()
+        instruments = self._parser(resp.content)
+        self._meta = {
+            "etag": resp.headers.get("ETag", ""),
+            "last_modified": resp.headers.get("Last-Modified", ""),
+            "checked_on": date.today().isoformat(),
+        }
+        self._index = InstrumentIndex(instruments)
+        self.stats["downloads"] += 1
+        try:
+            self._write_disk(instruments)
+        except OSError as e:
+            status_warn(f"Instrument cache write failed ({self.name}): {e}")
+        status_ok(f"Instrument master {self.name}: {len(instruments)} instruments downloaded")
+
+    def get(self) -> InstrumentIndex:
+        today = date.today().isoformat()
+        with self._lock:
+            if self._index is not None and self._meta.get("checked_on") == today:
+                return self._index
+            if self._index is None:
+                self._index = self._read_disk()
+                if self._index is not None and self._meta.get("checked_on") == today:
+                    return self._index
+            if self._failed_at is not None and time.monotonic() - self._failed_at < RETRY_SECONDS:
+                if self._index is None:
+                    raise self._last_error
+                return self._index
+            try:
+                self._revalidate()
+                self._failed_at = None
+                self._last_error = None
+            except Exception as e:
+                self.stats["failures"] += 1
+                self._failed_at = time.monotonic()
+                self._last_error = e
+                if self._index is None:
+                    raise
+                status_warn(f"Instrument master {self.name} refresh failed, using cached copy "
+                            f"(retry in {RETRY_SECONDS:.0f}s): {e}")
+            return self._index
+
+    def invalidate(self) -> None:
+        """Force a revalidation on the next get() (the data itself is kept)."""
+        with self._lock:
+            self._meta.pop("checked_on", None)
+            self._failed_at = None
+
+
+_nse = _InstrumentFile("NSE", "NSE.csv.gz", _parse_csv)
+_indices = _InstrumentFile("indices", "complete.json.gz", _parse_json_indices)
+
+
+def get_nse_index() -> InstrumentIndex:
+    """NSE instruments (NSE.csv.gz), refreshed at most once per day."""
+    return _nse.get()
+
+
+def get_index_instruments() -> InstrumentIndex:
+    """NSE_INDEX/BSE_INDEX instruments from complete.json.gz, refreshed at most once per day."""
+    return _indices.get()
+
+
+def get_instrument_master_stats() -> Dict[str, Dict[str, int]]:
+    return {f.name: dict(f.stats) for f in (_nse, _indices)}
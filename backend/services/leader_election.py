@@ -0,0 +1,195 @@
+"""
+Leader Election
+Ensures exactly one process runs ingestion and the background schedulers
+(stock, index, hot cache, EOD) when gunicorn runs several workers.
+
+Every worker calls start(on_elected); the winner runs on_elected once, the
+others keep retrying and consume the leader's output (DB rows, the tick bus,
+the shared price table). Backends (LEADER_ELECTION):
+- file  (default) - fcntl.flock on LEADER_LOCK_FILE; the kernel releases the
+  lock when the holder dies, so a crashed leader is replaced on the next retry
+- mysql - GET_LOCK(LEADER_LOCK_NAME) on a dedicated connection; works across
+  hosts sharing the database
+- none  - every process is leader (single-process / local dev)
+
+The lease is renewed every LEADER_RENEW_SECONDS (heartbeat written to the lock
+file, or the MySQL lock re-checked). Schedulers cannot be stopped cleanly
+mid-flight, so a leader that loses its lease exits and gunicorn respawns it
+as a follower rather than risk two ingesting processes.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.getenv("LEADER_ELECTION", "file").lower()
+LOCK_FILE = os.getenv(
+    "LEADER_LOCK_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".leader.lock"),
+)
+LOCK_NAME = os.getenv("LEADER_LOCK_NAME", "mockmarket_scheduler_leader")
+RENEW_SECONDS = float(os.getenv("LEADER_RENEW_SECONDS", "10"))
+RETRY_SECONDS = float(os.getenv("LEADER_RETRY_SECONDS", "15"))
+
+
+class _FileLease:
+    def __init__(self, path: str):
+        self._path = path
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        import fcntl
+
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        self.renew()
+        return True
+
+    def renew(self) -> bool:
+        # flock is held for as long as the fd is open; the heartbeat only makes
+        # the current leader visible to operators (cat .leader.lock)
+        if self._fd is None:
+            return False
+        data = json.dumps({"pid": os.getpid(), "renewed_at": time.time()}).encode()
+        try:
+            os.ftruncate(self._fd, 0)
+            os.pwrite(self._fd, data, 0)
+        except OSError as e:
+            logger.warning(f"[leader] heartbeat write failed (lock still held): {e}")
+        return True
+
+
+class _MySQLLease:
+    def __init__(self, name: str):
+        self._name = name
+        self._conn = None
+
+    def _connect(self):
+        import mysql.connector
+        from db_pool import _parse_database_config
+
+        # Dedicated connection: the lock lives and dies with this session
+        return mysql.connector.connect(**_parse_database_config())
+
+    def try_acquire(self) -> bool:
+        conn = self._connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (self._name,))
+            (got,) = cursor.fetchone()
+        finally:
+            cursor.close()
+        if got == 1:
+            self._conn = conn
+            return True
+        conn.close()
+        return False
+
+    def renew(self) -> bool:
+        if self._conn is None:
+            return False
+        try:
+            cursor = self._conn.cursor()
+            try:
+                cursor.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (self._name,))
+                (held,) = cursor.fetchone()
+            finally:
+                cursor.close()
+            return held == 1
+        except Exception as e:
+            logger.error(f"[leader] MySQL lease check failed: {e}")
+            return False
+
+
+class LeaderElector:
+    def __init__(self, backend: str):
+        self.backend = backend
+        self.is_leader = False
+        self._lease = None
+        if backend == "mysql":
+            self._lease = _MySQLLease(LOCK_NAME)
+        elif backend != "none":
+            self._lease = _FileLease(LOCK_FILE)
+        self._thread: Optional[threading.Thread] = None
+        self._on_elected: Optional[Callable[[], None]] = None
+        self.stats = {"attempts": 0, "renewals": 0, "elected_at": None}
+
+    def _try_acquire(self) -> bool:
+        self.stats["attempts"] += 1
+        if self._lease is None:
+            return True
+        try:
+            return self._lease.try_acquire()
+        except Exception as e:
+            logger.warning(f"[leader] {self.backend} lock attempt failed: {e}")
+            return False
+
+    def _become_leader(self) -> None:
+        self.is_leader = True
+        self.stats["elected_at"] = time.time()
+        logger.info(f"[leader] pid {os.getpid()} elected leader ({self.backend})")
+        if self._on_elected:
+            try:
+                self._on_elected()
+            except Exception as e:
+                logger.error(f"[leader] leader services failed to start: {e}")
+
+    def _run(self) -> None:
+        while not self.is_leader:
+            time.sleep(RETRY_SECONDS)
+            if self._try_acquire():
+                self._become_leader()
+        if self._lease is None:
+            return
+        while True:
+            time.sleep(RENEW_SECONDS)
+            if self._lease.renew():
+                self.stats["renewals"] += 1
+                continue
+            logger.critical(f"[leader] pid {os.getpid()} lost the {self.backend} lease; exiting so a follower takes over")
+            os._exit(3)
+
+    def start(self, on_elected: Callable[[], None]) -> bool:
+        """Try to become leader now; keep trying (and renewing) in the background.
+
+        on_elected runs in the caller's thread if leadership is won immediately,
+        otherwise on the election thread. Returns whether this process leads now.
+        """
+        if self._thread is not None:
+            return self.is_leader
+        self._on_elected = on_elected
+        if self._try_acquire():
+            self._become_leader()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="LeaderElection")
+        self._thread.start()
+        return self.is_leader
+
+    def status(self) -> Dict:
+        return {"backend": self.backend, "is_leader": self.is_leader, "pid": os.getpid(), **self.stats}
+
+
+_elector: Optional[LeaderElector] = None
+
+
+def get_leader_elector() -> LeaderElector:
+    global _elector
+    if _elector is None:
+        backend = BACKEND if BACKEND in {"file", "mysql", "none"} else "file"
+        if backend == "file" and os.name == "nt":
+            # No fcntl on Windows; local dev there is single-process anyway
+            backend = "none"
+        _elector = LeaderElector(backend)
+    return _elector
+
+
+def is_leader() -> bool:
+    return _elector is not None and _elector.is_leader
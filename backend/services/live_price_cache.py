@@ -4,166 +4,422 @@ Maintains in-memory cache of latest stock prices from WebSocket broadcasts.
 Extended to hold day_open and prev_close for real-time movers computation.
 Used by order execution and gainers/losers endpoints to get real-time prices
 without additional API calls or DB writes during market hours.
+
+Storage is columnar: a stock_id -> slot index plus contiguous float64 arrays
+(ltp/open/high/low/prev_close/updated_at). A tick only overwrites array cells,
+so no per-stock dicts are allocated, and snapshots are plain array copies.
+Missing values are stored as NaN and surfaced as None by the function API.
+A secondary upper-cased symbol -> slot index makes symbol lookups O(1).
+day_high/day_low come from the quote's OHLC (rolling LTP min/max only when a
+quote has none); the day columns are reset on the first write of a new IST date.
 """
-from typing import Optional, Dict, List
+from array import array
+from math import isnan
+from typing import Callable, Optional, Dict, List
 from threading import RLock
-from datetime import datetime
+from datetime import date, datetime
+import time
+
+from utils.market_hours import get_current_ist_time
+
+_NAN = float("nan")
+
+
+def _opt(value: float) -> Optional[float]:
+    """NaN -> None for the dict-based compatibility API."""
+    return None if isnan(value) else value
+
+
+class LivePriceStore:
+    """Columnar live price table keyed by stock_id.
+
+    Slots are append-only for the lifetime of the process (the NSE universe is
+    ~2000 instruments), so a slot number stays valid across snapshots.
+    """
+
+    def __init__(self):
+        self.lock = RLock()
+        self._slots: Dict[int, int] = {}
+        self._symbol_slots: Dict[str, int] = {}  # upper-cased symbol -> slot
+        self.stock_ids = array("q")
+        self.symbols: List[str] = []
+        self.ltp = array("d")
+        self.day_open = array("d")
+        self.day_high = array("d")
+        self.day_low = array("d")
+        self.prev_close = array("d")
+        self.updated_at = array("d")  # epoch seconds
+        # IST trading date the day_open/high/low columns belong to
+        self.day: Optional[date] = None
+        # Bumped on clear() and on a new trading day so derived structures
+        # (leaderboards, shared table) rebuild from the columns
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self.stock_ids)
+
+    def slot_of(self, stock_id: int) -> Optional[int]:
+        return self._slots.get(stock_id)
+
+    def slot_of_symbol(self, symbol: str) -> Optional[int]:
+        return self._symbol_slots.get(symbol.upper())
+
+    def _index_symbol(self, slot: int, symbol: str) -> None:
+        old = self.symbols[slot]
+        if old == symbol:
+            return
+        if old and self._symbol_slots.get(old.upper()) == slot:
+            del self._symbol_slots[old.upper()]
+        self.symbols[slot] = symbol
+        if symbol:
+            self._symbol_slots[symbol.upper()] = slot
+
+    def _slot_for_write(self, stock_id: int, symbol: str) -> int:
+        slot = self._slots.get(stock_id)
+        if slot is None:
+            slot = len(self.stock_ids)
+            self._slots[stock_id] = slot
+            self.stock_ids.append(stock_id)
+            self.symbols.append("")
+            for col in (self.ltp, self.day_open, self.day_high, self.day_low, self.prev_close, self.updated_at):
+                col.append(_NAN)
+            self._index_symbol(slot, symbol)
+        elif symbol:
+            self._index_symbol(slot, symbol)
+        return slot
+
+    def start_day(self, day: date) -> None:
+        """Reset the day columns when the trading date changes. Caller must hold self.lock."""
+        if day == self.day:
+            return
+        if self.day is not None:
+            blank = array("d", [_NAN]) * len(self.stock_ids)
+            self.day_open[:] = blank
+            self.day_high[:] = blank
+            self.day_low[:] = blank
+            self.generation += 1
+        self.day = day
+
+    def write(self, stock_id: int, symbol: str, ltp: float, day_open: Optional[float],
+              prev_close: Optional[float], now: float, day_high: Optional[float] = None,
+              day_low: Optional[float] = None) -> int:
+        """Write one tick. Caller must hold self.lock. Returns the slot."""
+        slot = self._slot_for_write(stock_id, symbol)
+        self.ltp[slot] = ltp
+        # Quote OHLC when present, else rolling high/low from observed LTPs
+        # (NaN comparisons are False)
+        high = self.day_high[slot]
+        if day_high is not None:
+            self.day_high[slot] = float(day_high)
+        elif isnan(high) or ltp > high:
+            self.day_high[slot] = ltp
+        low = self.day_low[slot]
+        if day_low is not None:
+            self.day_low[slot] = float(day_low)
+        elif isnan(low) or ltp < low:
+            self.day_low[slot] = ltp
+        if day_open is not None:
+            self.day_open[slot] = float(day_open)
+        elif isnan(self.day_open[slot]):
+            self.day_open[slot] = ltp
+        if prev_close is not None:
+            self.prev_close[slot] = float(prev_close)
+        self.updated_at[slot] = now
+        return slot
+
+    def clear(self) -> None:
+        self.generation += 1
+        self.day = None
+        self._slots.clear()
+        self._symbol_slots.clear()
+        self.symbols.clear()
+        for col in (self.stock_ids, self.ltp, self.day_open, self.day_high,
+                    self.day_low, self.prev_close, self.updated_at):
+            del col[:]
+
+    def snapshot(self) -> Dict[str, object]:
+        """Copy all columns under the lock (memcpy-speed), for lock-free reading."""
+        with self.lock:
+            return {
+                "stock_id": array("q", self.stock_ids),
+                "symbol": list(self.symbols),
+                "ltp": array("d", self.ltp),
+                "day_open": array("d", self.day_open),
+                "day_high": array("d", self.day_high),
+                "day_low": array("d", self.day_low),
+                "prev_close": array("d", self.prev_close),
+                "updated_at": array("d", self.updated_at),
+            }
+
+
+_store = LivePriceStore()
+_cache_lock = _store.lock
+
+# Called with the list of written slots after each update (outside the lock)
+_write_listeners: List[Callable[[List[int]], None]] = []
+
+
+def register_write_listener(fn: Callable[[List[int]], None]) -> None:
+    """Subscribe to cache writes, e.g. to maintain incremental leaderboards."""
+    if fn not in _write_listeners:
+        _write_listeners.append(fn)
+
+
+def _notify_write(slots: List[int]) -> None:
+    for fn in _write_listeners:
+        try:
+            fn(slots)
+        except Exception as e:
+            print(f"[WARN] live price cache listener failed: {e}")
+
 
-# In-memory cache: {stock_id: {"ltp": float, "symbol": str, "day_open": float|None,
-#                               "prev_close": float|None, "day_high": float|None, "day_low": float|None,
-#                               "timestamp": datetime}}
-_live_price_cache: Dict[int, Dict] = {}
-_cache_lock = RLock()
+def get_price_store() -> LivePriceStore:
+    """Return the process-wide columnar store (for vectorised readers)."""
+    return _store
 
 
-def update_price_cache(stock_id: int, symbol: str, ltp: float, day_open: Optional[float] = None, prev_close: Optional[float] = None):
+def update_price_cache(stock_id: int, symbol: str, ltp: float, day_open: Optional[float] = None,
+                       prev_close: Optional[float] = None, day_high: Optional[float] = None,
+                       day_low: Optional[float] = None):
     """
     Update the live price cache for a stock
     Called by the stock fetcher/WebSocket broadcaster
     """
     with _cache_lock:
-        existing = _live_price_cache.get(stock_id)
-        # Initialize or update rolling high/low
-        if existing:
-            day_high = existing.get("day_high")
-            day_low = existing.get("day_low")
-        else:
-            day_high = None
-            day_low = None
-
-        if day_high is None or ltp > day_high:
-            day_high = ltp
-        if day_low is None or ltp < day_low:
-            day_low = ltp
-
-        _live_price_cache[stock_id] = {
-            "ltp": ltp,
-            "symbol": symbol,
-            "day_open": day_open if day_open is not None else (existing.get("day_open") if existing else ltp),
-            "prev_close": prev_close if prev_close is not None else (existing.get("prev_close") if existing else None),
-            "day_high": day_high,
-            "day_low": day_low,
-            "timestamp": datetime.now()
-        }
+        _store.start_day(get_current_ist_time().date())
+        slot = _store.write(stock_id, symbol, float(ltp), day_open, prev_close, time.time(),
+                            day_high, day_low)
+    _notify_write([slot])
 
 
 def update_price_cache_batch(updates: list):
     """
     Update multiple prices at once (more efficient)
-    updates: list of {stock_id, symbol, ltp}
+    updates: list of {stock_id, symbol, ltp} plus optional day_open,
+    prev_close, day_high, day_low
     """
+    slots = []
     with _cache_lock:
-        now = datetime.now()
+        _store.start_day(get_current_ist_time().date())
+        now = time.time()
+        write = _store.write
         for item in updates:
             stock_id = item.get("stock_id")
             if not stock_id:
                 continue
-            ltp = float(item.get("ltp", 0))
-            symbol = item.get("symbol", "")
-            day_open = item.get("day_open")
-            prev_close = item.get("prev_close")
-            existing = _live_price_cache.get(stock_id)
-            day_high = existing.get("day_high") if existing else None
-            day_low = existing.get("day_low") if existing else None
-            if day_high is None or ltp > day_high:
-                day_high = ltp
-            if day_low is None or ltp < day_low:
-                day_low = ltp
-            _live_price_cache[stock_id] = {
-                "ltp": ltp,
-                "symbol": symbol,
-                "day_open": day_open if day_open is not None else (existing.get("day_open") if existing else ltp),
-                "prev_close": prev_close if prev_close is not None else (existing.get("prev_close") if existing else None),
-                "day_high": day_high,
-                "day_low": day_low,
-                "timestamp": now
-            }
+            slots.append(write(
+                stock_id,
+                item.get("symbol", ""),
+                float(item.get("ltp", 0)),
+                item.get("day_open"),
+                item.get("prev_close"),
+                now,
+                item.get("day_high"),
+                item.get("day_low"),
+            ))
+    if slots:
+        _notify_write(slots)
 
 
 def get_cached_price_by_stock_id(stock_id: int) -> Optional[float]:
     """
     Get the latest live price for a stock by stock_id
     Returns None if not in cache
+    Falls back to the leader's shared price table in non-ingesting workers.
     """
     with _cache_lock:
-        entry = _live_price_cache.get(stock_id)
-        if entry:
-            return entry["ltp"]
-        return None
+        slot = _store.slot_of(stock_id)
+        if slot is not None:
+            return _opt(_store.ltp[slot])
+    shared = read_shared_price(stock_id)
+    return _opt(shared.ltp) if shared is not None else None
 
 
 def get_cached_price_by_symbol(symbol: str) -> Optional[float]:
     """
     Get the latest live price for a stock by symbol
     Returns None if not in cache
+    Falls back to the leader's shared price table in non-ingesting workers.
     """
     with _cache_lock:
-        for entry in _live_price_cache.values():
-            if entry["symbol"].upper() == symbol.upper():
-                return entry["ltp"]
-        return None
+        slot = _store.slot_of_symbol(symbol)
+        if slot is not None:
+            return _opt(_store.ltp[slot])
+    shared = read_shared_price_by_symbol(symbol)
+    return _opt(shared.ltp) if shared is not None else None
+
+
+def get_cached_prices_by_symbols(symbols: List[str]) -> Dict[str, Optional[float]]:
+    """
+    Batch variant of get_cached_price_by_symbol (single lock acquisition).
+    Returns {symbol: ltp or None}, keyed by the symbols as passed in.
+    """
+    result: Dict[str, Optional[float]] = {}
+    missing: List[str] = []
+    with _cache_lock:
+        for symbol in symbols:
+            slot = _store.slot_of_symbol(symbol)
+            if slot is None:
+                missing.append(symbol)
+            else:
+                result[symbol] = _opt(_store.ltp[slot])
+    for symbol in missing:
+        shared = read_shared_price_by_symbol(symbol)
+        result[symbol] = _opt(shared.ltp) if shared is not None else None
+    return result
+
+
+def _update_row(symbol: str, stock_id: int, ltp: float, day_open: float, day_high: float,
+                day_low: float, prev_close: float, updated_at: float) -> Dict:
+    return {
+        "symbol": symbol.upper(),
+        "stock_id": stock_id,
+        "ltp": ltp,
+        "day_open": _opt(day_open),
+        "day_high": _opt(day_high),
+        "day_low": _opt(day_low),
+        "prev_close": _opt(prev_close),
+        "as_of": datetime.fromtimestamp(updated_at).isoformat(),
+    }
+
+
+def get_cached_updates_by_symbols(symbols: List[str]) -> List[Dict]:
+    """
+    Cached prices for `symbols` as price update rows (the shape the pipeline
+    broadcasts: symbol, stock_id, ltp, day_open, day_high, day_low,
+    prev_close, as_of).
+    Symbols not in cache, or without an ltp, are left out. Local misses are
+    read from the leader's shared price table.
+    """
+    rows: List[Dict] = []
+    missing: List[str] = []
+    with _cache_lock:
+        for symbol in symbols:
+            slot = _store.slot_of_symbol(symbol)
+            if slot is None:
+                missing.append(symbol)
+            elif not isnan(_store.ltp[slot]):
+                rows.append(_update_row(
+                    _store.symbols[slot], _store.stock_ids[slot], _store.ltp[slot],
+                    _store.day_open[slot], _store.day_high[slot], _store.day_low[slot],
+                    _store.prev_close[slot], _store.updated_at[slot],
+                ))
+    for symbol in missing:
+        shared = read_shared_price_by_symbol(symbol)
+        if shared is not None and not isnan(shared.ltp):
+            rows.append(_update_row(
+                symbol, shared.stock_id, shared.ltp, shared.day_open, shared.day_high,
+                shared.day_low, shared.prev_close, shared.updated_at,
+            ))
+    return rows
 
 
 def get_cache_age_seconds(stock_id: int) -> Optional[float]:
     """
     Get how old the cached price is in seconds
     Returns None if not in cache
+    Falls back to the leader's shared price table in non-ingesting workers.
     """
     with _cache_lock:
-        entry = _live_price_cache.get(stock_id)
-        if entry:
-            age = (datetime.now() - entry["timestamp"]).total_seconds()
-            return age
-        return None
+        slot = _store.slot_of(stock_id)
+        if slot is not None:
+            return time.time() - _store.updated_at[slot]
+    shared = read_shared_price(stock_id)
+    return time.time() - shared.updated_at if shared is not None else None
 
 
 def get_cache_stats() -> Dict:
     """Get statistics about the cache"""
     with _cache_lock:
         return {
-            "total_stocks": len(_live_price_cache),
-            "cache_keys": list(_live_price_cache.keys())[:10]  # First 10 for debugging
+            "total_stocks": len(_store),
+            "cache_keys": list(_store.stock_ids[:10]),  # First 10 for debugging
         }
 
 
 def clear_cache():
     """Clear all cached prices (useful for testing)"""
     with _cache_lock:
-        _live_price_cache.clear()
+        _store.clear()
 
 
 def get_all_cached_prices() -> List[Dict]:
     """Return a snapshot list of all cached price entries.
     Each entry includes symbol, ltp, day_open, prev_close, stock_id and timestamp.
+    The lock is only held for the column copy; dicts are built afterwards.
+    Stocks missing from the local store are added from the leader's shared
+    price table, so non-ingesting workers return the full set too.
     """
-    with _cache_lock:
-        result = []
-        for stock_id, data in _live_price_cache.items():
-            entry = {
-                "stock_id": stock_id,
-                "symbol": data.get("symbol"),
-                "ltp": data.get("ltp"),
-                "day_open": data.get("day_open"),
-                "prev_close": data.get("prev_close"),
-                "day_high": data.get("day_high"),
-                "day_low": data.get("day_low"),
-                "timestamp": data.get("timestamp"),
-            }
-            result.append(entry)
-        return result
+    snap = _store.snapshot()
+    ltp, day_open, prev_close = snap["ltp"], snap["day_open"], snap["prev_close"]
+    day_high, day_low, updated_at = snap["day_high"], snap["day_low"], snap["updated_at"]
+    symbols = snap["symbol"]
+    rows = [
+        {
+            "stock_id": stock_id,
+            "symbol": symbols[i],
+            "ltp": _opt(ltp[i]),
+            "day_open": _opt(day_open[i]),
+            "prev_close": _opt(prev_close[i]),
+            "day_high": _opt(day_high[i]),
+            "day_low": _opt(day_low[i]),
+            "timestamp": datetime.fromtimestamp(updated_at[i]),
+        }
+        for i, stock_id in enumerate(snap["stock_id"])
+    ]
+    local = set(snap["stock_id"])
+    rows.extend(
+        {
+            "stock_id": shared.stock_id,
+            "symbol": shared.symbol,
+            "ltp": _opt(shared.ltp),
+            "day_open": _opt(shared.day_open),
+            "prev_close": _opt(shared.prev_close),
+            "day_high": _opt(shared.day_high),
+            "day_low": _opt(shared.day_low),
+            "timestamp": datetime.fromtimestamp(shared.updated_at),
+        }
+        for shared in read_shared_prices()
+        if shared.stock_id not in local
+    )
+    return rows
 
 def get_day_ohlc(stock_id: int) -> Optional[Dict]:
-    """Return current in-memory day OHLC for a stock_id."""
+    """Return current in-memory day OHLC for a stock_id (or from the shared table)."""
     with _cache_lock:
-        data = _live_price_cache.get(stock_id)
-        if not data:
-            return None
+        slot = _store.slot_of(stock_id)
+        if slot is None:
+            return _shared_day_ohlc(stock_id)
         return {
-            "open": data.get("day_open"),
-            "high": data.get("day_high"),
-            "low": data.get("day_low"),
-            "close": data.get("ltp"),
-            "prev_close": data.get("prev_close"),
-            "timestamp": data.get("timestamp"),
-            "symbol": data.get("symbol"),
+            "open": _opt(_store.day_open[slot]),
+            "high": _opt(_store.day_high[slot]),
+            "low": _opt(_store.day_low[slot]),
+            "close": _opt(_store.ltp[slot]),
+            "prev_close": _opt(_store.prev_close[slot]),
+            "timestamp": datetime.fromtimestamp(_store.updated_at[slot]),
+            "symbol": _store.symbols[slot],
         }
+
+
+def _shared_day_ohlc(stock_id: int) -> Optional[Dict]:
+    shared = read_shared_price(stock_id)
+    if shared is None:
+        return None
+    return {
+        "open": _opt(shared.day_open),
+        "high": _opt(shared.day_high),
+        "low": _opt(shared.day_low),
+        "close": _opt(shared.ltp),
+        "prev_close": _opt(shared.prev_close),
+        "timestamp": datetime.fromtimestamp(shared.updated_at),
+        "symbol": shared.symbol,
+    }
+
+
+# Cross-worker mirror: the ingestion leader publishes every write to an mmap
+# table that other gunicorn workers read on a local miss.
+from services.shared_price_table import (  # noqa: E402
+    mirror_slots, read_shared_price, read_shared_price_by_symbol, read_shared_prices,
+)
+
+register_write_listener(mirror_slots)
@@ -0,0 +1,241 @@
+"""
+Live Movers Engine
+Ranks gainers, losers and most-active stocks directly from the columnar live
+price cache, so market-hours movers are ranked on live prices (not on stale
+Stock_Prices rows) and served without touching MySQL.
+
+Leaderboards are maintained incrementally: every live_price_cache write
+re-keys only the touched slots in three sorted lists (intraday %, day-over-day
+%, volatility). Reading top/bottom N is then a walk from either end of a
+ready-made list. A full pass over the cache columns rebuilds the boards when
+they are first used or after the cache has been cleared.
+Company name/exchange are kept per slot next to the boards and resolved from
+the stock registry only for new slots or when the registry reloads, so a read
+costs O(N) plus the entries skipped by the exchange filter.
+Output rows use the same shape as the SQL-backed movers in
+routes/fetch_routes/stock_price_fetch_routes.py.
+"""
+import bisect
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.live_price_cache import get_price_store, register_write_listener
+from services.stock_registry import get_stock_registry
+
+logger = logging.getLogger(__name__)
+
+# Board entry: (sort_key, ltp, slot, ref_price, updated_at)
+# slot is unique per board, so ref_price/updated_at never take part in ordering.
+# ref_price is the base for change % (day_open / prev_close) and prev_close for
+# the volatility board.
+_Entry = Tuple[float, float, int, float, float]
+
+
+class _Leaderboard:
+    """Ascending sorted list of entries with a slot -> entry map for removal."""
+
+    def __init__(self):
+        self._entries: List[_Entry] = []
+        self._by_slot: Dict[int, _Entry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def upsert(self, slot: int, entry: Optional[_Entry]) -> None:
+        old = self._by_slot.pop(slot, None)
+        if old is not None:
+            idx = bisect.bisect_left(self._entries, old)
+            del self._entries[idx]
+        if entry is not None:
+            bisect.insort(self._entries, entry)
+            self._by_slot[slot] = entry
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_slot.clear()
+
+    def take(self, n: int, descending: bool, accept: Callable[[int], bool]) -> List[_Entry]:
+        out: List[_Entry] = []
+        if n <= 0:
+            return out
+        seq = reversed(self._entries) if descending else iter(self._entries)
+        for entry in seq:
+            if accept(entry[2]):
+                out.append(entry)
+                if len(out) >= n:
+                    break
+        return out
+
+
+class _MoversBoards:
+    """Intraday, day-over-day and volatility leaderboards over cache slots."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.intraday = _Leaderboard()
+        self.day_over_day = _Leaderboard()
+        self.volatility = _Leaderboard()
+        self._generation = -1
+        # slot -> (company_name, exchange), None when the stock is not in the registry
+        self._meta: List[Optional[Tuple[Optional[str], Optional[str]]]] = []
+        self._meta_snapshot = None
+        self.stats = {"rebuilds": 0, "incremental_updates": 0}
+
+    @staticmethod
+    def _pct_entry(ltp: float, base: float, slot: int, ts: float) -> Optional[_Entry]:
+        # NaN != NaN filters missing values
+        if base != base or base == 0 or ltp != ltp:
+            return None
+        return ((ltp - base) / base * 100.0, ltp, slot, base, ts)
+
+    @staticmethod
+    def _volatility_entry(ltp: float, high: float, low: float, prev_close: float,
+                          slot: int, ts: float) -> Optional[_Entry]:
+        if not high > low or prev_close != prev_close or prev_close == 0:
+            return None
+        return ((high - low) / prev_close * 100.0, ltp, slot, prev_close, ts)
+
+    def _apply(self, slots, ltp, day_open, high, low, prev_close, updated_at) -> None:
+        for slot in slots:
+            l, ts, pc = ltp[slot], updated_at[slot], prev_close[slot]
+            self.intraday.upsert(slot, self._pct_entry(l, day_open[slot], slot, ts))
+            self.day_over_day.upsert(slot, self._pct_entry(l, pc, slot, ts))
+            self.volatility.upsert(slot, self._volatility_entry(l, high[slot], low[slot], pc, slot, ts))
+
+    def _rebuild_locked(self) -> None:
+        """Full pass over a column snapshot. Caller holds self._lock."""
+        store = get_price_store()
+        snap = store.snapshot()
+        for board in (self.intraday, self.day_over_day, self.volatility):
+            board.clear()
+        self._apply(range(len(snap["stock_id"])), snap["ltp"], snap["day_open"], snap["day_high"],
+                    snap["day_low"], snap["prev_close"], snap["updated_at"])
+        self._generation = store.generation
+        self._meta.clear()
+        self.stats["rebuilds"] += 1
+
+    def _sync_meta_locked(self, store, registry_snapshot) -> List[int]:
+        """Resolve name/exchange for slots added since the last read. Caller
+        holds self._lock. Returns stock_ids the registry does not know."""
+        if registry_snapshot is not self._meta_snapshot:
+            self._meta.clear()
+            self._meta_snapshot = registry_snapshot
+        start = len(self._meta)
+        with store.lock:
+            stock_ids = store.stock_ids[start:]
+        by_id = registry_snapshot.by_id if registry_snapshot is not None else {}
+        missing = []
+        for stock_id in stock_ids:
+            ref = by_id.get(stock_id)
+            if ref is None:
+                missing.append(stock_id)
+                self._meta.append(None)
+            else:
+                self._meta.append((ref.company_name, ref.exchange))
+        return missing
+
+    def on_write(self, slots: List[int]) -> None:
+        """live_price_cache write listener: re-key only the touched slots."""
+        store = get_price_store()
+        with self._lock:
+            if self._generation != store.generation:
+                self._rebuild_locked()
+                return
+            with store.lock:
+                self._apply(slots, store.ltp, store.day_open, store.day_high,
+                            store.day_low, store.prev_close, store.updated_at)
+            self.stats["incremental_updates"] += 1
+
+    def read(self, board_name: str, n: int, descending: bool,
+             exchange: Optional[str]) -> Optional[List[Tuple[_Entry, Optional[str], str]]]:
+        """Top (descending) or bottom n entries of a board as (entry, company_name,
+        symbol), skipping slots not in the registry or not on `exchange`.
+        Returns None when the live cache is empty."""
+        store = get_price_store()
+        if not len(store):
+            return None
+        # Outside self._lock: a registry (re)load queries MySQL
+        registry = get_stock_registry()
+        registry_snapshot = registry.snapshot()
+        with self._lock:
+            if self._generation != store.generation:
+                self._rebuild_locked()
+            missing = self._sync_meta_locked(store, registry_snapshot)
+            meta = self._meta
+
+            def accept(slot: int) -> bool:
+                m = meta[slot] if slot < len(meta) else None
+                return m is not None and (not exchange or m[1] == exchange)
+
+            entries = getattr(self, board_name).take(n, descending, accept)
+            with store.lock:
+                rows = [(entry, meta[entry[2]][0], store.symbols[entry[2]]) for entry in entries]
+        if missing:
+            # Rate-limited reload for unknown ids; picked up on the next read
+            registry.by_ids(missing)
+        return rows
+
+
+_boards = _MoversBoards()
+register_write_listener(_boards.on_write)
+
+
+def get_movers_stats() -> Dict:
+    """Board sizes and maintenance counters (for /metrics and debugging)."""
+    return {
+        **_boards.stats,
+        "intraday_size": len(_boards.intraday),
+        "day_over_day_size": len(_boards.day_over_day),
+        "volatility_size": len(_boards.volatility),
+    }
+
+
+def _mover_row(name, symbol, ltp: float, pct: float, change_value: float, updated_at: float) -> Dict:
+    return {
+        "name": name,
+        "symbol": symbol,
+        "price": f"{ltp:,.2f}",
+        "change": f"{pct:+.2f}%",
+        "priceNum": ltp,
+        "changePercentNum": pct,
+        "changeValueNum": change_value,
+        "asOf": datetime.fromtimestamp(updated_at).isoformat(),
+    }
+
+
+def compute_top_movers(order: str, limit: int, exchange: Optional[str], use_intraday: bool = True) -> Optional[List[Dict]]:
+    """
+    Gainers ("DESC") or losers ("ASC") read from the incremental leaderboards.
+
+    Mirrors the SQL ordering: change_percent then ltp in the same direction.
+    Change % is vs day_open when use_intraday, else vs prev_close.
+    Returns None when the live cache is empty so callers can fall back to SQL.
+    """
+    board = "intraday" if use_intraday else "day_over_day"
+    rows = _boards.read(board, limit, order.upper() == "DESC", exchange)
+    if rows is None:
+        return None
+    return [
+        _mover_row(name, symbol, ltp, pct, ltp - base, ts)
+        for (pct, ltp, _slot, base, ts), name, symbol in rows
+    ]
+
+
+def compute_most_active(limit: int, exchange: Optional[str]) -> Optional[List[Dict]]:
+    """
+    Rank by intraday range as % of prev_close (volatility proxy for volume),
+    matching the SQL most-active query. Returns None when the cache is empty.
+    """
+    entries = _boards.read("volatility", limit, True, exchange)
+    if entries is None:
+        return None
+    rows = []
+    for (volatility, ltp, _slot, prev_close, ts), name, symbol in entries:
+        pct = (ltp - prev_close) / prev_close * 100.0
+        row = _mover_row(name, symbol, ltp, pct, ltp - prev_close, ts)
+        # Pseudo-volume based on volatility (same scaling as the SQL path)
+        row["volume"] = int(volatility * 100000) if volatility else 0
+        rows.append(row)
+    return rows
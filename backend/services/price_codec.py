@@ -0,0 +1,140 @@
+"""
+Binary Price Feed Codec
+Compact, delta-encoded frames for Socket.IO clients that opt in with
+subscribe({"symbols": [...], "format": "binary"}).
+
+Per session the server assigns each subscribed symbol a small integer id and
+sends the mapping once ('prices_dict'). Each 'prices_bin' frame then carries
+only the changed ids and their LTP change in fixed point (PRICE_SCALE units),
+relative to the last value sent to that session:
+
+    header  <BBHI   version, flags, count, as_of (epoch seconds)
+    ids     count x uint16   (little-endian)
+    deltas  count x int16 if flags & FLAG_INT16 else int32   (little-endian)
+
+The first value for a symbol is a delta from 0, i.e. the absolute price, and
+so is the first value after an unsubscribe/subscribe cycle (clients drop their
+baseline for a symbol when they unsubscribe it).
+Ids of unsubscribed symbols are reused: a later 'prices_dict' entry for the
+same id replaces the old mapping, and frames are delivered in order on the
+connection, so no frame with a reused id precedes its dictionary entry. At
+most MAX_SYMBOL_IDS ids are live per session, which keeps them within uint16.
+Clients that do not opt in keep receiving JSON ('prices_diff').
+"""
+import struct
+import sys
+import time
+from array import array
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+FRAME_VERSION = 1
+PRICE_SCALE = 100  # 1 unit = 0.01 (paise)
+FLAG_INT16 = 0x01
+MAX_SYMBOL_IDS = 1 << 16  # ids are packed as uint16
+
+_HEADER = struct.Struct("<BBHI")
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def _le_bytes(values: array) -> bytes:
+    if _BIG_ENDIAN:
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_frame(entries: List[Tuple[int, int]], as_of: Optional[float] = None) -> bytes:
+    """Pack [(symbol_id, fixed_point_delta), ...] into one binary frame."""
+    ids = array("H", (sid for sid, _ in entries))
+    deltas = [delta for _, delta in entries]
+    flags = 0
+    if all(-32768 <= d <= 32767 for d in deltas):
+        flags |= FLAG_INT16
+        packed = array("h", deltas)
+    else:
+        packed = array("i", deltas)
+    header = _HEADER.pack(FRAME_VERSION, flags, len(entries), int(as_of if as_of is not None else time.time()))
+    return header + _le_bytes(ids) + _le_bytes(packed)
+
+
+def decode_frame(frame: bytes) -> Tuple[int, List[Tuple[int, int]]]:
+    """Inverse of encode_frame: returns (as_of, [(symbol_id, delta), ...])."""
+    version, flags, count, as_of = _HEADER.unpack_from(frame)
+    if version != FRAME_VERSION:
+        raise ValueError(f"unsupported frame version {version}")
+    offset = _HEADER.size
+    ids = array("H")
+    ids.frombytes(frame[offset:offset + 2 * count])
+    offset += 2 * count
+    deltas = array("h" if flags & FLAG_INT16 else "i")
+    deltas.frombytes(frame[offset:offset + deltas.itemsize * count])
+    if _BIG_ENDIAN:
+        ids.byteswap()
+        deltas.byteswap()
+    return as_of, list(zip(ids, deltas))
+
+
+class BinaryFeedSession:
+    """Symbol dictionary and last-sent fixed-point prices for one client.
+
+    Not thread-safe on its own; the websocket subscription registry
+    serializes access under its lock.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._last: Dict[int, int] = {}
+        self._free: List[int] = []  # ids released by forget(), reused first
+        self._next_id = 0
+
+    def register(self, symbols: List[str]) -> Dict[int, str]:
+        """Assign ids to symbols without one; returns the new {id: symbol} entries.
+        Symbols beyond MAX_SYMBOL_IDS live ids get none (and are never encoded)."""
+        added = {}
+        for symbol in symbols:
+            if symbol in self._ids:
+                continue
+            if self._free:
+                sid = self._free.pop()
+            elif self._next_id < MAX_SYMBOL_IDS:
+                sid = self._next_id
+                self._next_id += 1
+            else:
+                break
+            self._ids[symbol] = sid
+            added[sid] = symbol
+        return added
+
+    def forget(self, symbol: str) -> None:
+        # Release the id with its baseline; a re-subscribe gets a fresh
+        # dictionary entry and restarts from the absolute price.
+        sid = self._ids.pop(symbol, None)
+        if sid is not None:
+            self._last.pop(sid, None)
+            self._free.append(sid)
+
+    def encode(self, updates: List[Dict[str, Any]]) -> Optional[bytes]:
+        """Encode changed prices for registered symbols; None when nothing changed."""
+        entries: List[Tuple[int, int]] = []
+        as_of = None
+        for u in updates:
+            sid = self._ids.get(u.get("symbol"))
+            ltp = u.get("ltp")
+            if sid is None or ltp is None:
+                continue
+            fixed = int(round(float(ltp) * PRICE_SCALE))
+            delta = fixed - self._last.get(sid, 0)
+            if delta == 0:
+                continue
+            self._last[sid] = fixed
+            entries.append((sid, delta))
+            as_of = u.get("as_of", as_of)
+        if not entries:
+            return None
+        ts = None
+        if isinstance(as_of, str):
+            try:
+                ts = datetime.fromisoformat(as_of).timestamp()
+            except ValueError:
+                ts = None
+        return encode_frame(entries, ts)
@@ -0,0 +1,308 @@
+"""
+Stock Price Ingestion Pipeline
+Decouples quote fetching from everything that happens to a quote afterwards.
+
+    fetch workers ──► [raw] ──► parse ──┬─► [cache] ──► live_price_cache
+                                        ├─► [broadcast] ──► websocket_manager
+                                        └─► [persist] ──► Stock_Prices / Latest_Stock_Prices
+
+Every arrow with brackets is a bounded queue served by its own daemon thread,
+so a slow DB or slow Socket.IO fan-out no longer holds up the next Upstox call:
+- raw, cache and persist queues block when full (backpressure; wait time is
+  recorded so it shows up in /metrics instead of silently slowing the sweep)
+- the broadcast queue never blocks: when full, its oldest batch is merged
+  into the incoming one by symbol (newest update per symbol wins). Batches
+  are slices of a sweep covering different symbols, so nothing is dropped -
+  only superseded ticks of the same symbol are coalesced
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from controller.fetch.stock_prices_fetch.latest_prices import last_written_ltp, persist_price_rows
+from utils.pretty_log import status_ok, status_warn
+
+logger = logging.getLogger(__name__)
+
+
+class PriceRecord(NamedTuple):
+    """Normalized quote; field order matches the Stock_Prices insert."""
+    stock_id: int
+    ltp: float
+    day_high: float
+    day_low: float
+    day_open: float
+    prev_close: float
+    as_of: datetime
+
+
+class RawBatch(NamedTuple):
+    batch_no: int
+    stock_ids: List[int]
+    symbols: List[str]
+    data: Dict[str, Any]  # Upstox /market-quote/quotes "data" object
+    save_to_db: bool
+
+
+class ParsedBatch(NamedTuple):
+    batch_no: int
+    records: List[PriceRecord]
+    updates: List[Dict[str, Any]]  # cache/socket payload, built once per batch
+    save_to_db: bool
+
+
+class _Stage:
+    """One bounded queue plus the worker thread that drains it."""
+
+    def __init__(self, name: str, handler: Callable[[Any], None], maxsize: int,
+                 merge: Optional[Callable[[Any, Any], Any]] = None):
+        self.name = name
+        self._handler = handler
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=maxsize)
+        # When set, a full queue folds its oldest item into the new one instead of blocking
+        self._merge = merge
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {
+            "enqueued": 0,
+            "processed": 0,
+            "coalesced": 0,
+            "errors": 0,
+            "max_depth": 0,
+            "put_wait_seconds": 0.0,
+            "busy_seconds": 0.0,
+        }
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"PricePipeline-{self.name}")
+        self._thread.start()
+
+    def put(self, item: Any) -> None:
+        t0 = time.perf_counter()
+        if self._merge is not None:
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        oldest = self._queue.get_nowait()
+                        self._queue.task_done()
+                    except queue.Empty:
+                        continue
+                    item = self._merge(oldest, item)
+                    with self._lock:
+                        self.stats["coalesced"] += 1
+        else:
+            self._queue.put(item)
+        with self._lock:
+            self.stats["enqueued"] += 1
+            self.stats["put_wait_seconds"] += time.perf_counter() - t0
+            self.stats["max_depth"] = max(self.stats["max_depth"], self._queue.qsize())
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            t0 = time.perf_counter()
+            try:
+                self._handler(item)
+                with self._lock:
+                    self.stats["processed"] += 1
+            except Exception as e:
+                with self._lock:
+                    self.stats["errors"] += 1
+                logger.error(f"[price_pipeline] {self.name} stage error: {e}")
+            finally:
+                with self._lock:
+                    self.stats["busy_seconds"] += time.perf_counter() - t0
+                self._queue.task_done()
+
+    def wait_idle(self, timeout: float) -> bool:
+        """Wait until everything enqueued so far has been handled."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "depth": self._queue.qsize(),
+                "capacity": self._queue.maxsize,
+                "put_wait_seconds": round(self.stats["put_wait_seconds"], 3),
+                "busy_seconds": round(self.stats["busy_seconds"], 3),
+            }
+
+
+def parse_quotes(raw: RawBatch) -> ParsedBatch:
+    """Normalize Upstox quotes into PriceRecords, skipping unchanged LTPs."""
+    data = raw.data
+    records: List[PriceRecord] = []
+    updates: List[Dict[str, Any]] = []
+    skipped_count = 0
+    unchanged_count = 0
+    # Last persisted LTPs from the in-process map (no per-row SELECT)
+    try:
+        last_ltps = last_written_ltp.lookup(raw.stock_ids)
+    except Exception as dedupe_err:
+        status_warn(f"Last-LTP lookup failed, not skipping unchanged prices: {dedupe_err}")
+        last_ltps = {}
+
+    for stock_id, symbol in zip(raw.stock_ids, raw.symbols):
+        stock_quote = data.get(f"NSE_EQ:{symbol}")
+        if stock_quote is None:
+            skipped_count += 1
+            continue
+        ohlc = stock_quote.get('ohlc', {})
+
+        # Better fallback chain for closed/non-trading days
+        ltp = float(stock_quote.get('last_price', 0))
+        if ltp <= 0:
+            ltp = float(stock_quote.get('previous_close', 0))
+        if ltp <= 0:
+            ltp = float(ohlc.get('close', 0))
+
+        net_change = float(stock_quote.get('net_change', 0))
+        prev_close = float(stock_quote.get('previous_close', 0)) or (ltp - net_change)
+
+        # Skip if still no valid price
+        if ltp <= 0:
+            skipped_count += 1
+            continue
+
+        # Skip if unchanged since the last persisted price
+        if last_ltps.get(stock_id) == ltp:
+            unchanged_count += 1
+            continue
+
+        record = PriceRecord(
+            stock_id,
+            ltp,
+            float(ohlc.get('high', ltp)),
+            float(ohlc.get('low', ltp)),
+            float(ohlc.get('open', ltp)),
+            prev_close,
+            datetime.now(),
+        )
+        records.append(record)
+        updates.append({
+            "symbol": symbol.upper(),  # Uppercase for consistency with DB symbols
+            "stock_id": stock_id,  # Add stock_id for cache
+            "ltp": record.ltp,
+            "day_open": record.day_open,
+            # Quote high/low; without OHLC the cache keeps a rolling LTP range
+            "day_high": record.day_high if 'high' in ohlc else None,
+            "day_low": record.day_low if 'low' in ohlc else None,
+            "prev_close": record.prev_close,
+            "as_of": record.as_of.isoformat(),
+        })
+
+    if unchanged_count:
+        print(f"[⏭️] Batch {raw.batch_no}: skipped {unchanged_count} unchanged LTPs")
+    if not raw.save_to_db and not records:
+        status_warn(f"No valid data in batch {raw.batch_no}")
+    return ParsedBatch(raw.batch_no, records, updates, raw.save_to_db)
+
+
+def _update_cache(batch: ParsedBatch) -> None:
+    from services.live_price_cache import update_price_cache_batch
+    update_price_cache_batch(batch.updates)
+
+
+def _merge_for_broadcast(older: ParsedBatch, newer: ParsedBatch) -> ParsedBatch:
+    """One batch carrying both batches' symbols; newer updates win per symbol."""
+    by_symbol = {u["symbol"]: u for u in older.updates}
+    by_symbol.update((u["symbol"], u) for u in newer.updates)
+    return ParsedBatch(newer.batch_no, older.records + newer.records, list(by_symbol.values()), newer.save_to_db)
+
+
+def _broadcast(batch: ParsedBatch) -> None:
+    try:
+        from services.websocket_manager import broadcast_prices
+    except ImportError:
+        return
+    broadcast_prices(batch.updates)
+    if not batch.save_to_db:
+        # During market hours - only WebSocket broadcast
+        status_ok(f"📡 WebSocket: Broadcasted {len(batch.updates)} live prices for batch {batch.batch_no}")
+
+
+class PricePipeline:
+    """Process-wide fetch → parse → cache/broadcast/persist pipeline."""
+
+    def __init__(self, raw_size: int = 32, fanout_size: int = 32, persist_size: int = 64):
+        self.cache = _Stage("cache", _update_cache, fanout_size)
+        self.broadcast = _Stage("broadcast", _broadcast, fanout_size, merge=_merge_for_broadcast)
+        self.persist = _Stage("persist", self._persist, persist_size)
+        self.parse = _Stage("parse", self._parse_and_fan_out, raw_size)
+        self._started = False
+        self._start_lock = threading.Lock()
+        # Only touched by the persist worker; read racily for reporting
+        self.rows_persisted = 0
+
+    def _ensure_started(self) -> None:
+        if self._started:
+            return
+        with self._start_lock:
+            if not self._started:
+                for stage in (self.cache, self.broadcast, self.persist, self.parse):
+                    stage.start()
+                self._started = True
+
+    def _parse_and_fan_out(self, raw: RawBatch) -> None:
+        parsed = parse_quotes(raw)
+        if not parsed.records:
+            return
+        self.cache.put(parsed)
+        self.broadcast.put(parsed)
+        if parsed.save_to_db:
+            self.persist.put(parsed)
+
+    def _persist(self, batch: ParsedBatch) -> None:
+        written = persist_price_rows(batch.records)
+        self.rows_persisted += written
+        status_ok(f"💾 DB: Inserted {written} prices for batch {batch.batch_no}")
+
+    def submit(self, raw: RawBatch) -> None:
+        """Hand a fetched batch to the pipeline (blocks only if parse is saturated)."""
+        self._ensure_started()
+        self.parse.put(raw)
+
+    def wait_persisted(self, timeout: float = 60.0) -> bool:
+        """Block until all submitted batches are parsed and persisted (EOD save)."""
+        deadline = time.monotonic() + timeout
+        if not self.parse.wait_idle(timeout):
+            return False
+        return self.persist.wait_idle(max(0.0, deadline - time.monotonic()))
+
+    def stats(self) -> Dict[str, Any]:
+        stages = {
+            stage.name: stage.snapshot()
+            for stage in (self.parse, self.cache, self.broadcast, self.persist)
+        }
+        return {"stages": stages, "rows_persisted": self.rows_persisted}
+
+
+_pipeline = PricePipeline(
+    raw_size=max(1, int(os.getenv("PRICE_PIPELINE_RAW_QUEUE", "32"))),
+    fanout_size=max(1, int(os.getenv("PRICE_PIPELINE_FANOUT_QUEUE", "32"))),
+    persist_size=max(1, int(os.getenv("PRICE_PIPELINE_PERSIST_QUEUE", "64"))),
+)
+
+
+def get_price_pipeline() -> PricePipeline:
+    return _pipeline
+
+
+def get_pipeline_stats() -> Dict[str, Any]:
+    """Per-stage queue depth, drops and backpressure wait (for /metrics)."""
+    return _pipeline.stats()
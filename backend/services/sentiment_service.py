@@ -21,13 +21,7 @@ def calculate_market_sentiment() -> Dict[str, Any]:
                 CASE WHEN sp.prev_close IS NOT NULL AND sp.prev_close <> 0 
                      THEN ((sp.ltp - sp.prev_close) / sp.prev_close) * 100
                      ELSE NULL END AS change_percent
-            FROM Stock_Prices sp
-            INNER JOIN (
-                SELECT stock_id, MAX(as_of) AS max_as_of
-                FROM Stock_Prices
-                GROUP BY stock_id
-            ) latest
-              ON latest.stock_id = sp.stock_id AND latest.max_as_of = sp.as_of
+            FROM Latest_Stock_Prices sp
             INNER JOIN Stocks s ON s.stock_id = sp.stock_id
             WHERE sp.prev_close IS NOT NULL AND sp.prev_close <> 0
               AND s.exchange = 'NSE'
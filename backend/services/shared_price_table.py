@@ -0,0 +1,302 @@
+"""
+Shared Price Table
+Memory-mapped, fixed-layout copy of the live price cache so every gunicorn
+worker sees the ingestion leader's prices without IPC round trips.
+
+The leader mirrors each live_price_cache write into the table (same slot
+numbers as LivePriceStore); other workers read it through the regular
+live_price_cache API (by stock_id, by symbol, get_day_ohlc and the
+all-prices snapshot) whenever their own in-process store has no entry.
+
+Layout (little-endian):
+    header  <4sIIIQ        magic, version, capacity, count, generation
+    slot    <IIq6d16s      seq, pad, stock_id, ltp, day_open, day_high,
+                           day_low, prev_close, updated_at, symbol (utf-8)
+
+Each slot is guarded by a seqlock: the writer makes seq odd, writes the
+fields, then makes it even again. Readers retry while seq is odd or changed
+during the read, so they never see a torn record and never take a lock.
+A new writer (or a cache clear) bumps generation so readers rebuild their
+stock_id -> slot and symbol -> slot indexes. Symbols are stored truncated to
+16 bytes and matched on that prefix.
+"""
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MMPT"
+VERSION = 1
+CAPACITY = int(os.getenv("SHARED_PRICE_TABLE_SLOTS", "4096"))
+_default_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+TABLE_PATH = os.getenv("SHARED_PRICE_TABLE", os.path.join(_default_dir, "mockmarket_prices.bin"))
+ENABLED = TABLE_PATH.lower() not in ("", "0", "off", "false", "none")
+
+_HEADER = struct.Struct("<4sIIIQ")
+_SLOT = struct.Struct("<IIq6d16s")
+_SEQ = struct.Struct("<I")
+_COUNT_OFFSET = 12  # header "count" field, updated in place
+_GENERATION = struct.Struct("<Q")
+_GENERATION_OFFSET = 16
+_READ_RETRIES = 50
+
+
+class SharedPrice(NamedTuple):
+    stock_id: int
+    ltp: float
+    day_open: float
+    day_high: float
+    day_low: float
+    prev_close: float
+    updated_at: float
+    symbol: str
+
+
+def _slot_offset(slot: int) -> int:
+    return _HEADER.size + slot * _SLOT.size
+
+
+def _file_size(capacity: int) -> int:
+    return _HEADER.size + capacity * _SLOT.size
+
+
+def _symbol_key(symbol: str) -> str:
+    """Upper-cased symbol as stored in a slot (utf-8, at most 16 bytes)."""
+    return symbol.upper().encode("utf-8")[:16].decode("utf-8", "ignore")
+
+
+class SharedPriceWriter:
+    """Single writer (the ingestion leader). Not thread-safe; callers serialize."""
+
+    def __init__(self, path: str = TABLE_PATH, capacity: int = CAPACITY):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Never shrink: readers may still map the old size (SIGBUS otherwise)
+            size = max(os.fstat(fd).st_size, _file_size(capacity))
+            os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+        self.capacity = (size - _HEADER.size) // _SLOT.size
+        self.overflow = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """Start a new generation: readers drop their slot index."""
+        # Millisecond clock so a restarted leader never reuses a generation,
+        # and always strictly increasing within this writer
+        previous = _GENERATION.unpack_from(self._mm, _GENERATION_OFFSET)[0]
+        generation = max(previous + 1, int(time.time() * 1000))
+        _HEADER.pack_into(self._mm, 0, MAGIC, VERSION, self.capacity, 0, generation)
+        self._count = 0
+
+    def write(self, slot: int, stock_id: int, symbol: str, ltp: float, day_open: float,
+              day_high: float, day_low: float, prev_close: float, updated_at: float) -> None:
+        if slot >= self.capacity:
+            self.overflow += 1
+            return
+        offset = _slot_offset(slot)
+        seq = _SEQ.unpack_from(self._mm, offset)[0]
+        _SEQ.pack_into(self._mm, offset, (seq + 1) & 0xFFFFFFFF)  # odd: write in progress
+        _SLOT.pack_into(
+            self._mm, offset, (seq + 1) & 0xFFFFFFFF, 0, stock_id, ltp, day_open, day_high,
+            day_low, prev_close, updated_at, symbol.encode("utf-8")[:16],
+        )
+        _SEQ.pack_into(self._mm, offset, (seq + 2) & 0xFFFFFFFF)
+        if slot >= self._count:
+            self._count = slot + 1
+            struct.pack_into("<I", self._mm, _COUNT_OFFSET, self._count)
+
+
+class SharedPriceReader:
+    """Lock-free reader used by every worker; attaches lazily once the file exists."""
+
+    def __init__(self, path: str = TABLE_PATH):
+        self._path = path
+        self._mm: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()  # guards the index rebuild only
+        self._index: Dict[int, int] = {}
+        self._by_symbol: Dict[str, int] = {}
+        self._indexed = 0
+        self._generation = None
+        self._next_attach = 0.0
+        self.stats = {"hits": 0, "misses": 0, "retries": 0, "reindexes": 0}
+
+    def _attach(self) -> bool:
+        if self._mm is not None:
+            return True
+        now = time.monotonic()
+        if now < self._next_attach:
+            return False
+        self._next_attach = now + 5.0  # the leader may not have created it yet
+        try:
+            with open(self._path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        if len(mm) < _HEADER.size or _HEADER.unpack_from(mm, 0)[0] != MAGIC:
+            mm.close()
+            return False
+        self._mm = mm
+        return True
+
+    def _read_slot(self, slot: int) -> Optional[SharedPrice]:
+        mm = self._mm
+        offset = _slot_offset(slot)
+        if offset + _SLOT.size > len(mm):
+            return None
+        for _ in range(_READ_RETRIES):
+            seq = _SEQ.unpack_from(mm, offset)[0]
+            if seq & 1:
+                self.stats["retries"] += 1
+                continue
+            rec = _SLOT.unpack_from(mm, offset)
+            if _SEQ.unpack_from(mm, offset)[0] == seq and rec[0] == seq:
+                return SharedPrice(rec[2], rec[3], rec[4], rec[5], rec[6], rec[7], rec[8],
+                                   rec[9].rstrip(b"\0").decode("utf-8", "ignore"))
+            self.stats["retries"] += 1
+        return None
+
+    def _refresh_index(self) -> None:
+        with self._lock:
+            _, _, capacity, count, generation = _HEADER.unpack_from(self._mm, 0)
+            if generation != self._generation:
+                self._index = {}
+                self._by_symbol = {}
+                self._indexed = 0
+                self._generation = generation
+            index = dict(self._index)
+            by_symbol = dict(self._by_symbol)
+            for slot in range(self._indexed, min(count, capacity)):
+                rec = self._read_slot(slot)
+                if rec is not None:
+                    index[rec.stock_id] = slot
+                    if rec.symbol:
+                        by_symbol[_symbol_key(rec.symbol)] = slot
+            # Swapped whole so lookups never see a partial dict
+            self._index = index
+            self._by_symbol = by_symbol
+            self._indexed = min(count, capacity)
+            self.stats["reindexes"] += 1
+
+    def _lookup(self, index_name: str, key, key_of: Callable[[SharedPrice], object]) -> Optional[SharedPrice]:
+        if not self._attach():
+            return None
+        if _GENERATION.unpack_from(self._mm, _GENERATION_OFFSET)[0] != self._generation:
+            self._refresh_index()
+        slot = getattr(self, index_name).get(key)
+        if slot is None:
+            self._refresh_index()
+            slot = getattr(self, index_name).get(key)
+        rec = self._read_slot(slot) if slot is not None else None
+        if rec is not None and key_of(rec) != key:
+            # New generation reused the slot; rebuild and try once more
+            self._refresh_index()
+            slot = getattr(self, index_name).get(key)
+            rec = self._read_slot(slot) if slot is not None else None
+            if rec is not None and key_of(rec) != key:
+                rec = None
+        self.stats["hits" if rec is not None else "misses"] += 1
+        return rec
+
+    def get(self, stock_id: int) -> Optional[SharedPrice]:
+        return self._lookup("_index", stock_id, lambda rec: rec.stock_id)
+
+    def get_by_symbol(self, symbol: str) -> Optional[SharedPrice]:
+        return self._lookup("_by_symbol", _symbol_key(symbol), lambda rec: _symbol_key(rec.symbol))
+
+    def read_all(self) -> List[SharedPrice]:
+        """Every published slot (torn or still-being-written slots are skipped)."""
+        if not self._attach():
+            return []
+        _, _, capacity, count, _ = _HEADER.unpack_from(self._mm, 0)
+        rows = []
+        for slot in range(min(count, capacity)):
+            rec = self._read_slot(slot)
+            if rec is not None:
+                rows.append(rec)
+        return rows
+
+
+_writer: Optional[SharedPriceWriter] = None
+_writer_generation = None
+_writer_lock = threading.Lock()
+_reader = SharedPriceReader()
+
+
+def _may_write() -> bool:
+    """Only the ingestion leader publishes the table."""
+    try:
+        from services.leader_election import is_leader
+        return is_leader()
+    except Exception:
+        return False
+
+
+def mirror_slots(slots) -> None:
+    """live_price_cache write listener: copy touched slots into the table."""
+    global _writer, _writer_generation
+    if not ENABLED or not _may_write():
+        return
+    from services.live_price_cache import get_price_store
+
+    store = get_price_store()
+    with _writer_lock:
+        if _writer is None:
+            try:
+                _writer = SharedPriceWriter()
+            except (OSError, ValueError) as e:
+                logger.error(f"[shared_price_table] cannot open {TABLE_PATH}: {e}")
+                return
+            _writer_generation = store.generation
+            slots = range(len(store))  # first write publishes the whole cache
+        elif _writer_generation != store.generation:
+            _writer.reset()
+            _writer_generation = store.generation
+            slots = range(len(store))
+        with store.lock:
+            for slot in slots:
+                if slot >= len(store):
+                    continue
+                _writer.write(
+                    slot, store.stock_ids[slot], store.symbols[slot], store.ltp[slot],
+                    store.day_open[slot], store.day_high[slot], store.day_low[slot],
+                    store.prev_close[slot], store.updated_at[slot],
+                )
+
+
+def read_shared_price(stock_id: int) -> Optional[SharedPrice]:
+    """Latest leader-published price for stock_id, or None."""
+    if not ENABLED:
+        return None
+    return _reader.get(stock_id)
+
+
+def read_shared_price_by_symbol(symbol: str) -> Optional[SharedPrice]:
+    """Latest leader-published price for symbol (case-insensitive), or None."""
+    if not ENABLED or not symbol:
+        return None
+    return _reader.get_by_symbol(symbol)
+
+
+def read_shared_prices() -> List[SharedPrice]:
+    """All leader-published prices (empty when the table is off or not created yet)."""
+    if not ENABLED:
+        return []
+    return _reader.read_all()
+
+
+def get_shared_table_stats() -> Dict:
+    return {
+        "enabled": ENABLED,
+        "path": TABLE_PATH,
+        "writer": _writer is not None,
+        "overflow": _writer.overflow if _writer is not None else 0,
+        **_reader.stats,
+    }
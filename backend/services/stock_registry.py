@@ -0,0 +1,197 @@
+"""
+Stocks Reference Registry
+Process-wide, read-mostly copy of the Stocks table, loaded with one query and
+indexed by stock_id, symbol, company_name and ISIN.
+
+Trades (get_stock_info), the stock detail/history endpoints, the price
+fetcher and the movers engine resolve stocks here instead of querying Stocks
+on every call; the table only changes when the instrument master is synced.
+
+Reloads happen when:
+- bump_stocks_version() is called (update_stocks_table does this after a sync)
+- a lookup misses and the last load is older than STOCK_REGISTRY_MISS_RELOAD_SECONDS
+  (a stock added by another process)
+- the snapshot is older than STOCK_REGISTRY_MAX_AGE_SECONDS
+
+Each load builds a new immutable snapshot and swaps it in, so lookups never
+take a lock or see a half-built index.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from db_pool import get_connection
+
+logger = logging.getLogger(__name__)
+
+MISS_RELOAD_SECONDS = float(os.getenv("STOCK_REGISTRY_MISS_RELOAD_SECONDS", "60"))
+MAX_AGE_SECONDS = float(os.getenv("STOCK_REGISTRY_MAX_AGE_SECONDS", "3600"))
+# After a failed load, wait this long before hitting the DB again
+_FAILED_LOAD_BACKOFF_SECONDS = 5.0
+
+
+class StockRef(NamedTuple):
+    stock_id: int
+    symbol: str
+    isin: Optional[str]
+    company_name: Optional[str]
+    exchange: Optional[str]
+
+
+class _Snapshot(NamedTuple):
+    version: int
+    loaded_at: float
+    stocks: Tuple[StockRef, ...]
+    by_id: Dict[int, StockRef]
+    by_symbol: Dict[str, StockRef]
+    by_company: Dict[str, StockRef]
+    by_isin: Dict[str, StockRef]
+
+
+def _build_snapshot(rows: Iterable[tuple], version: int) -> _Snapshot:
+    stocks = tuple(
+        StockRef(int(sid), symbol, isin, company_name, exchange)
+        for sid, symbol, isin, company_name, exchange in rows
+    )
+    by_id: Dict[int, StockRef] = {}
+    by_symbol: Dict[str, StockRef] = {}
+    by_company: Dict[str, StockRef] = {}
+    by_isin: Dict[str, StockRef] = {}
+    for ref in stocks:
+        by_id[ref.stock_id] = ref
+        if ref.symbol:
+            # Same first-row-wins behaviour as "WHERE symbol = %s LIMIT 1"
+            by_symbol.setdefault(ref.symbol.upper(), ref)
+        if ref.company_name:
+            # Case-insensitive like "WHERE company_name = %s" under MySQL's default collation
+            by_company.setdefault(ref.company_name.casefold(), ref)
+        if ref.isin:
+            by_isin.setdefault(ref.isin, ref)
+    return _Snapshot(version, time.monotonic(), stocks, by_id, by_symbol, by_company, by_isin)
+
+
+class StockRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()  # serializes loads only
+        self._snapshot: Optional[_Snapshot] = None
+        self._version = 0
+        self._last_attempt = 0.0
+        self._failed_at: Optional[float] = None
+        self.stats = {"loads": 0, "load_errors": 0, "hits": 0, "misses": 0}
+
+    def _load(self) -> None:
+        version = self._version  # a bump during the query forces another load
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT stock_id, symbol, isin, company_name, exchange FROM Stocks ORDER BY stock_id")
+            snapshot = _build_snapshot(cursor.fetchall(), version)
+        finally:
+            cursor.close()
+            conn.close()
+        self._snapshot = snapshot
+        self.stats["loads"] += 1
+        logger.info(f"[stock_registry] loaded {len(snapshot.stocks)} stocks (version {snapshot.version})")
+
+    def _reload(self, reason: str) -> Optional[_Snapshot]:
+        with self._lock:
+            current = self._snapshot
+            # Another thread may have reloaded while we waited for the lock
+            if current is not None and not self._needs_reload(current, reason):
+                return current
+            now = time.monotonic()
+            if self._failed_at is not None and now - self._failed_at < _FAILED_LOAD_BACKOFF_SECONDS:
+                return current
+            self._last_attempt = now
+            try:
+                self._load()
+                self._failed_at = None
+            except Exception as e:
+                self._failed_at = now
+                self.stats["load_errors"] += 1
+                logger.warning(f"[stock_registry] Stocks load failed ({reason}): {e}")
+            return self._snapshot
+
+    def _needs_reload(self, snapshot: _Snapshot, reason: str) -> bool:
+        now = time.monotonic()
+        if snapshot.version != self._version or now - snapshot.loaded_at > MAX_AGE_SECONDS:
+            return True
+        return reason == "miss" and now - self._last_attempt > MISS_RELOAD_SECONDS
+
+    def snapshot(self) -> Optional[_Snapshot]:
+        snapshot = self._snapshot
+        if snapshot is None or self._needs_reload(snapshot, "age"):
+            snapshot = self._reload("version" if snapshot is not None else "initial")
+        return snapshot
+
+    def _lookup(self, index: str, key) -> Optional[StockRef]:
+        if key is None:
+            return None
+        snapshot = self.snapshot()
+        ref = getattr(snapshot, index).get(key) if snapshot is not None else None
+        if ref is None and snapshot is not None and self._needs_reload(snapshot, "miss"):
+            snapshot = self._reload("miss")
+            ref = getattr(snapshot, index).get(key) if snapshot is not None else None
+        self.stats["hits" if ref is not None else "misses"] += 1
+        return ref
+
+    def by_id(self, stock_id: int) -> Optional[StockRef]:
+        return self._lookup("by_id", stock_id)
+
+    def by_symbol(self, symbol: str) -> Optional[StockRef]:
+        return self._lookup("by_symbol", symbol.upper() if symbol else None)
+
+    def by_company_name(self, company_name: str) -> Optional[StockRef]:
+        return self._lookup("by_company", company_name.casefold() if company_name else None)
+
+    def by_isin(self, isin: str) -> Optional[StockRef]:
+        return self._lookup("by_isin", isin)
+
+    def by_ids(self, stock_ids: Iterable[int]) -> Dict[int, StockRef]:
+        """stock_id -> StockRef for a batch; reloads (rate-limited) if any id is unknown."""
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return {}
+        if any(sid not in snapshot.by_id for sid in stock_ids) and self._needs_reload(snapshot, "miss"):
+            snapshot = self._reload("miss") or snapshot
+        return snapshot.by_id
+
+    def all(self, exchange: Optional[str] = None) -> List[StockRef]:
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return []
+        if exchange is None:
+            return list(snapshot.stocks)
+        return [ref for ref in snapshot.stocks if ref.exchange == exchange]
+
+    def bump_version(self) -> int:
+        """Mark the loaded snapshot stale; the next lookup reloads it."""
+        with self._lock:
+            self._version += 1
+            return self._version
+
+    def status(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            "version": self._version,
+            "stocks": len(snapshot.stocks) if snapshot is not None else 0,
+            "age_seconds": round(time.monotonic() - snapshot.loaded_at, 1) if snapshot is not None else None,
+            **self.stats,
+        }
+
+
+_registry = StockRegistry()
+
+
+def get_stock_registry() -> StockRegistry:
+    return _registry
+
+
+def bump_stocks_version() -> int:
+    return _registry.bump_version()
+
+
+def get_stock_registry_stats() -> Dict:
+    return _registry.status()
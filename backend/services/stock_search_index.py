@@ -0,0 +1,151 @@
+"""
+Stock Search Index
+In-memory typeahead index for GET /stocks/search, built from the Stocks
+registry (services/stock_registry.py) and rebuilt whenever the registry loads
+a new snapshot.
+
+Structures (all over upper-cased text):
+- symbols      sorted symbol array; a prefix is one bisect range, already in
+               symbol order (a flattened prefix trie)
+- names        sorted company-name array for company-name prefix matches
+- tokens       sorted (word, row) array over company-name words, for matches
+               at the start of any word ("BANK" -> "HDFC BANK LTD")
+- trigrams     trigram -> rows posting sets over symbol and company name, for
+               substring matches anywhere ("FOSYS" -> "INFOSYS")
+
+Ranking keeps the SQL match_priority order and extends it:
+    1 symbol == q, 2 symbol prefix, 3 company-name prefix,
+    4 company-name word prefix, 5 substring of symbol or company name
+ties broken by symbol. Queries of 1-2 characters match symbol prefixes only,
+like the SQL path did.
+"""
+import bisect
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.stock_registry import StockRef, get_stock_registry
+
+_HIGH = "\U0010FFFF"  # sorts after any real character: end of a prefix range
+
+
+def _prefix_range(keys: List[str], prefix: str) -> Tuple[int, int]:
+    return bisect.bisect_left(keys, prefix), bisect.bisect_left(keys, prefix + _HIGH)
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class _Index:
+    def __init__(self, stocks: Tuple[StockRef, ...]):
+        self.rows = [ref for ref in stocks if ref.symbol]
+        self.symbol_upper = [ref.symbol.upper() for ref in self.rows]
+        self.name_upper = [(ref.company_name or "").upper() for ref in self.rows]
+
+        by_symbol = sorted(range(len(self.rows)), key=lambda i: self.symbol_upper[i])
+        self.symbols = [self.symbol_upper[i] for i in by_symbol]
+        self.symbol_rows = by_symbol
+
+        by_name = sorted(range(len(self.rows)), key=lambda i: self.name_upper[i])
+        self.names = [self.name_upper[i] for i in by_name]
+        self.name_rows = by_name
+
+        tokens = sorted(
+            (word, i)
+            for i, name in enumerate(self.name_upper)
+            for word in set(name.replace(".", " ").replace("-", " ").replace("&", " ").split())
+        )
+        self.tokens = [word for word, _ in tokens]
+        self.token_rows = [i for _, i in tokens]
+
+        self.trigrams: Dict[str, Set[int]] = {}
+        for i in range(len(self.rows)):
+            for text in (self.symbol_upper[i], self.name_upper[i]):
+                for gram in _trigrams(text):
+                    self.trigrams.setdefault(gram, set()).add(i)
+
+    def _symbol_prefix(self, q: str) -> List[int]:
+        lo, hi = _prefix_range(self.symbols, q)
+        return self.symbol_rows[lo:hi]
+
+    def _substring(self, q: str) -> Set[int]:
+        grams = sorted(_trigrams(q), key=lambda g: len(self.trigrams.get(g, ())))
+        if not grams:
+            return set()
+        candidates = set(self.trigrams.get(grams[0], ()))
+        for gram in grams[1:]:
+            if not candidates:
+                break
+            candidates &= self.trigrams.get(gram, set())
+        return {i for i in candidates if q in self.symbol_upper[i] or q in self.name_upper[i]}
+
+    def search(self, query: str, limit: int) -> List[StockRef]:
+        q = query.upper()
+        if len(q) <= 2:
+            return [self.rows[i] for i in self._symbol_prefix(q)[:limit]]
+
+        priority: Dict[int, int] = {}
+
+        def add(rows, rank: int) -> None:
+            for i in rows:
+                if i not in priority:
+                    priority[i] = rank
+
+        symbol_prefix = self._symbol_prefix(q)
+        add((i for i in symbol_prefix if self.symbol_upper[i] == q), 1)
+        add(symbol_prefix, 2)
+        lo, hi = _prefix_range(self.names, q)
+        add(self.name_rows[lo:hi], 3)
+        lo, hi = _prefix_range(self.tokens, q)
+        add(self.token_rows[lo:hi], 4)
+        if len(priority) < limit:
+            add(self._substring(q), 5)
+
+        ranked = sorted(priority, key=lambda i: (priority[i], self.symbol_upper[i]))
+        return [self.rows[i] for i in ranked[:limit]]
+
+
+class StockSearchIndex:
+    """Rebuilds its _Index when the registry snapshot changes; lookups are lock-free."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index: Optional[_Index] = None
+        self._source = None
+        self.stats = {"builds": 0, "queries": 0}
+
+    def _current(self) -> Optional[_Index]:
+        snapshot = get_stock_registry().snapshot()
+        if snapshot is None:
+            return None
+        if snapshot is not self._source:
+            with self._lock:
+                if snapshot is not self._source:
+                    self._index = _Index(snapshot.stocks)
+                    self._source = snapshot
+                    self.stats["builds"] += 1
+        return self._index
+
+    def search(self, query: str, limit: int) -> Optional[List[StockRef]]:
+        """Ranked matches, or None when the Stocks registry could not be loaded."""
+        index = self._current()
+        if index is None:
+            return None
+        self.stats["queries"] += 1
+        return index.search(query, limit)
+
+
+_search_index = StockSearchIndex()
+
+
+def search_stocks(query: str, limit: int) -> Optional[List[StockRef]]:
+    return _search_index.search(query, limit)
+
+
+def get_search_index_stats() -> Dict:
+    index = _search_index._index
+    return {
+        **_search_index.stats,
+        "stocks": len(index.rows) if index is not None else 0,
+        "trigrams": len(index.trigrams) if index is not None else 0,
+    }
@@ -0,0 +1,132 @@
+"""
+Price Tick Bus
+Carries price batches from the ingestion process to every process that
+serves Socket.IO clients.
+
+Subscriptions, per-client diffs and the coalescing fan-out in
+services/websocket_manager.py are per process, so with several gunicorn
+workers each worker must see every tick and deliver it to its own clients.
+The ingestion side calls publish(); every worker registers a handler.
+
+Backends (PRICE_BUS_URL, falling back to SOCKETIO_MESSAGE_QUEUE):
+- local:// or unset  - in-process; publish() calls the handler directly
+  (single worker, tests)
+- redis://...        - Redis (or any RESP-compatible server) pub/sub
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# handler(updates, remote): remote is True when another process published them
+TickHandler = Callable[[List[Dict[str, Any]], bool], None]
+
+DEFAULT_CHANNEL = "mockmarket:prices"
+
+
+class LocalTickBus:
+    """In-process bus: publish() delivers synchronously to registered handlers."""
+
+    name = "local"
+
+    def __init__(self):
+        self._handlers: List[TickHandler] = []
+        self.stats = {"published": 0, "delivered": 0, "errors": 0}
+
+    def subscribe(self, handler: TickHandler) -> None:
+        if handler not in self._handlers:
+            self._handlers.append(handler)
+
+    def _deliver(self, updates: List[Dict[str, Any]], remote: bool) -> None:
+        for handler in self._handlers:
+            try:
+                handler(updates, remote)
+                self.stats["delivered"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"[tick_bus] handler failed: {e}")
+
+    def publish(self, updates: List[Dict[str, Any]]) -> None:
+        self.stats["published"] += 1
+        self._deliver(updates, remote=False)
+
+
+class RedisTickBus(LocalTickBus):
+    """Redis pub/sub bus. The publisher also receives its own messages through
+    Redis (so every worker takes the same path) but they are flagged local."""
+
+    name = "redis"
+
+    def __init__(self, url: str, channel: str = DEFAULT_CHANNEL):
+        super().__init__()
+        import redis  # Optional dependency, only needed for this backend
+
+        self._redis = redis.Redis.from_url(url)
+        self._channel = channel
+        self._origin = f"{os.getpid()}:{id(self)}"
+        self._listener: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, handler: TickHandler) -> None:
+        super().subscribe(handler)
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, daemon=True, name="TickBusListener")
+                self._listener.start()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._channel)
+                for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    envelope = json.loads(message["data"])
+                    self._deliver(envelope["updates"], remote=envelope.get("origin") != self._origin)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"[tick_bus] Redis listener error, reconnecting: {e}")
+                time.sleep(2)
+
+    def publish(self, updates: List[Dict[str, Any]]) -> None:
+        self.stats["published"] += 1
+        try:
+            self._redis.publish(self._channel, json.dumps({"origin": self._origin, "updates": updates}))
+        except Exception as e:
+            # Keep local clients live even if Redis is down
+            self.stats["errors"] += 1
+            logger.error(f"[tick_bus] Redis publish failed, delivering locally: {e}")
+            self._deliver(updates, remote=False)
+
+
+def _create_bus():
+    url = os.getenv("PRICE_BUS_URL") or os.getenv("SOCKETIO_MESSAGE_QUEUE") or "local://"
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            return RedisTickBus(url, os.getenv("PRICE_BUS_CHANNEL", DEFAULT_CHANNEL))
+        except Exception as e:
+            logger.error(f"[tick_bus] Redis bus unavailable ({e}); falling back to in-process bus")
+    return LocalTickBus()
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_tick_bus() -> LocalTickBus:
+    global _bus
+    if _bus is None:
+        with _bus_lock:
+            if _bus is None:
+                _bus = _create_bus()
+    return _bus
+
+
+def get_tick_bus_stats() -> Dict[str, Any]:
+    bus = get_tick_bus()
+    return {"backend": bus.name, **bus.stats}
@@ -1,11 +1,16 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Set
 import logging
+import threading
+import time
 
 from flask import Flask
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room
 from flask import request
 import os
 
+from services.price_codec import BinaryFeedSession, FRAME_VERSION, PRICE_SCALE
+from services.tick_bus import get_tick_bus
+
 logger = logging.getLogger(__name__)
 
 # Single SocketIO instance to be initialized in app.py
@@ -14,6 +19,293 @@ _async_mode = os.getenv("SOCKETIO_ASYNC_MODE", _default_async).lower()
 if _async_mode not in {"eventlet", "threading", "gevent"}:
     _async_mode = _default_async
 socketio: SocketIO = SocketIO(cors_allowed_origins="*", async_mode=_async_mode)
+# Optional Socket.IO message queue (e.g. redis://host:6379/0) so several
+# gunicorn workers can serve clients; price ticks travel on services/tick_bus.py
+_message_queue = os.getenv("SOCKETIO_MESSAGE_QUEUE") or None
+
+# Clients that have not sent 'subscribe' yet keep the legacy full 'prices_batch'
+# feed through this room; they leave it on their first subscribe and rejoin it
+# once they unsubscribe from their last symbol.
+ALL_PRICES_ROOM = "prices:all"
+# Per-client cap so one tab cannot subscribe to the whole universe
+MAX_SUBSCRIPTIONS = int(os.getenv("SOCKET_MAX_SUBSCRIPTIONS", "500"))
+# Price fan-out cadence; 0 emits synchronously on every broadcast_prices call
+FLUSH_INTERVAL_SECONDS = max(0.0, float(os.getenv("SOCKET_FLUSH_MS", "500")) / 1000.0)
+# A client whose engine.io outbound queue is at least this deep is skipped for
+# a flush; its pending map keeps only the newest tick per symbol meanwhile
+SLOW_CLIENT_QUEUE_DEPTH = int(os.getenv("SOCKET_SLOW_CLIENT_QUEUE", "16"))
+
+
+class _SubscriptionRegistry:
+    """sid <-> symbol subscriptions plus the last LTP sent to each client.
+
+    Lets broadcast_prices send each client one 'prices_diff' per batch holding
+    only its own symbols whose price changed since it was last sent.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_sid: Dict[str, Set[str]] = {}
+        self._by_symbol: Dict[str, Set[str]] = {}
+        self._last_sent: Dict[str, Dict[str, float]] = {}
+        # Clients that opted into the binary delta feed (services/price_codec.py)
+        self._binary: Dict[str, BinaryFeedSession] = {}
+
+    def subscribe(self, sid: str, symbols: List[str], binary: bool = False) -> List[str]:
+        """Add symbols for sid; returns the symbols newly added.
+
+        binary=True switches the client to the binary feed for good (a client
+        cannot go back to JSON within the same connection).
+        """
+        added = []
+        with self._lock:
+            current = self._by_sid.setdefault(sid, set())
+            self._last_sent.setdefault(sid, {})
+            if binary and sid not in self._binary:
+                self._binary[sid] = BinaryFeedSession()
+            for symbol in symbols:
+                if symbol in current or len(current) >= MAX_SUBSCRIPTIONS:
+                    continue
+                current.add(symbol)
+                self._by_symbol.setdefault(symbol, set()).add(sid)
+                added.append(symbol)
+        return added
+
+    def unsubscribe(self, sid: str, symbols: List[str]) -> List[str]:
+        removed = []
+        with self._lock:
+            current = self._by_sid.get(sid, set())
+            last = self._last_sent.get(sid, {})
+            for symbol in symbols:
+                if symbol not in current:
+                    continue
+                current.discard(symbol)
+                last.pop(symbol, None)
+                if sid in self._binary:
+                    self._binary[sid].forget(symbol)
+                subs = self._by_symbol.get(symbol)
+                if subs is not None:
+                    subs.discard(sid)
+                    if not subs:
+                        del self._by_symbol[symbol]
+                removed.append(symbol)
+        return removed
+
+    def drop(self, sid: str) -> None:
+        with self._lock:
+            for symbol in self._by_sid.pop(sid, set()):
+                subs = self._by_symbol.get(symbol)
+                if subs is not None:
+                    subs.discard(sid)
+                    if not subs:
+                        del self._by_symbol[symbol]
+            self._last_sent.pop(sid, None)
+            self._binary.pop(sid, None)
+
+    def register_binary(self, sid: str, symbols: List[str]) -> Optional[Dict[int, str]]:
+        """New {id: symbol} dictionary entries for a binary client, None for JSON clients."""
+        with self._lock:
+            session = self._binary.get(sid)
+            return session.register(symbols) if session is not None else None
+
+    def symbols_of(self, sid: str) -> List[str]:
+        with self._lock:
+            return sorted(self._by_sid.get(sid, ()))
+
+    def mark_sent(self, sid: str, items: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            last = self._last_sent.get(sid)
+            if last is None:
+                return
+            for item in items:
+                last[item["symbol"]] = item.get("ltp")
+
+    def encode_for(self, sid: str, items: List[Dict[str, Any]]) -> Any:
+        """Payload for one client: a binary frame (or None if nothing moved
+        in fixed point) for binary clients, the items themselves for JSON."""
+        with self._lock:
+            session = self._binary.get(sid)
+            return items if session is None else session.encode(items)
+
+    def is_binary(self, sid: str) -> bool:
+        with self._lock:
+            return sid in self._binary
+
+    def diff(self, updates: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Group changed updates per subscribed sid (and mark them as sent)."""
+        per_sid: Dict[str, List[Dict[str, Any]]] = {}
+        with self._lock:
+            if not self._by_symbol:
+                return per_sid
+            for u in updates:
+                symbol = (u.get("symbol") or "").upper()
+                sids = self._by_symbol.get(symbol)
+                if not sids:
+                    continue
+                ltp = u.get("ltp")
+                for sid in sids:
+                    last = self._last_sent[sid]
+                    if last.get(symbol) == ltp:
+                        continue
+                    last[symbol] = ltp
+                    per_sid.setdefault(sid, []).append(u)
+        return per_sid
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "clients": len(self._by_sid),
+                "symbols": len(self._by_symbol),
+                "subscriptions": sum(len(s) for s in self._by_sid.values()),
+                "binary_clients": len(self._binary),
+            }
+
+
+_subscriptions = _SubscriptionRegistry()
+
+
+def get_subscription_stats() -> Dict[str, int]:
+    return _subscriptions.stats()
+
+
+def _emit_local(event: str, data: Any, **kwargs) -> None:
+    """Emit to clients of this process only.
+
+    Every worker receives each tick from the tick bus and fans it out to its
+    own clients, so price emits must not be re-broadcast via the message queue.
+    """
+    if _message_queue:
+        kwargs["ignore_queue"] = True
+    socketio.emit(event, data, **kwargs)
+
+
+def _outbound_depth(sid: str) -> int:
+    """Packets queued in engine.io for this client (0 if not introspectable)."""
+    try:
+        server = socketio.server
+        eio_sid = server.manager.eio_sid_from_sid(sid, "/")
+        sock = server.eio.sockets.get(eio_sid)
+        return sock.queue.qsize() if sock is not None else 0
+    except Exception:
+        return 0
+
+
+class _TickFanOut:
+    """Coalesces price updates per client and flushes them on a fixed cadence.
+
+    Each fetch batch used to be emitted on arrival (~20 emissions per sweep).
+    Updates now land in a per-client pending map keyed by symbol (last write
+    wins) and a flusher thread sends each client at most one message per
+    FLUSH_INTERVAL_SECONDS. Slow consumers are skipped rather than buffered,
+    so their superseded ticks are dropped instead of piling up.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._pending_all: Dict[str, Dict[str, Any]] = {}  # legacy prices_batch room
+        self._clients: Dict[str, Dict[str, int]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"flushes": 0, "messages": 0, "coalesced_ticks": 0, "deferred_flushes": 0}
+
+    def _client(self, sid: str) -> Dict[str, int]:
+        stats = self._clients.get(sid)
+        if stats is None:
+            stats = self._clients[sid] = {
+                "pending": 0, "outbound_queue": 0, "max_pending": 0,
+                "dropped_ticks": 0, "deferred_flushes": 0, "messages": 0,
+            }
+        return stats
+
+    def enqueue(self, updates: List[Dict[str, Any]]) -> None:
+        per_sid = _subscriptions.diff(updates)
+        with self._lock:
+            for u in updates:
+                symbol = (u.get("symbol") or "").upper()
+                if symbol in self._pending_all:
+                    self.stats["coalesced_ticks"] += 1
+                self._pending_all[symbol] = u
+            for sid, items in per_sid.items():
+                pending = self._pending.setdefault(sid, {})
+                stats = self._client(sid)
+                for u in items:
+                    symbol = u["symbol"].upper()
+                    if symbol in pending:
+                        stats["dropped_ticks"] += 1
+                        self.stats["coalesced_ticks"] += 1
+                    pending[symbol] = u
+                stats["pending"] = len(pending)
+                stats["max_pending"] = max(stats["max_pending"], len(pending))
+        self._ensure_started()
+
+    def _ensure_started(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True, name="SocketPriceFanOut")
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"[broadcast_prices] Flush failed: {e}")
+
+    def flush(self) -> None:
+        ready: Dict[str, List[Dict[str, Any]]] = {}
+        with self._lock:
+            batch_all = list(self._pending_all.values())
+            self._pending_all = {}
+            for sid in list(self._pending):
+                stats = self._client(sid)
+                depth = _outbound_depth(sid)
+                stats["outbound_queue"] = depth
+                if depth >= SLOW_CLIENT_QUEUE_DEPTH:
+                    stats["deferred_flushes"] += 1
+                    self.stats["deferred_flushes"] += 1
+                    continue
+                ready[sid] = list(self._pending.pop(sid).values())
+                stats["pending"] = 0
+                stats["messages"] += 1
+            self.stats["flushes"] += 1
+            self.stats["messages"] += len(ready) + (1 if batch_all else 0)
+        for sid, items in ready.items():
+            _emit_to_client(sid, items)
+        if batch_all:
+            _emit_local("prices_batch", batch_all, room=ALL_PRICES_ROOM)
+
+    def drop(self, sid: str) -> None:
+        with self._lock:
+            self._pending.pop(sid, None)
+            self._clients.pop(sid, None)
+
+    def snapshot(self, top: int = 20) -> Dict[str, Any]:
+        """Aggregate counters plus the deepest per-client queues."""
+        with self._lock:
+            clients = sorted(
+                self._clients.items(),
+                key=lambda kv: (kv[1]["outbound_queue"], kv[1]["pending"]),
+                reverse=True,
+            )
+            return {
+                **self.stats,
+                "interval_ms": int(self.interval * 1000),
+                "pending_clients": len(self._pending),
+                "clients": {sid: dict(stats) for sid, stats in clients[:top]},
+            }
+
+
+_fanout = _TickFanOut(FLUSH_INTERVAL_SECONDS)
+
+
+def get_fanout_stats() -> Dict[str, Any]:
+    """Per-client pending/outbound queue depth and drop counters (for /metrics)."""
+    return _fanout.snapshot()
 
 
 def init_socketio(app: Flask) -> None:
@@ -21,44 +313,132 @@ def init_socketio(app: Flask) -> None:
     # Toggle verbose socket logging via env (default: off for performance)
     debug_socket = os.getenv("DEBUG_SOCKET", "false").lower() in ("1", "true", "yes", "on")
 
+    options = {}
+    if _message_queue:
+        options["message_queue"] = _message_queue
+
     socketio.init_app(
         app,
         cors_allowed_origins="*",
         async_mode=_async_mode,
         logger=debug_socket,
         engineio_logger=debug_socket,
+        **options,
+    )
+    # Every process serving clients fans out the ticks it receives on the bus
+    bus = get_tick_bus()
+    bus.subscribe(_deliver_ticks)
+    logger.info(
+        f"SocketIO initialized with {_async_mode} async_mode "
+        f"(message_queue={'on' if _message_queue else 'off'}, tick bus={bus.name})"
     )
-    logger.info(f"SocketIO initialized with {_async_mode} async_mode")
 
 def broadcast_prices(updates: List[Dict[str, Any]]) -> None:
     """Broadcast a batch of price updates to subscribers.
 
     Each update should include at least: { symbol, ltp, as_of }
+    Published on the tick bus so every worker process delivers the batch to
+    its own clients (directly in-process when no bus URL is configured).
+    Updates are coalesced per client and flushed every FLUSH_INTERVAL_SECONDS
+    (see _TickFanOut); with SOCKET_FLUSH_MS=0 they are emitted immediately.
     Emits two channels:
-      - 'prices_batch' with the full list
-      - 'price_update' per-symbol room: room=f"symbol:{symbol}"
+      - 'prices_diff' to each subscribed client: only its symbols whose LTP
+        changed since it was last sent (one message per client per batch);
+        'prices_bin' (delta-encoded frame) instead for binary-feed clients
+      - 'prices_batch' with the full list, only to clients that never sent
+        'subscribe' or have unsubscribed from every symbol (ALL_PRICES_ROOM)
     """
-    if not updates or not socketio:
+    if not updates:
         return
     try:
-        logger.debug(f"[broadcast_prices] Emitting {len(updates)} price updates to clients")
-        socketio.emit("prices_batch", updates)
-        for u in updates:
-            symbol = u.get("symbol")
-            if not symbol:
-                continue
-            socketio.emit("price_update", u, room=f"symbol:{symbol}")
-        logger.debug(f"[broadcast_prices] Successfully broadcasted {len(updates)} prices")
+        get_tick_bus().publish(updates)
     except Exception as e:
         # Emitting is best-effort; avoid breaking the fetcher
+        logger.error(f"[broadcast_prices] Error publishing: {e}")
+
+
+def _deliver_ticks(updates: List[Dict[str, Any]], remote: bool) -> None:
+    """Tick bus handler: fan a batch out to this process's clients."""
+    if remote:
+        # Published by the ingestion process; keep this worker's cache in step
+        try:
+            from services.live_price_cache import update_price_cache_batch
+            update_price_cache_batch(updates)
+        except Exception as e:
+            logger.debug(f"[broadcast_prices] live cache update failed: {e}")
+    try:
+        if FLUSH_INTERVAL_SECONDS > 0:
+            _fanout.enqueue(updates)
+            return
+        per_sid = _subscriptions.diff(updates)
+        for sid, items in per_sid.items():
+            _emit_to_client(sid, items)
+        _emit_local("prices_batch", updates, room=ALL_PRICES_ROOM)
+        logger.debug(f"[broadcast_prices] {len(updates)} updates, diffs to {len(per_sid)} subscribed clients")
+    except Exception as e:
         logger.error(f"[broadcast_prices] Error broadcasting: {e}")
 
 
+def _emit_to_client(sid: str, items: List[Dict[str, Any]]) -> None:
+    # Per-client guard: one session failing to encode must not abort the
+    # fan-out flush for every other client
+    try:
+        payload = _subscriptions.encode_for(sid, items)
+    except Exception as e:
+        logger.warning(f"[SocketIO] encode failed for {sid}, skipping its update: {e}")
+        return
+    if payload is None:
+        return
+    if isinstance(payload, bytes):
+        _emit_local("prices_bin", payload, to=sid)
+    else:
+        _emit_local("prices_diff", payload, to=sid)
+
+
+def emit_history_ready(symbol: str, payload: Dict[str, Any]) -> None:
+    """Tell clients watching `symbol` that new history candles were stored.
+
+    Sent to the symbol's room (clients that subscribed to it) through the
+    message queue when one is configured, since the gap fill runs in whichever
+    worker served the history request.
+    """
+    try:
+        socketio.emit("history_ready", payload, room=f"symbol:{symbol.upper()}")
+    except Exception as e:
+        logger.debug(f"[SocketIO] history_ready emit failed for {symbol}: {e}")
+
+
+def _normalize_symbols(payload: Any) -> List[str]:
+    """Accept ['TCS', ...], {'symbols': [...]} or a single 'TCS'."""
+    if isinstance(payload, dict):
+        payload = payload.get("symbols")
+    if isinstance(payload, str):
+        payload = [payload]
+    if not isinstance(payload, (list, tuple)):
+        return []
+    return [s.strip().upper() for s in payload if isinstance(s, str) and s.strip()]
+
+
+def _known_symbols(symbols: List[str]) -> List[str]:
+    """Keep only symbols in the Stocks table, so a client cannot register
+    arbitrary strings. Passes everything through while the registry is unavailable."""
+    try:
+        from services.stock_registry import get_stock_registry
+        registry = get_stock_registry()
+        if registry.snapshot() is None:
+            return symbols
+        return [s for s in symbols if registry.by_symbol(s) is not None]
+    except Exception as e:
+        logger.debug(f"[SocketIO] symbol validation skipped: {e}")
+        return symbols
+
+
 # Basic connect/disconnect logs for debugging connection lifecycle
 @socketio.on("connect")
 def _on_connect():
     try:
         sid = getattr(request, 'sid', None)
+        join_room(ALL_PRICES_ROOM)
         logger.info(f"[SocketIO] Client connected: {sid}")
     except Exception:
         logger.info("[SocketIO] Client connected")
@@ -68,6 +448,64 @@ def _on_connect():
 def _on_disconnect():
     try:
         sid = getattr(request, 'sid', None)
+        _subscriptions.drop(sid)
+        _fanout.drop(sid)
         logger.info(f"[SocketIO] Client disconnected: {sid}")
     except Exception:
         logger.info("[SocketIO] Client disconnected")
+
+
+@socketio.on("subscribe")
+def _on_subscribe(payload=None):
+    """Subscribe to per-symbol diffs. Replies (ack) with the full subscription list.
+
+    Payload: ['TCS', ...] or {"symbols": [...], "format": "json" | "binary"}.
+    Symbols not in the Stocks table are ignored and listed in the ack as
+    "unknown". Binary clients get 'prices_dict' with ids for new symbols (also
+    in the ack) before any 'prices_bin' frame that uses them.
+    Newly added symbols are sent immediately from the live price cache, in
+    the same row shape as the diffs, so the client does not wait for the next
+    tick. A subscribing client leaves the all-prices room until it has no
+    symbols left (see unsubscribe).
+    """
+    sid = request.sid
+    requested = _normalize_symbols(payload)
+    symbols = _known_symbols(requested)
+    binary = isinstance(payload, dict) and str(payload.get("format", "")).lower() == "binary"
+    leave_room(ALL_PRICES_ROOM)
+    added = _subscriptions.subscribe(sid, symbols, binary=binary)
+    # Rooms mirror the registry so other emitters can target a symbol's audience
+    for symbol in added:
+        join_room(f"symbol:{symbol}")
+    ack: Dict[str, Any] = {}
+    if len(symbols) != len(requested):
+        known = set(symbols)
+        ack["unknown"] = [s for s in requested if s not in known]
+    new_ids = _subscriptions.register_binary(sid, added)
+    if new_ids is not None:
+        ack["dictionary"] = {"version": FRAME_VERSION, "scale": PRICE_SCALE, "symbols": new_ids}
+        if new_ids:
+            _emit_local("prices_dict", ack["dictionary"], to=sid)
+    if added:
+        try:
+            from services.live_price_cache import get_cached_updates_by_symbols
+            snapshot = get_cached_updates_by_symbols(added)
+            if snapshot:
+                _subscriptions.mark_sent(sid, snapshot)
+                _emit_to_client(sid, snapshot)
+        except Exception as e:
+            logger.debug(f"[SocketIO] subscribe snapshot failed: {e}")
+    ack["subscribed"] = _subscriptions.symbols_of(sid)
+    return ack
+
+
+@socketio.on("unsubscribe")
+def _on_unsubscribe(payload=None):
+    sid = request.sid
+    for symbol in _subscriptions.unsubscribe(sid, _normalize_symbols(payload)):
+        leave_room(f"symbol:{symbol}")
+    subscribed = _subscriptions.symbols_of(sid)
+    if not subscribed:
+        # Back to the full 'prices' broadcast, as on connect
+        join_room(ALL_PRICES_ROOM)
+    return {"subscribed": subscribed}
@@ -13,6 +13,7 @@ import {
 } from "lightweight-charts";
 import useSWR from "swr";
 import { fetchStockHistory, type Candle } from "@/services/api/stockHistoryApi";
+import { useHistoryReady } from "@/hooks/useHistoryReady";
 import styles from "./StockChart.module.css";
 import { useTheme } from "@/components/contexts/ThemeProvider";
 
@@ -69,6 +70,9 @@ export default function ModernStockChart({ symbol, currentPrice }: Props) {
     refreshInterval: interval === "1D" ? 10000 : 0,
   });
 
+  // Refetch once candles missing from the DB have been filled in the background
+  useHistoryReady(symbol, () => mutate());
+
   // Initialize chart (runs once on mount)
   useEffect(() => {
     if (!chartContainerRef.current) return;
@@ -13,6 +13,7 @@ import {
   CartesianGrid,
 } from "recharts";
 import { fetchStockHistory, type Candle } from "@/services/api/stockHistoryApi";
+import { useHistoryReady } from "@/hooks/useHistoryReady";
 import styles from "./StockChart.module.css"; // Import the CSS module
 import { useTheme } from "@/components/contexts/ThemeProvider"; // Import useTheme
 
@@ -52,7 +53,7 @@ export default function StockChart({ symbol }: { symbol: string }) {
   const { theme } = useTheme();
   const { backend, limit } = INTERVAL_MAP[interval];
 
-  const { data, isLoading, error } = useSWR<Candle[]>(
+  const { data, isLoading, error, mutate } = useSWR<Candle[]>(
     `${symbol.toUpperCase()}|${backend}|${limit}`,
     fetcher,
     {
@@ -60,6 +61,9 @@ export default function StockChart({ symbol }: { symbol: string }) {
     }
   );
 
+  // Refetch once candles missing from the DB have been filled in the background
+  useHistoryReady(symbol, () => mutate());
+
   const chartData = (data || []).map((d) => ({
     time: d.time,
     close: d.close,
@@ -0,0 +1,33 @@
+"use client";
+
+import { useEffect, useRef } from "react";
+import { getSocket, subscribeSymbols, unsubscribeSymbols } from "@/lib/socketClient";
+
+export type HistoryReady = { symbol: string; from: string; to: string; count: number };
+
+// Calls onReady when the backend has stored candles fetched in the background
+// for `symbol` (a /stocks/history response with `stale: true` is followed by
+// one 'history_ready' event). The server sends it to the symbol's room, so the
+// symbol is kept subscribed while this hook is mounted.
+export function useHistoryReady(
+  symbol: string,
+  onReady: (event: HistoryReady) => void
+) {
+  const callback = useRef(onReady);
+  callback.current = onReady;
+  const sym = symbol.toUpperCase();
+
+  useEffect(() => {
+    if (!sym) return;
+    const socket = getSocket();
+    const onEvent = (event: HistoryReady) => {
+      if ((event?.symbol || "").toUpperCase() === sym) callback.current(event);
+    };
+    socket.on("history_ready", onEvent);
+    subscribeSymbols([sym]);
+    return () => {
+      socket.off("history_ready", onEvent);
+      unsubscribeSymbols([sym]);
+    };
+  }, [sym]);
+}
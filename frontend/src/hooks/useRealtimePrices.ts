@@ -1,7 +1,7 @@
 "use client";
 
 import { useEffect, useMemo, useRef, useState } from "react";
-import { getSocket } from "@/lib/socketClient";
+import { getSocket, subscribeSymbols, unsubscribeSymbols } from "@/lib/socketClient";
 
 export type LivePrice = { symbol: string; ltp: number; as_of?: string };
 
@@ -56,11 +56,18 @@ export function useRealtimePrices(symbols: string[]) {
       });
     };
 
+    // Server sends only subscribed symbols, and only when their price changed
+    // (an empty list still means "every symbol" via the full prices_batch feed)
+    const symbolList = symbolsKey ? symbolsKey.split(",") : [];
+    const channel = symbolList.length > 0 ? "prices_diff" : "prices_batch";
+
     console.log(`[useRealtimePrices] Subscribing to prices for: ${symbolsKey}`);
-    socket.on("prices_batch", onBatch);
+    socket.on(channel, onBatch);
+    subscribeSymbols(symbolList);
     return () => {
       isMounted.current = false;
-      socket.off("prices_batch", onBatch);
+      socket.off(channel, onBatch);
+      unsubscribeSymbols(symbolList);
       console.log(
         `[useRealtimePrices] Unsubscribed from prices for: ${symbolsKey}`
       );
@@ -40,6 +40,9 @@ export function getSocket(): Socket {
   socket.on("connect", () => {
     initializing = false;
     console.log("[socket] connected", socket?.id);
+    // Server-side subscriptions are per connection; restore them
+    const symbols = Array.from(symbolRefs.keys());
+    if (symbols.length > 0) socket?.emit("subscribe", { symbols });
   });
   socket.on("disconnect", (reason) => {
     console.log("[socket] disconnected", reason);
@@ -52,3 +55,31 @@ export function getSocket(): Socket {
 
   return socket;
 }
+
+// Reference counts so several components can watch the same symbol and only
+// the last one to unmount unsubscribes it on the server.
+const symbolRefs = new Map<string, number>();
+
+export function subscribeSymbols(symbols: string[]): void {
+  const added: string[] = [];
+  for (const sym of symbols) {
+    const count = symbolRefs.get(sym) ?? 0;
+    symbolRefs.set(sym, count + 1);
+    if (count === 0) added.push(sym);
+  }
+  const s = getSocket();
+  if (added.length > 0 && s.connected) s.emit("subscribe", { symbols: added });
+}
+
+export function unsubscribeSymbols(symbols: string[]): void {
+  const removed: string[] = [];
+  for (const sym of symbols) {
+    const count = symbolRefs.get(sym) ?? 0;
+    if (count <= 1) {
+      if (symbolRefs.delete(sym)) removed.push(sym);
+    } else {
+      symbolRefs.set(sym, count - 1);
+    }
+  }
+  if (removed.length > 0 && socket?.connected) socket.emit("unsubscribe", { symbols: removed });
+}
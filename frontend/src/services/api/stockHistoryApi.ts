@@ -31,6 +31,9 @@ export async function fetchStockHistory(
       data: Candle[];
       count?: number;
       message?: string;
+      // true while the backend fills missing candles in the background;
+      // charts refetch on the 'history_ready' socket event (useHistoryReady)
+      stale?: boolean;
     };
 
     if (payload.status !== "success") {